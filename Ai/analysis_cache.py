@@ -0,0 +1,132 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 캐시 디렉터리와 최대 크기(바이트)
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", "./analysis_cache")
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+HASH_CHUNK_SIZE = 1024 * 1024
+# 분석용 오디오 형식: vod.py가 업로드에서 뽑는 16kHz 모노 Opus (음성 인식/VAD에는 24kbps로 충분합니다).
+# VAD/STT 결과가 이 형식에 따라 달라지므로 speed/whisper 단계의 캐시 키에 포함합니다.
+ANALYSIS_AUDIO_BITRATE = os.getenv("ANALYSIS_AUDIO_BITRATE", "24k")
+ANALYSIS_AUDIO_FORMAT = {"codec": "libopus", "sample_rate": 16000, "channels": 1, "bitrate": ANALYSIS_AUDIO_BITRATE}
+
+def file_sha256(path: str) -> str:
+    """파일 내용을 청크 단위로 읽어 SHA-256 해시를 계산합니다."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def fileobj_sha256(file) -> str:
+    """파일 객체의 SHA-256 해시를 계산하고 읽기 위치를 처음으로 되돌립니다."""
+    hasher = hashlib.sha256()
+    file.seek(0)
+    while chunk := file.read(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+class AnalysisCache:
+    """
+    단계별 분석 결과를 (단계, 콘텐츠 해시, 단계 파라미터)를 키로 디스크에 JSON으로 저장합니다.
+    전체 크기가 max_bytes를 넘으면 가장 오래 사용하지 않은 항목부터 지웁니다(LRU).
+    여러 워커 프로세스가 같은 디렉터리를 함께 쓰므로 항목 목록과 크기는 메모리에 두지 않고,
+    마지막 사용 시각(mtime)과 크기를 지울 때마다 디스크에서 다시 읽습니다.
+    """
+    def __init__(self, directory=ANALYSIS_CACHE_DIR, max_bytes=ANALYSIS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _scan(self) -> list:
+        """디스크의 항목을 (마지막 사용 시각, 키, 크기) 목록으로, 오래 사용하지 않은 순서로 반환합니다."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, entry.name[:-len(".json")], stat.st_size))
+        return sorted(files)
+
+    @staticmethod
+    def make_key(stage: str, content_hash: str, params: dict) -> str:
+        raw = json.dumps([stage, content_hash, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _count(self, stage: str, name: str):
+        with self.lock:
+            counter = self.counters.setdefault(stage, {"hits": 0, "misses": 0})
+            counter[name] += 1
+
+    def contains(self, stage: str, content_hash: str, params: dict) -> bool:
+        return os.path.exists(self._path(self.make_key(stage, content_hash, params)))
+
+    def get(self, stage: str, content_hash: str, params: dict):
+        """캐시된 값을 반환합니다. 없으면 None."""
+        path = self._path(self.make_key(stage, content_hash, params))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            # 없거나, 다른 프로세스가 지웠거나, 손상된 항목은 없는 것으로 취급합니다.
+            self._count(stage, "misses")
+            return None
+        self._count(stage, "hits")
+        logger.info(f"Analysis cache hit: stage={stage}, hash={content_hash[:12]}")
+        return value
+
+    def put(self, stage: str, content_hash: str, params: dict, value):
+        path = self._path(self.make_key(stage, content_hash, params))
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        # 다른 워커가 쓴 항목까지 포함해 디스크 기준으로 크기를 계산합니다.
+        # 두 워커가 동시에 지우면 한도보다 조금 더 지울 수 있지만 한도를 넘지는 않습니다.
+        files = self._scan()
+        total_bytes = sum(size for _, _, size in files)
+        for _, key, size in files:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        files = self._scan()
+        with self.lock:
+            return {
+                "entries": len(files),
+                "bytes": sum(size for _, _, size in files),
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "stages": {stage: dict(counter) for stage, counter in self.counters.items()},
+            }
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,1038 @@
+"""
+성능 개선 전후를 비교하는 벤치마크 스크립트입니다. 외부 API나 미디어 파일 없이 합성 데이터로 실행됩니다.
+
+사용법:
+    python benchmarks.py checks   (ffmpeg 필요, 결과 일치/호출 마감/연결 끊김 확인 항목 전체, 하나라도 실패하면 종료 코드 1)
+    python benchmarks.py speed-loudness --minutes 60 --segments 20000
+    python benchmarks.py speed-vad-memory --minutes 30   (ffmpeg 필요)
+    python benchmarks.py diff-engine --minutes 1 10 30 60   (회귀 코퍼스의 diff_count가 기존과 다르면 종료 코드 1)
+    python benchmarks.py whisper-chunks --minutes 60 --chunk-seconds 600   (ffmpeg 필요, 로컬 가짜 변환 서버 사용)
+    python benchmarks.py whisper-stitch   (ffmpeg 필요, 로컬 가짜 변환 서버로 청크 분할/이어 붙이기 결과 확인, 실패하면 종료 코드 1)
+    python benchmarks.py analysis-audio --audio talk.webm   (ffmpeg 필요)
+    python benchmarks.py face-prefilter --labelled-dir frames/   (opencv 필요, frames/face, frames/noface 하위 폴더)
+    python benchmarks.py emotion-mosaic --frames-dir frames/ --sizes 4 9 16   (AWS Rekognition 호출, 비용 발생)
+    python benchmarks.py emotion-deadline   (가짜 Rekognition 클라이언트로 호출 마감 확인, 실패하면 종료 코드 1)
+    python benchmarks.py token-budget --durations 3 5 10 --samples 3   (OpenAI API 호출)
+    python benchmarks.py token-budget --scripts scripts/   (저장된 생성 스크립트로 보정값 측정, tiktoken 권장)
+    python benchmarks.py script-stream-disconnect   (로컬 가짜 OpenAI 서버 사용, 실패하면 종료 코드 1)
+    python benchmarks.py startup --repeat 5   (end:app 지연 로딩 vs 즉시 import, AWS/OpenAI 키 환경 변수 필요)
+    python benchmarks.py stt-backends --audio talk.mp3 --script script.txt --backends openai local   (faster-whisper 필요)
+"""
+import os
+import re
+import json
+import time
+import wave
+import asyncio
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+def check(label: str, actual, expected) -> bool:
+    """확인 항목 하나의 결과를 출력하고, 다르면 기대값과 실제값을 함께 출력합니다."""
+    ok = actual == expected
+    print(f"{label}: {'ok' if ok else 'MISMATCH'}")
+    if not ok:
+        print(f"  expected: {expected}\n  actual  : {actual}")
+    return ok
+
+def exit_on_failure(failures: int):
+    if failures:
+        raise SystemExit(1)
+
+def synthetic_pcm(minutes: float, sample_rate: int = 16000, seed: int = 0) -> np.ndarray:
+    """말소리 구간(잡음)과 무음이 번갈아 나오는 16비트 모노 PCM을 만듭니다."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * sample_rate)
+    samples = np.zeros(total, dtype=np.int16)
+    position = 0
+    while position < total:
+        voiced = int(rng.uniform(0.3, 4.0) * sample_rate)
+        silent = int(rng.uniform(0.1, 1.0) * sample_rate)
+        amplitude = rng.uniform(500, 12000)
+        end = min(total, position + voiced)
+        samples[position:end] = (rng.standard_normal(end - position) * amplitude).clip(-32768, 32767)
+        position = end + silent
+    return samples
+
+def synthetic_segments(samples: np.ndarray, count: int, sample_rate: int = 16000, seed: int = 0):
+    """
+    30ms 프레임 경계에 맞춘 임의의 세그먼트를 speed.Frame 리스트 형태로 만듭니다.
+    세그먼트마다 서로 다른 프레임 경계 2개가 필요하므로 count는 전체 프레임 수의 절반으로 제한됩니다.
+    """
+    from speed import Frame
+    rng = np.random.default_rng(seed)
+    frame_duration = 0.03
+    total_frames = int(len(samples) / sample_rate / frame_duration)
+    count = min(count, total_frames // 2)
+    bounds = np.sort(rng.choice(total_frames, size=count * 2, replace=False))
+    segments = []
+    for start, end in bounds.reshape(-1, 2):
+        segments.append([Frame(b"", i * frame_duration, frame_duration) for i in range(start, end + 1)])
+    return segments
+
+async def legacy_segment_results(segments_frames, audio, thread_pool):
+    """개선 전 방식: 세그먼트마다 pydub으로 잘라 dBFS를 스레드 풀에서 계산합니다."""
+    from speed import get_speech_rate
+
+    async def process(segment_frames, index):
+        start_time = segment_frames[0].timestamp
+        end_time = segment_frames[-1].timestamp + segment_frames[-1].duration
+        duration = end_time - start_time
+        segment_audio = audio[int(start_time * 1000):int(end_time * 1000)]
+        volume = await asyncio.get_event_loop().run_in_executor(thread_pool, lambda: segment_audio.dBFS)
+        return {
+            "segment": index,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration": duration,
+            "volume": volume,
+            "rate": get_speech_rate(duration)
+        }
+
+    results = await asyncio.gather(*[process(f, i) for i, f in enumerate(segments_frames, 1)])
+    return sorted(results, key=lambda r: r["start_time"])
+
+def legacy_merge(results):
+    """개선 전 방식의 짧은 세그먼트 병합 (dict를 하나씩 순회)."""
+    from speed import get_speech_rate
+    merged_results = []
+    i = 0
+    while i < len(results):
+        current = results[i]
+        if current["duration"] < 1.0:
+            if i < len(results) - 1:
+                next_seg = results[i + 1]
+                new_duration = next_seg["end_time"] - current["start_time"]
+                total_dur = current["duration"] + next_seg["duration"]
+                merged_results.append({
+                    "segment": f"{current['segment']}-{next_seg['segment']}",
+                    "start_time": current["start_time"],
+                    "end_time": next_seg["end_time"],
+                    "duration": new_duration,
+                    "volume": (current["volume"] * current["duration"] +
+                               next_seg["volume"] * next_seg["duration"]) / total_dur,
+                    "rate": get_speech_rate(new_duration)
+                })
+                i += 2
+            else:
+                i += 1
+        else:
+            merged_results.append(current)
+            i += 1
+    return merged_results
+
+def bench_speed_loudness(args):
+    from pydub import AudioSegment
+    from speed import summarize_segments, merge_short_segments
+
+    sample_rate = 16000
+    samples = synthetic_pcm(args.minutes, sample_rate)
+    # 기본값은 60분에 20000개 비율 (분당 약 333개)
+    segment_count = args.segments if args.segments is not None else int(args.minutes * 20000 / 60)
+    segments_frames = synthetic_segments(samples, segment_count, sample_rate)
+    audio = AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=sample_rate, channels=1)
+    print(f"audio: {args.minutes} min, segments: {len(segments_frames)}")
+
+    with ThreadPoolExecutor(max_workers=4) as thread_pool:
+        started = time.perf_counter()
+        legacy = asyncio.run(legacy_segment_results(segments_frames, audio, thread_pool))
+        legacy_loudness = time.perf_counter() - started
+    started = time.perf_counter()
+    legacy_merged = legacy_merge(legacy)
+    legacy_merge_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectorized = summarize_segments(segments_frames, samples, sample_rate)
+    vectorized_loudness = time.perf_counter() - started
+    started = time.perf_counter()
+    vectorized_merged = merge_short_segments(vectorized)
+    vectorized_merge_time = time.perf_counter() - started
+
+    print(f"loudness  legacy: {legacy_loudness:.3f}s  vectorized: {vectorized_loudness:.3f}s  "
+          f"speedup: {legacy_loudness / vectorized_loudness:.1f}x")
+    print(f"merge     legacy: {legacy_merge_time:.4f}s  vectorized: {vectorized_merge_time:.4f}s")
+    print(f"results identical: {same_loudness_results(legacy_merged, vectorized_merged)}")
+
+def same_loudness_results(legacy_merged, vectorized_merged) -> bool:
+    """병합된 세그먼트 구성이 같고 볼륨이 부동소수점 오차 안에서 같은지 확인합니다."""
+    legacy_volumes = np.array([r["volume"] for r in legacy_merged])
+    vectorized_volumes = np.array([r["volume"] for r in vectorized_merged])
+    return (
+        [r["segment"] for r in legacy_merged] == [r["segment"] for r in vectorized_merged]
+        and np.allclose(legacy_volumes, vectorized_volumes, rtol=0, atol=1e-9, equal_nan=True)
+    )
+
+def check_speed_loudness(minutes: float = 3) -> int:
+    """합성 오디오에서 NumPy 볼륨 계산/병합 결과가 pydub 방식과 같은지 확인하고 실패 수를 반환합니다."""
+    from pydub import AudioSegment
+    from speed import summarize_segments, merge_short_segments
+
+    sample_rate = 16000
+    samples = synthetic_pcm(minutes, sample_rate)
+    segments_frames = synthetic_segments(samples, int(minutes * 20000 / 60), sample_rate)
+    audio = AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=sample_rate, channels=1)
+    with ThreadPoolExecutor(max_workers=4) as thread_pool:
+        legacy = legacy_merge(asyncio.run(legacy_segment_results(segments_frames, audio, thread_pool)))
+    vectorized = merge_short_segments(summarize_segments(segments_frames, samples, sample_rate))
+    return not check(f"segment loudness and merge ({len(segments_frames)} segments)",
+                     same_loudness_results(legacy, vectorized), True)
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int = 16000):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+def measure(func, *args):
+    """(결과, 소요 시간, tracemalloc 기준 최대 메모리 바이트)를 반환합니다."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def bench_speed_vad_memory(args):
+    from pydub import AudioSegment
+    from speed import analyze_segments_vad, stream_vad_segments
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "speech.wav")
+        write_wav(path, synthetic_pcm(args.minutes))
+        print(f"audio: {args.minutes} min")
+        legacy, legacy_time, legacy_peak = measure(
+            lambda: asyncio.run(analyze_segments_vad(AudioSegment.from_file(path)))
+        )
+        streamed, stream_time, stream_peak = measure(stream_vad_segments, path)
+
+    same_bounds, max_volume_diff = vad_agreement(legacy, streamed)
+    print(f"pydub   : {legacy_time:.2f}s  peak {legacy_peak / 2**20:.1f} MiB")
+    print(f"stream  : {stream_time:.2f}s  peak {stream_peak / 2**20:.1f} MiB")
+    print(f"segments: {len(legacy)} / {len(streamed)}  same boundaries: {same_bounds}  "
+          f"max volume diff: {max_volume_diff:.4f} dB")
+
+def vad_agreement(legacy: list, streamed: list):
+    """(세그먼트 경계가 모두 같은지, 볼륨 최대 차이 dB)를 반환합니다."""
+    def bounds(results):
+        return [(r["segment"], r["start_time"], r["end_time"]) for r in results]
+
+    max_volume_diff = max((abs(a["volume"] - b["volume"]) for a, b in zip(legacy, streamed)), default=0.0)
+    return bounds(legacy) == bounds(streamed), max_volume_diff
+
+def check_vad_stream(minutes: float = 5) -> int:
+    """
+    합성 오디오에서 ffmpeg 스트리밍 VAD와 pydub 전체 로드 VAD의 세그먼트 경계가 같은지 확인하고 실패 수를 반환합니다.
+    스트리밍 쪽 볼륨은 프레임 경계 기준이라 ms 단위로 자르는 pydub 쪽과 0.01dB 안에서만 같습니다.
+    """
+    from pydub import AudioSegment
+    from speed import analyze_segments_vad, stream_vad_segments
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "speech.wav")
+        write_wav(path, synthetic_pcm(minutes))
+        legacy = asyncio.run(analyze_segments_vad(AudioSegment.from_file(path)))
+        streamed = stream_vad_segments(path)
+    same_bounds, max_volume_diff = vad_agreement(legacy, streamed)
+    failures = not check(f"VAD segment boundaries, stream vs pydub ({len(legacy)} segments)", same_bounds, True)
+    failures += not check(f"VAD volume within 0.01 dB (max diff {max_volume_diff:.4f})", max_volume_diff < 0.01, True)
+    return failures
+
+def stub_server(handle):
+    """
+    POST 요청 본문(bytes)을 handle에 넘겨 응답하는 로컬 가짜 HTTP 서버를 띄웁니다.
+    handle이 dict를 반환하면 JSON으로, 바이트 조각 이터레이터를 반환하면 조각마다 바로 보내는 text/event-stream으로 응답합니다.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            response = handle(self.rfile.read(int(self.headers["Content-Length"])))
+            if isinstance(response, dict):
+                data = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for chunk in response:
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def verbose_json(segments: list, duration: float) -> dict:
+    """Whisper verbose_json 응답 형태"""
+    return {
+        "task": "transcribe", "language": "korean", "duration": duration,
+        "text": "".join(seg["text"] for seg in segments), "segments": segments,
+    }
+
+def fake_transcription_server(seconds_per_audio_second: float, compressed_bitrate: int = 24000):
+    """
+    Whisper verbose_json 형태로 응답하는 가짜 변환 서버입니다.
+    업로드 크기로 오디오 길이를 추정해(wav는 16kHz 모노 16비트, 그 외는 청크 인코딩 비트레이트 기준)
+    길이에 비례해 응답을 늦추고, 10초마다 세그먼트 하나를 돌려줍니다.
+    """
+    def handle(body):
+        duration = len(body) / 32000 if b"RIFF" in body[:4096] else len(body) * 8 / compressed_bitrate
+        time.sleep(duration * seconds_per_audio_second)
+        # 컨테이너/인코더 오버헤드 때문에 크기 기반 추정은 실제보다 조금 길어서 마지막 1초에는 세그먼트를 만들지 않습니다.
+        segments = [
+            {"id": i, "start": float(start), "end": float(min(start + 10, duration)), "text": f" 문장 {i}"}
+            for i, start in enumerate(np.arange(0, max(duration - 1, 0), 10))
+        ]
+        return verbose_json(segments, duration)
+
+    return stub_server(handle)
+
+def bench_whisper_chunks(args):
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    import whisper_test
+    from stt_backends import OpenAIWhisperBackend
+
+    server = fake_transcription_server(args.latency)
+    whisper_test.stt_backend = OpenAIWhisperBackend(api_url=f"http://127.0.0.1:{server.server_port}/v1/audio/transcriptions")
+    whisper_test.WHISPER_CHUNK_SECONDS = args.chunk_seconds
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "talk.wav")
+        write_wav(path, synthetic_pcm(args.minutes))
+        print(f"audio: {args.minutes} min, chunk: {args.chunk_seconds}s, "
+              f"concurrency: {whisper_test.WHISPER_MAX_CONCURRENCY}, fake latency: {args.latency}s per audio second")
+        with open(path, "rb") as f:
+            started = time.perf_counter()
+            single = whisper_test.stt_backend.transcribe(f, "talk.wav")
+            single_time = time.perf_counter() - started
+            started = time.perf_counter()
+            chunked = whisper_test.transcribe_chunked(f, "talk.wav", content_hash=f"benchmark-{time.time()}")
+            chunked_time = time.perf_counter() - started
+    server.shutdown()
+
+    starts = [seg["start"] for seg in chunked["segments"]]
+    print(f"single request: {single_time:.2f}s  segments: {len(single['segments'])}  duration: {single['duration']:.1f}s")
+    print(f"chunked       : {chunked_time:.2f}s  segments: {len(chunked['segments'])}  duration: {chunked['duration']:.1f}s  "
+          f"speedup: {single_time / chunked_time:.1f}x")
+    print(f"stitched timestamps monotonic: {starts == sorted(starts)}  "
+          f"ids sequential: {[seg['id'] for seg in chunked['segments']] == list(range(len(starts)))}")
+
+def fake_chunk_server(segments_per_chunk: int, chunk_duration: float):
+    """
+    청크 파일 이름(..._000.ogg)의 번호로 미리 정한 세그먼트를 돌려주는 가짜 변환 서버입니다.
+    청크 i의 세그먼트 k는 청크 기준 (4k+1, 4k+4)초, 텍스트는 "청크 i 문장 k"입니다.
+    뒤 청크일수록 빨리 응답해 완료 순서가 청크 순서와 달라지게 합니다.
+    """
+    def handle(body):
+        match = re.search(rb'filename="[^"]*_(\d{3})\.ogg"', body)
+        index = int(match.group(1)) if match else 0
+        time.sleep(max(0.0, 0.2 - index * 0.05))
+        segments = [
+            {"id": k, "start": 4.0 * k + 1, "end": 4.0 * k + 4, "text": f" 청크 {index} 문장 {k}"}
+            for k in range(segments_per_chunk)
+        ]
+        return verbose_json(segments, chunk_duration)
+
+    return stub_server(handle)
+
+def check_whisper_stitch() -> int:
+    """정해진 VAD 구간과 가짜 서버 응답으로 plan_chunks/stitch_transcripts 결과를 기대값과 비교하고 실패 수를 반환합니다."""
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    import whisper_test
+    from stt_backends import OpenAIWhisperBackend
+
+    failures = 0
+    # 음성 구간 사이 무음의 가운데에서 자르고, 첫 청크만 더 짧게 자릅니다.
+    speech = [{"start_time": float(start), "end_time": float(start + 50)} for start in (0, 60, 120, 180)]
+    failures += not check("plan_chunks (silence cuts)", whisper_test.plan_chunks(speech, 100, 60),
+                          [(0.0, 55.0), (55.0, 115.0), (115.0, 175.0), (175.0, None)])
+    # 제한보다 긴 음성 구간은 제한 길이마다 자릅니다.
+    failures += not check("plan_chunks (long segment)", whisper_test.plan_chunks([{"start_time": 0.0, "end_time": 250.0}], 100),
+                          [(0.0, 100.0), (100.0, 200.0), (200.0, None)])
+
+    segments_per_chunk, chunk_duration = 2, 60.0
+    server = fake_chunk_server(segments_per_chunk, chunk_duration)
+    patched = ("stt_backend", "WHISPER_CHUNK_SECONDS", "WHISPER_FIRST_CHUNK_SECONDS", "speech_segments")
+    saved = {name: getattr(whisper_test, name) for name in patched}
+    whisper_test.stt_backend = OpenAIWhisperBackend(api_url=f"http://127.0.0.1:{server.server_port}/v1/audio/transcriptions")
+    whisper_test.WHISPER_CHUNK_SECONDS = 100
+    whisper_test.WHISPER_FIRST_CHUNK_SECONDS = 60
+    whisper_test.speech_segments = lambda path, content_hash: speech
+    offsets = [0.0, 55.0, 115.0, 175.0]
+    expected_segments = [
+        {"id": i * segments_per_chunk + k, "start": offset + 4.0 * k + 1, "end": offset + 4.0 * k + 4,
+         "text": f" 청크 {i} 문장 {k}"}
+        for i, offset in enumerate(offsets) for k in range(segments_per_chunk)
+    ]
+    streamed = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "talk.wav")
+            write_wav(path, synthetic_pcm(4))
+            with open(path, "rb") as f:
+                stitched = whisper_test.transcribe_chunked(
+                    f, "talk.wav", content_hash="stitch-check", on_part=lambda start, part: streamed.append(start)
+                )
+    finally:
+        server.shutdown()
+        for name, value in saved.items():
+            setattr(whisper_test, name, value)
+
+    failures += not check("stitched segments (ids, timestamps, text)", stitched["segments"], expected_segments)
+    failures += not check("stitched text", stitched["text"],
+                          " ".join(" ".join(f"청크 {i} 문장 {k}" for k in range(segments_per_chunk)) for i in range(len(offsets))))
+    failures += not check("stitched duration", stitched["duration"], offsets[-1] + chunk_duration)
+    failures += not check("on_part order", streamed, offsets)
+    return failures
+
+def bench_stt_backends(args):
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    import whisper_test
+    from stt_backends import create_stt_backend
+    from diff_engine import create_diff_html_and_count, tokenize_with_punctuation
+
+    script = None
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = whisper_test.filter_special_sentences(whisper_test.clean_text(f.read()))
+    for name in args.backends:
+        backend = create_stt_backend(name)
+        whisper_test.stt_backend = backend
+        try:
+            with open(args.audio, "rb") as f:
+                started = time.perf_counter()
+                transcript = whisper_test.transcribe_chunked(f, os.path.basename(args.audio), content_hash=f"benchmark-{time.time()}")
+                elapsed = time.perf_counter() - started
+        finally:
+            backend.close()
+        duration = transcript.get("duration") or 0.0
+        line = (f"{name:7s}: {elapsed:.1f}s  audio {duration:.0f}s  real-time factor {elapsed / duration if duration else 0:.3f}  "
+                f"segments: {len(transcript['segments'])}")
+        if script:
+            _, diff_count = create_diff_html_and_count(script, whisper_test.clean_text(whisper_test.transcript_text(transcript)))
+            total = len(tokenize_with_punctuation(script))
+            line += f"  accuracy: {(total - diff_count) / total * 100:.2f}%"
+        print(line)
+
+def voiced_mask(segments, total_seconds: float, frame_seconds: float = 0.03) -> np.ndarray:
+    """VAD 세그먼트 목록을 30ms 프레임 단위의 음성 여부 배열로 바꿉니다."""
+    mask = np.zeros(int(total_seconds / frame_seconds) + 1, dtype=bool)
+    for segment in segments:
+        mask[int(round(segment["start_time"] / frame_seconds)):int(round(segment["end_time"] / frame_seconds))] = True
+    return mask
+
+def bench_analysis_audio(args):
+    import subprocess
+    from speed import stream_vad_segments
+    from analysis_cache import ANALYSIS_AUDIO_BITRATE
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.audio
+        if source is None:
+            source = os.path.join(tmp, "talk.wav")
+            write_wav(source, synthetic_pcm(args.minutes))
+        reference = stream_vad_segments(source)
+        total_seconds = max((r["end_time"] for r in reference), default=0.0) + 1
+        print(f"source: {os.path.basename(source)}  VAD segments: {len(reference)}")
+        renditions = {
+            "playback mp3 (-q:a 0)": (["-c:a", "libmp3lame", "-q:a", "0"], "playback.mp3"),
+            f"analysis opus 16k mono {ANALYSIS_AUDIO_BITRATE}": (
+                ["-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", ANALYSIS_AUDIO_BITRATE, "-application", "voip"],
+                "analysis.ogg",
+            ),
+        }
+        for label, (codec_args, name) in renditions.items():
+            path = os.path.join(tmp, name)
+            started = time.perf_counter()
+            subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", source, "-vn", *codec_args, path], check=True)
+            encode_time = time.perf_counter() - started
+            segments = stream_vad_segments(path)
+            agreement = (voiced_mask(reference, total_seconds) == voiced_mask(segments, total_seconds)).mean()
+            print(f"{label:34s}: {os.path.getsize(path) / 2**20:7.2f} MiB  encode {encode_time:.2f}s  "
+                  f"VAD segments {len(segments)}  voiced-frame agreement with source {agreement * 100:.2f}%")
+
+def bench_face_prefilter(args):
+    from emotion import FacePrefilter
+
+    prefilter = FacePrefilter(detector=args.detector, model=args.model or "", width=args.width)
+    counts = {}
+    missed = []
+    elapsed = 0.0
+    for label in ("face", "noface"):
+        directory = os.path.join(args.labelled_dir, label)
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), "rb") as f:
+                image_bytes = f.read()
+            started = time.perf_counter()
+            found = prefilter.has_face(image_bytes)
+            elapsed += time.perf_counter() - started
+            counts[(label, found)] = counts.get((label, found), 0) + 1
+            if label == "face" and not found:
+                missed.append(name)
+    stats = prefilter.stats()
+    if stats["unavailable"]:
+        print(f"detector unavailable for {stats['unavailable']} frames (fail-open, frames sent to Rekognition)")
+    tp, fn = counts.get(("face", True), 0), counts.get(("face", False), 0)
+    fp, tn = counts.get(("noface", True), 0), counts.get(("noface", False), 0)
+    total = tp + fn + fp + tn
+    print(f"detector: {args.detector}  width: {args.width}  frames: {total}  {elapsed / max(total, 1) * 1000:.1f} ms/frame")
+    print(f"face frames  : {tp + fn:5d}  detected {tp}  missed {fn}  false-negative rate {fn / max(tp + fn, 1) * 100:.2f}%")
+    print(f"noface frames: {fp + tn:5d}  skipped {tn}  passed {fp}  false-positive rate {fp / max(fp + tn, 1) * 100:.2f}%")
+    print(f"detect_faces calls saved: {stats['saved_calls']} / {total} ({stats['saved_calls'] / max(total, 1) * 100:.1f}%)")
+    if missed:
+        print(f"missed face frames: {', '.join(missed)}")
+
+class CountingClient:
+    """detect_faces 호출 수를 세는 Rekognition 클라이언트 래퍼."""
+    def __init__(self, client):
+        self.client = client
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def detect_faces(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+        return self.client.detect_faces(**kwargs)
+
+def bench_emotion_mosaic(args):
+    from emotion import analyze_images, rekognition_client
+
+    names = sorted(name for name in os.listdir(args.frames_dir) if name.lower().endswith((".jpg", ".jpeg", ".png")))
+    frames = []
+    for name in names:
+        with open(os.path.join(args.frames_dir, name), "rb") as f:
+            frames.append(f.read())
+
+    def run(mosaic_size):
+        client = CountingClient(rekognition_client)
+        started = time.perf_counter()
+        results = analyze_images(frames, client=client, mosaic_size=mosaic_size)
+        return results, client.calls, time.perf_counter() - started
+
+    def emotions(result):
+        return sorted(face["emotion"] for face in result.get("results", []))
+
+    baseline, baseline_calls, baseline_time = run(0)
+    with_emotion = sum(1 for result in baseline if emotions(result))
+    print(f"per-frame : {len(frames)} frames  {baseline_calls} calls  {baseline_time:.1f}s  "
+          f"frames with emotion >= 90%: {with_emotion}  errors: {sum('error' in r for r in baseline)}")
+    for size in args.sizes:
+        results, calls, elapsed = run(size)
+        same = sum(emotions(a) == emotions(b) for a, b in zip(baseline, results))
+        lost = sum(bool(emotions(a)) and not emotions(b) for a, b in zip(baseline, results))
+        gained = sum(not emotions(a) and bool(emotions(b)) for a, b in zip(baseline, results))
+        confidence_diffs = [
+            abs(x["confidence"] - y["confidence"])
+            for a, b in zip(baseline, results) if emotions(a) == emotions(b)
+            for x, y in zip(sorted(a.get("results", []), key=lambda face: face["emotion"]),
+                            sorted(b.get("results", []), key=lambda face: face["emotion"]))
+        ]
+        mismatched = [name for name, a, b in zip(names, baseline, results) if emotions(a) != emotions(b)]
+        print(f"mosaic {size:3d}: {calls} calls ({baseline_calls / max(calls, 1):.1f}x fewer)  {elapsed:.1f}s  "
+              f"same per-frame result: {same}/{len(frames)}  lost: {lost}  gained: {gained}  "
+              f"mean |confidence diff|: {np.mean(confidence_diffs) if confidence_diffs else 0.0:.2f}  "
+              f"errors: {sum('error' in r for r in results)}")
+        if mismatched and args.verbose:
+            print(f"  mismatched frames: {', '.join(mismatched)}")
+
+class StubRekognitionClient:
+    """detect_faces 대역: b"slow"로 시작하는 이미지는 release가 설정될 때까지 응답하지 않습니다."""
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.waiting = 0
+
+    def detect_faces(self, Image, Attributes):
+        if Image["Bytes"].startswith(b"slow"):
+            with self.lock:
+                self.waiting += 1
+            self.release.wait()
+            with self.lock:
+                self.waiting -= 1
+        return {"FaceDetails": [{"Emotions": [{"Type": "HAPPY", "Confidence": 99.0}]}]}
+
+def check_emotion_deadline(frames: int = 8, slow=(1, 5), max_in_flight: int = 4, timeout: float = 1.0) -> int:
+    """
+    응답하지 않는 프레임만 error가 되고, analyze_images가 마감 직후 남은 호출을 기다리지 않고 반환하는지
+    확인하고 실패 수를 반환합니다.
+    """
+    from emotion import analyze_images
+
+    client = StubRekognitionClient()
+    images = [b"slow" if index in slow else b"fast" for index in range(frames)]
+    # analyze_images가 남은 호출을 기다리면 이 타이머가 풀어 줄 때까지 반환하지 않으므로 elapsed로 드러납니다.
+    safety = threading.Timer(timeout * 5, client.release.set)
+    safety.start()
+    started = time.perf_counter()
+    try:
+        results = analyze_images(images, max_in_flight=max_in_flight, client=client, mosaic_size=0, timeout=timeout)
+        elapsed = time.perf_counter() - started
+        still_waiting = client.waiting
+    finally:
+        client.release.set()
+        safety.cancel()
+    print(f"frames: {frames}  slow: {len(slow)}  timeout: {timeout}s  elapsed: {elapsed:.2f}s")
+    failures = not check("per-frame results in order",
+                         ["error" if "error" in result else "results" for result in results],
+                         ["error" if image == b"slow" else "results" for image in images])
+    failures += not check(f"returned within the deadline ({elapsed:.2f}s)", elapsed < timeout + 0.5, True)
+    failures += not check("timed-out calls left running (shutdown(wait=False))", still_waiting, len(slow))
+    return failures
+
+def legacy_script_budget(minutes: float) -> dict:
+    """기존 get_max_tokens(분당 150단어 × 단어당 1.3토큰)와 같은 예산."""
+    max_tokens = int(minutes * 150 * 1.3)
+    return {
+        "max_tokens": max_tokens,
+        "sections": {name: {"words": int(max_tokens * ratio / 1.3)} for name, ratio in
+                     {"intro": 0.2, "main": 0.6, "conclusion": 0.2}.items()},
+    }
+
+def script_run_summary(label: str, runs: list, tolerance: float):
+    """runs: (목표 분, max_tokens, 생성 토큰 수, 잘림 여부, 발표 시간(분), 지연(초 또는 None))"""
+    overrun = sum(1 for run in runs if run[3])
+    underrun = sum(1 for run in runs if not run[3] and run[4] < run[0] * (1 - tolerance))
+    latencies = [run[5] for run in runs if run[5] is not None]
+    line = (f"{label:10s}: runs {len(runs)}  overrun(truncated) {overrun / len(runs) * 100:5.1f}%  "
+            f"underrun(<{(1 - tolerance) * 100:.0f}% of time) {underrun / len(runs) * 100:5.1f}%  "
+            f"spoken/target {np.mean([run[4] / run[0] for run in runs]):.2f}  "
+            f"tokens used/max_tokens {np.mean([run[2] / run[1] for run in runs]):.2f}")
+    if latencies:
+        line += f"  latency mean {np.mean(latencies):.1f}s p95 {np.percentile(latencies, 95):.1f}s"
+    print(line)
+
+def bench_token_budget(args):
+    import re
+    from token_budget import calibrate, count_tokens, spoken_minutes, script_token_budget
+
+    budgets = {"legacy": legacy_script_budget, "tokenizer": script_token_budget}
+    if args.scripts:
+        # 저장된 스크립트: 파일명에 "3분" 또는 "3min"이 있으면 그 발표 시간 기준으로 예산과 비교합니다.
+        scripts = {}
+        for name in sorted(os.listdir(args.scripts)):
+            if name.endswith(".txt"):
+                with open(os.path.join(args.scripts, name), "r", encoding="utf-8") as f:
+                    scripts[name] = f.read()
+        calibration = calibrate(list(scripts.values()))
+        print(f"scripts: {calibration['scripts']}  syllables: {calibration['syllables']}  tokens: {calibration['tokens']} "
+              f"({calibration['tokenizer']})")
+        print(f"SCRIPT_TOKENS_PER_SYLLABLE={calibration['tokens_per_syllable']:.3f}  "
+              f"SCRIPT_SYLLABLES_PER_WORD={calibration['syllables_per_word']:.2f}")
+        for label, budget in budgets.items():
+            runs = []
+            for name, script in scripts.items():
+                match = re.search(r"(\d+)\s*(분|min)", name)
+                if match:
+                    minutes = int(match.group(1))
+                    max_tokens = budget(minutes)["max_tokens"]
+                    tokens = count_tokens(script)
+                    runs.append((minutes, max_tokens, tokens, tokens > max_tokens, spoken_minutes(script), None))
+            if runs:
+                script_run_summary(label, runs, args.tolerance)
+        return
+
+    os.environ.setdefault("OPENAI_API_KEY", "")
+    import main
+    from openai_client import openai_client
+    data = {"topic": args.topic, "purpose": args.purpose, "summary": args.summary}
+    for label, budget in budgets.items():
+        runs = []
+        for minutes in args.durations:
+            request = main.PresentationRequest(duration=f"{minutes}분", **data)
+            prompt, max_tokens = main.create_presentation_prompt(request, budget(minutes))
+            for _ in range(args.samples):
+                started = time.perf_counter()
+                response = asyncio.run(openai_client.chat(
+                    main.SCRIPT_MODEL,
+                    main.create_script_messages(prompt),
+                    max_tokens=max_tokens,
+                    temperature=main.SCRIPT_TEMPERATURE
+                ))
+                elapsed = time.perf_counter() - started
+                choice = response["choices"][0]
+                script = main.filter_sentences(choice["message"]["content"])
+                runs.append((minutes, max_tokens, response["usage"]["completion_tokens"],
+                             choice["finish_reason"] == "length", spoken_minutes(script), elapsed))
+        script_run_summary(label, runs, args.tolerance)
+
+SYLLABLES = "가나다라마바사아자차카타파하고노도로모보소오조초코토포호구누두루무부수우주추쿠투푸후"
+PARTICLES = ["은", "는", "이", "가", "을", "를", "에", "의", "로", "와", "도", "만"]
+
+def synthetic_script(minutes: float, words_per_minute: int = 120, seed: int = 0) -> str:
+    """어휘 2,000개로 만든 한국어 형태의 발표 스크립트 (어절 + 조사, 문장부호 포함)."""
+    rng = np.random.default_rng(seed)
+    vocabulary = ["".join(rng.choice(list(SYLLABLES), size=rng.integers(1, 4))) for _ in range(2000)]
+    # 자주 쓰는 단어가 많이 나오도록 Zipf 분포로 고릅니다.
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    words = rng.choice(vocabulary, size=int(minutes * words_per_minute), p=weights / weights.sum())
+    sentences, sentence = [], []
+    for word in words:
+        sentence.append(word + (rng.choice(PARTICLES) if rng.random() < 0.5 else ""))
+        if len(sentence) >= rng.integers(6, 15):
+            sentences.append(" ".join(sentence) + rng.choice([".", ".", "?", "!"]))
+            sentence = []
+    if sentence:
+        sentences.append(" ".join(sentence) + ".")
+    return " ".join(sentences)
+
+def noisy_transcript(script: str, error_rate: float, seed: int = 0) -> str:
+    """어절 단위로 글자 바꾸기, 빠뜨리기, 끼워 넣기와 문장부호 누락을 섞은 변환 텍스트를 만듭니다."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for word in script.split():
+        r = rng.random()
+        if r < error_rate * 0.4:
+            word = word[:-1] + rng.choice(list(SYLLABLES)) if len(word) > 1 else rng.choice(list(SYLLABLES))
+        elif r < error_rate * 0.6:
+            continue
+        elif r < error_rate * 0.8:
+            out.append(rng.choice(list(SYLLABLES)) * 2)
+        elif r < error_rate and word[-1] in ".?!":
+            word = word[:-1]
+        out.append(word)
+    return " ".join(out)
+
+def legacy_diff_html_and_count(orig: str, trans: str):
+    """개선 전 방식: difflib.SequenceMatcher로 문자열 토큰 리스트를 비교합니다 (HTML 조립은 diff_engine과 공유)."""
+    import difflib
+    from diff_engine import tokenize_with_punctuation, render_opcodes
+    orig_tokens = tokenize_with_punctuation(orig)
+    trans_tokens = tokenize_with_punctuation(trans)
+    diff_parts = []
+    opcodes = difflib.SequenceMatcher(None, orig_tokens, trans_tokens).get_opcodes()
+    diff_count = render_opcodes(opcodes, orig_tokens, trans_tokens, diff_parts)
+    return " ".join(diff_parts), diff_count
+
+def check_diff_engine(cases: int = 200) -> int:
+    """회귀 코퍼스에서 diff_engine의 diff_count와 HTML이 개선 전 방식과 같은지 확인하고 다른 경우의 수를 반환합니다."""
+    from diff_engine import create_diff_html_and_count
+
+    # 짧은 스크립트(difflib의 autojunk가 동작하지 않는 200토큰 미만 포함)와 다양한 오류율
+    mismatched = 0
+    for case in range(cases):
+        script = synthetic_script(0.2 + (case % 10) * 0.3, seed=case)
+        transcript = noisy_transcript(script, error_rate=(case % 5) * 0.05, seed=case)
+        mismatched += create_diff_html_and_count(script, transcript) != legacy_diff_html_and_count(script, transcript)
+    print(f"regression corpus: {cases} cases  diff_count/HTML mismatches: {mismatched}")
+    return mismatched
+
+def bench_diff_engine(args):
+    from diff_engine import create_diff_html_and_count
+
+    mismatched = check_diff_engine(args.cases)
+    for minutes in args.minutes:
+        script = synthetic_script(minutes, seed=int(minutes))
+        transcript = noisy_transcript(script, args.error_rate, seed=int(minutes))
+        started = time.perf_counter()
+        _, legacy_count = legacy_diff_html_and_count(script, transcript)
+        legacy_time = time.perf_counter() - started
+        started = time.perf_counter()
+        _, count = create_diff_html_and_count(script, transcript)
+        elapsed = time.perf_counter() - started
+        tokens = len(script.split())
+        print(f"{minutes:5.1f} min ({tokens} words)  difflib: {legacy_time:.3f}s diff_count {legacy_count}  "
+              f"diff_engine: {elapsed:.3f}s diff_count {count}")
+    exit_on_failure(mismatched)
+
+# 서버 시작 시 불러오는 무거운 의존성
+HEAVY_MODULES = ["cv2", "boto3", "pydub", "webrtcvad", "openai", "numpy"]
+SUB_APP_MODULES = ["vod", "speed", "main", "whisper_test", "emotion"]
+
+def timed_subprocess(code: str, repeat: int) -> list:
+    """새 파이썬 프로세스에서 code를 실행하고 마지막 줄에 출력된 JSON을 반복 횟수만큼 모읍니다 (모듈 캐시 없는 콜드 스타트)."""
+    import sys
+    import subprocess
+    results = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        )
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return results
+
+def bench_startup(args):
+    import statistics
+    heavy = json.dumps(HEAVY_MODULES)
+    lazy_code = (
+        "import sys, json, time; started = time.perf_counter(); import end; "
+        f"print(json.dumps({{'seconds': time.perf_counter() - started, 'heavy': [m for m in {heavy} if m in sys.modules]}}))"
+    )
+    # 개선 전 end.py처럼 모든 백엔드 앱을 모듈 로드 시점에 불러옵니다.
+    eager_code = (
+        "import sys, json, time, importlib; started = time.perf_counter(); import end; "
+        f"[importlib.import_module(m) for m in {json.dumps(SUB_APP_MODULES)}]; "
+        f"print(json.dumps({{'seconds': time.perf_counter() - started, 'heavy': [m for m in {heavy} if m in sys.modules]}}))"
+    )
+    # 지연 로딩: import 후 /ai 첫 요청까지 (main 모듈만 불러옴)
+    first_request_code = (
+        "import sys, json, time, asyncio, httpx; started = time.perf_counter(); import end\n"
+        "async def first():\n"
+        "    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=end.app), base_url='http://bench') as client:\n"
+        f"        return (await client.get({args.path!r})).status_code\n"
+        "status = asyncio.run(first())\n"
+        f"print(json.dumps({{'seconds': time.perf_counter() - started, 'status': status, 'heavy': [m for m in {heavy} if m in sys.modules]}}))"
+    )
+    for label, code in (("lazy end:app", lazy_code), ("eager (all sub-apps)", eager_code), (f"lazy + first GET {args.path}", first_request_code)):
+        runs = timed_subprocess(code, args.repeat)
+        extra = f"  status: {runs[0]['status']}" if "status" in runs[0] else ""
+        print(f"{label:28s}: median {statistics.median(run['seconds'] for run in runs):.3f}s  "
+              f"heavy modules loaded: {', '.join(runs[0]['heavy']) or 'none'}{extra}")
+
+    print("per sub-app import (fresh process, after fastapi):")
+    for module in SUB_APP_MODULES:
+        code = (
+            "import sys, json, time, fastapi, importlib; started = time.perf_counter(); "
+            f"importlib.import_module({module!r}); "
+            f"print(json.dumps({{'seconds': time.perf_counter() - started, 'heavy': [m for m in {heavy} if m in sys.modules]}}))"
+        )
+        runs = timed_subprocess(code, args.repeat)
+        print(f"  {module:14s}: median {statistics.median(run['seconds'] for run in runs):.3f}s  "
+              f"heavy: {', '.join(runs[0]['heavy']) or 'none'}")
+
+def fake_chat_server(chunks: list, chunk_delay: float):
+    """Chat Completions(stream=True 포함) 형태로 응답하는 가짜 서버입니다. 스트림은 조각마다 chunk_delay초씩 늦춥니다."""
+    def stream_events():
+        for text in chunks:
+            time.sleep(chunk_delay)
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': text}}]}, ensure_ascii=False)}\n\n".encode("utf-8")
+        yield b"data: [DONE]\n\n"
+
+    def handle(body):
+        if json.loads(body).get("stream"):
+            return stream_events()
+        return {
+            "choices": [{"message": {"content": "".join(chunks)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(chunks)},
+        }
+
+    return stub_server(handle)
+
+async def disconnecting_stream_request(app, body: dict, after_chunks: int):
+    """
+    /ai/predict/stream을 ASGI로 직접 호출하고 연결을 끊습니다.
+    after_chunks가 0이면 응답 시작을 보내는 순간 끊긴 것처럼(ASGI 2.4 서버의 OSError) 본문 생성이 시작되지 않게 하고,
+    아니면 본문 조각 after_chunks개를 받은 뒤 생성 도중에 http.disconnect를 보냅니다.
+    """
+    received = asyncio.Event()
+    chunks = 0
+
+    async def receive():
+        if not hasattr(receive, "sent"):
+            receive.sent = True
+            return {"type": "http.request", "body": json.dumps(body).encode("utf-8"), "more_body": False}
+        await received.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal chunks
+        if message["type"] == "http.response.start" and not after_chunks:
+            raise OSError("client disconnected")
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunks += 1
+            if chunks >= after_chunks:
+                received.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4" if not after_chunks else "2.0"},
+        "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/ai/predict/stream", "raw_path": b"/ai/predict/stream", "root_path": "",
+        "query_string": b"", "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        pass  # 연결 끊김 예외 (ClientDisconnect)
+    return chunks
+
+def check_script_stream_disconnect(chunk_delay: float = 0.2, timeout: float = 10) -> int:
+    """
+    스트리밍 중 연결이 끊겨도 진행 중 생성(single-flight)이 정리되어 같은 요청이 다시 완료되는지,
+    같은 요청을 기다리던 연결은 결과를 받는지 확인하고 실패 수를 반환합니다.
+    """
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    import httpx
+    import main
+    from openai_client import openai_client
+    from script_cache import script_cache
+
+    server = fake_chat_server(["안녕하세요. ", "오늘은 인공지능에 대해 이야기하겠습니다. ", "감사합니다."], chunk_delay)
+    openai_client.api_base = f"http://127.0.0.1:{server.server_port}/v1"
+
+    async def run():
+        failures = 0
+        for after_chunks in (0, 1):
+            body = {"topic": f"연결 끊김 {after_chunks}", "purpose": "확인", "summary": "요약", "duration": "3분"}
+            received = await disconnecting_stream_request(main.app, body, after_chunks)
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                try:
+                    response = await asyncio.wait_for(client.post("/ai/predict", json=body), timeout)
+                    ok = response.status_code == 200 and bool(response.json()["script"])
+                except asyncio.TimeoutError:
+                    ok = False
+            stats = script_cache.stats()
+            in_flight = sum(model["in_flight"] for model in openai_client.stats().values())
+            ok = ok and stats["in_flight"] == 0 and in_flight == 0
+            failures += not ok
+            print(f"disconnect after {after_chunks} chunk(s) (received {received}): second identical request "
+                  f"{'completed' if ok else 'FAILED'}  pending claims: {stats['in_flight']}  OpenAI calls in flight: {in_flight}")
+
+        # 생성을 시작한 요청이 끊겨도, 같은 요청을 기다리던 다른 연결은 결과를 받아야 합니다.
+        body = {"topic": "대기 중인 요청", "purpose": "확인", "summary": "요약", "duration": "3분"}
+        leader = asyncio.create_task(disconnecting_stream_request(main.app, body, 1))
+        while script_cache.stats()["in_flight"] == 0:
+            await asyncio.sleep(0.01)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            try:
+                response = await asyncio.wait_for(client.post("/ai/predict/stream", json=body), timeout)
+                ok = "event: result" in response.text
+            except asyncio.TimeoutError:
+                ok = False
+        await leader
+        failures += not ok
+        print(f"leader disconnected while another request waited: waiter {'received the script' if ok else 'FAILED'}")
+        await openai_client.aclose()
+        return failures
+
+    try:
+        return asyncio.run(run())
+    finally:
+        server.shutdown()
+
+# 결과가 기대값과 정확히 같아야 하는 확인 항목 (합성 데이터와 가짜 서버/클라이언트만 사용)
+CHECKS = {
+    "whisper-stitch": check_whisper_stitch,
+    "diff-engine": check_diff_engine,
+    "vad-stream": check_vad_stream,
+    "speed-loudness": check_speed_loudness,
+    "emotion-deadline": check_emotion_deadline,
+    "script-stream-disconnect": check_script_stream_disconnect,
+}
+
+def run_checks(args):
+    failed = []
+    for name in args.only or CHECKS:
+        print(f"== {name}")
+        try:
+            failures = CHECKS[name]()
+        except Exception as e:
+            print(f"{name}: ERROR {type(e).__name__}: {e}")
+            failures = 1
+        if failures:
+            failed.append(name)
+    total = len(args.only or CHECKS)
+    print(f"== {total - len(failed)}/{total} checks passed" + (f", failed: {', '.join(failed)}" if failed else ""))
+    exit_on_failure(len(failed))
+
+def main():
+    parser = argparse.ArgumentParser(description="TalkFeed 분석 파이프라인 벤치마크")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    checks = subparsers.add_parser("checks", help="확인 항목 전체 실행: 하나라도 기대값과 다르면 종료 코드 1")
+    checks.add_argument("--only", nargs="+", choices=list(CHECKS), help="일부 항목만 실행")
+    checks.set_defaults(func=run_checks)
+
+    loudness = subparsers.add_parser("speed-loudness", help="세그먼트 볼륨 계산: 세그먼트별 pydub vs NumPy prefix sum")
+    loudness.add_argument("--minutes", type=float, default=60)
+    loudness.add_argument("--segments", type=int, default=None, help="세그먼트 수 (기본: 분당 약 333개)")
+    loudness.set_defaults(func=bench_speed_loudness)
+
+    vad_memory = subparsers.add_parser("speed-vad-memory", help="VAD 최대 메모리: pydub 전체 로드 vs ffmpeg 파이프 스트리밍")
+    vad_memory.add_argument("--minutes", type=float, default=30)
+    vad_memory.set_defaults(func=bench_speed_vad_memory)
+
+    diff = subparsers.add_parser("diff-engine", help="스크립트 비교: 문자열 토큰 difflib vs 정수 토큰 diff_engine (회귀 코퍼스가 다르면 종료 코드 1)")
+    diff.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 30, 60])
+    diff.add_argument("--error-rate", type=float, default=0.1)
+    diff.add_argument("--cases", type=int, default=200)
+    diff.set_defaults(func=bench_diff_engine)
+
+    whisper_chunks = subparsers.add_parser("whisper-chunks", help="Whisper 변환: 한 번에 전송 vs 무음 구간 청크 동시 전송 (가짜 서버)")
+    whisper_chunks.add_argument("--minutes", type=float, default=60)
+    whisper_chunks.add_argument("--chunk-seconds", type=float, default=600)
+    whisper_chunks.add_argument("--latency", type=float, default=0.02, help="가짜 서버의 오디오 1초당 응답 지연(초)")
+    whisper_chunks.set_defaults(func=bench_whisper_chunks)
+
+    stitch = subparsers.add_parser("whisper-stitch", help="Whisper 청크: 정해진 VAD 구간/가짜 응답으로 분할 위치와 이어 붙인 결과 확인")
+    stitch.set_defaults(func=lambda args: exit_on_failure(check_whisper_stitch()))
+
+    face = subparsers.add_parser("face-prefilter", help="얼굴 사전 필터: 라벨된 프레임에서 놓친 얼굴 비율과 절약한 API 호출 수")
+    face.add_argument("--labelled-dir", required=True, help="face/와 noface/ 하위 폴더에 프레임 이미지가 있는 디렉터리")
+    face.add_argument("--detector", choices=["haar", "yunet"], default="haar")
+    face.add_argument("--model", help="yunet onnx 경로 또는 Haar cascade 디렉터리")
+    face.add_argument("--width", type=int, default=320)
+    face.set_defaults(func=bench_face_prefilter)
+
+    mosaic = subparsers.add_parser("emotion-mosaic", help="감정 분석: 프레임별 detect_faces vs 모자이크 배치 (호출 수, 결과 일치도)")
+    mosaic.add_argument("--frames-dir", required=True, help="샘플 프레임(jpg/png) 디렉터리")
+    mosaic.add_argument("--sizes", type=int, nargs="+", default=[4, 9, 16])
+    mosaic.add_argument("--verbose", action="store_true", help="결과가 다른 프레임 이름을 출력")
+    mosaic.set_defaults(func=bench_emotion_mosaic)
+
+    deadline = subparsers.add_parser("emotion-deadline", help="감정 분석 호출 마감: 응답 없는 프레임만 error, 마감 후 바로 반환 (가짜 클라이언트)")
+    deadline.add_argument("--frames", type=int, default=8)
+    deadline.add_argument("--slow", type=int, nargs="+", default=[1, 5], help="응답하지 않는 프레임 번호")
+    deadline.add_argument("--max-in-flight", type=int, default=4)
+    deadline.add_argument("--timeout", type=float, default=1.0)
+    deadline.set_defaults(func=lambda args: exit_on_failure(
+        check_emotion_deadline(args.frames, args.slow, args.max_in_flight, args.timeout)
+    ))
+
+    budget = subparsers.add_parser("token-budget", help="스크립트 max_tokens: 기존 공식 vs 토크나이저 보정 예산 (지연, 잘림/분량 부족 비율)")
+    budget.add_argument("--durations", type=int, nargs="+", default=[3, 5, 10])
+    budget.add_argument("--samples", type=int, default=3)
+    budget.add_argument("--scripts", help="생성된 스크립트(.txt) 디렉터리: 보정값 측정 (API 호출 없음)")
+    budget.add_argument("--tolerance", type=float, default=0.1, help="목표 발표 시간보다 이 비율 이상 짧으면 분량 부족")
+    budget.add_argument("--topic", default="인공지능의 현재와 미래")
+    budget.add_argument("--purpose", default="정보 공유")
+    budget.add_argument("--summary", default="인공지능 기술의 발전 과정과 일상생활에 미치는 영향, 앞으로의 과제")
+    budget.set_defaults(func=bench_token_budget)
+
+    stt = subparsers.add_parser("stt-backends", help="STT 백엔드 비교: 처리 시간, 실시간 배율, (스크립트가 있으면) 정확도")
+    stt.add_argument("--audio", required=True, help="발표 녹음 파일 (ffmpeg가 읽을 수 있는 형식)")
+    stt.add_argument("--script", help="원본 스크립트 텍스트 파일")
+    stt.add_argument("--backends", nargs="+", default=["openai", "local"])
+    stt.set_defaults(func=bench_stt_backends)
+
+    analysis_audio = subparsers.add_parser("analysis-audio", help="오디오 산출물: 재생용 mp3 vs 분석용 16kHz 모노 Opus (크기, VAD 일치)")
+    analysis_audio.add_argument("--audio", help="발표 녹음 파일 (없으면 합성 오디오)")
+    analysis_audio.add_argument("--minutes", type=float, default=10)
+    analysis_audio.set_defaults(func=bench_analysis_audio)
+
+    disconnect = subparsers.add_parser("script-stream-disconnect", help="스크립트 스트림: 연결이 끊긴 뒤 같은 요청이 완료되는지 확인 (가짜 서버)")
+    disconnect.add_argument("--chunk-delay", type=float, default=0.2, help="가짜 서버의 스트림 조각 간격(초)")
+    disconnect.add_argument("--timeout", type=float, default=10)
+    disconnect.set_defaults(func=lambda args: exit_on_failure(check_script_stream_disconnect(args.chunk_delay, args.timeout)))
+
+    startup = subparsers.add_parser("startup", help="end:app 시작 시간: 지연 마운트 vs 모든 백엔드 앱 즉시 import (새 프로세스)")
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--path", default="/ai/", help="첫 요청 경로 (해당 백엔드 앱만 불러옴)")
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
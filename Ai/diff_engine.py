@@ -0,0 +1,139 @@
+import re
+import difflib
+
+# 원본 스크립트와 변환 텍스트의 토큰 단위 비교 (whisper_test.py 등에서 공통으로 사용)
+#
+# 정확도(diff_count)가 기존 결과와 같아야 하므로 정렬은 difflib.SequenceMatcher의 규칙
+# (autojunk, 가장 긴 일치 블록 우선, opcode 묶음)을 그대로 따릅니다. 토큰은 정수 ID로 바꿔 비교하고
+# HTML은 조각을 모아 한 번에 join합니다.
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def tokenize_with_punctuation(text: str):
+    return TOKEN_PATTERN.findall(text)
+
+def intern_tokens(orig_tokens, trans_tokens):
+    """두 토큰 리스트의 같은 토큰에 같은 정수 ID를 붙여 정수 리스트로 바꿉니다."""
+    ids = {}
+    orig_ids = [ids.setdefault(token, len(ids)) for token in orig_tokens]
+    trans_ids = [ids.setdefault(token, len(ids)) for token in trans_tokens]
+    return orig_ids, trans_ids
+
+def get_opcodes(a, b):
+    """
+    difflib.SequenceMatcher.get_opcodes와 같은 (태그, i1, i2, j1, j2) 리스트를 반환합니다.
+    같은 토큰은 같은 ID를 가지므로 문자열 리스트로 비교한 결과와 동일합니다.
+    """
+    return difflib.SequenceMatcher(None, a, b).get_opcodes()
+
+def highlight_diff_in_orig(orig_token: str, trans_token: str) -> str:
+    i = 0
+    min_len = min(len(orig_token), len(trans_token))
+    while i < min_len and orig_token[i] == trans_token[i]:
+        i += 1
+    j = 0
+    while j < (min_len - i) and orig_token[-1 - j] == trans_token[-1 - j]:
+        j += 1
+    diff_end = len(orig_token) - j
+    if i == diff_end:
+        return orig_token
+    return f'{orig_token[:i]}<span class="diff-delete">{orig_token[i:diff_end]}</span>{orig_token[diff_end:]}'
+
+def render_opcodes(opcodes, orig_tokens, trans_tokens, diff_parts: list) -> int:
+    """opcodes를 HTML 조각으로 바꿔 diff_parts에 추가하고, 일치하지 않은 원본 토큰 수를 반환합니다."""
+    diff_count = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            diff_parts.extend(orig_tokens[i1:i2])
+        elif tag == "replace" and (i2 - i1) == (j2 - j1):
+            # 같은 길이로 바뀐 구간은 토큰끼리 짝지어 달라진 글자만 표시
+            for o_token, t_token in zip(orig_tokens[i1:i2], trans_tokens[j1:j2]):
+                if o_token == t_token:
+                    diff_parts.append(o_token)
+                else:
+                    diff_count += 1
+                    diff_parts.append(highlight_diff_in_orig(o_token, t_token))
+        elif tag in ("replace", "delete"):
+            diff_count += i2 - i1
+            diff_parts.extend(f'<span class="diff-delete">{token}</span>' for token in orig_tokens[i1:i2])
+    return diff_count
+
+def create_diff_html_and_count(orig: str, trans: str) -> (str, int):
+    """
+    원본 스크립트 토큰 중 변환 텍스트와 일치하지 않는 토큰을 <span class="diff-delete">로 표시한 HTML과
+    그런 토큰 수를 반환합니다. 변환 텍스트에만 있는 토큰(insert)은 표시하지 않습니다.
+    """
+    orig_tokens = tokenize_with_punctuation(orig)
+    trans_tokens = tokenize_with_punctuation(trans)
+    orig_ids, trans_ids = intern_tokens(orig_tokens, trans_tokens)
+    diff_parts = []
+    diff_count = render_opcodes(get_opcodes(orig_ids, trans_ids), orig_tokens, trans_tokens, diff_parts)
+    return " ".join(diff_parts), diff_count
+
+class IncrementalAligner:
+    """
+    변환 텍스트가 조각(청크, 세그먼트)으로 도착할 때마다 원본 스크립트의 커서를 앞으로 옮기며 정렬합니다.
+    새 조각은 커서 이후의 스크립트 창(도착한 토큰 수 + 여유분)과만 비교하고, 마지막 hold_tokens개 토큰은
+    다음 조각과 함께 다시 정렬하도록 남겨 둡니다. 확정된 부분의 정확도와 diff HTML은 snapshot()으로 얻습니다.
+    전체 결과와 같은 값이 필요하면 마지막에 create_diff_html_and_count를 사용합니다 (부분 결과는 미리보기).
+    """
+    def __init__(self, orig: str, hold_tokens: int = 8, min_slack: int = 50, slack_ratio: float = 0.5):
+        self.orig_tokens = tokenize_with_punctuation(orig)
+        self.ids = {}
+        self.orig_ids = [self.ids.setdefault(token, len(self.ids)) for token in self.orig_tokens]
+        self.hold_tokens = hold_tokens
+        self.min_slack = min_slack
+        self.slack_ratio = slack_ratio
+        self.cursor = 0
+        self.pending = []  # 아직 확정하지 않은 변환 토큰
+        self.diff_parts = []
+        self.diff_count = 0
+
+    def feed(self, text: str) -> dict:
+        self.pending.extend(tokenize_with_punctuation(text))
+        self._advance(final=False)
+        return self.snapshot()
+
+    def finish(self) -> dict:
+        self._advance(final=True)
+        return self.snapshot()
+
+    def _advance(self, final: bool):
+        if final:
+            window_end = len(self.orig_tokens)
+        else:
+            slack = max(self.min_slack, int(len(self.pending) * self.slack_ratio))
+            window_end = min(len(self.orig_tokens), self.cursor + len(self.pending) + slack)
+        orig_window = self.orig_ids[self.cursor:window_end]
+        trans_ids = [self.ids.setdefault(token, len(self.ids)) for token in self.pending]
+        opcodes = get_opcodes(orig_window, trans_ids)
+        if not final:
+            # 뒤쪽 hold_tokens개 안에서 끝나는 일치는 다음 조각에 따라 바뀔 수 있으므로 그 앞의 일치까지만 확정
+            limit = len(trans_ids) - self.hold_tokens
+            last = max((n for n, op in enumerate(opcodes) if op[0] == "equal" and op[3] < limit), default=None)
+            if last is None:
+                return
+            tag, i1, i2, j1, j2 = opcodes[last]
+            keep = min(j2, limit) - j1
+            opcodes = opcodes[:last] + [(tag, i1, i1 + keep, j1, j1 + keep)]
+        if not opcodes:
+            return
+        orig_end, trans_end = opcodes[-1][2], opcodes[-1][4]
+        self.diff_count += render_opcodes(
+            opcodes,
+            self.orig_tokens[self.cursor:self.cursor + orig_end],
+            self.pending[:trans_end],
+            self.diff_parts,
+        )
+        self.cursor += orig_end
+        del self.pending[:trans_end]
+
+    def snapshot(self) -> dict:
+        aligned = self.cursor
+        return {
+            "accuracy": ((aligned - self.diff_count) / aligned) * 100 if aligned > 0 else 100.0,
+            "diff_count": self.diff_count,
+            "diff_html": " ".join(self.diff_parts),
+            "aligned_tokens": aligned,
+            "total_tokens": len(self.orig_tokens),
+        }
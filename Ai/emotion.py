@@ -1,14 +1,18 @@
 import os
+import math
+import time
 import logging
+import threading
 import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List
 from collections import OrderedDict
 from dotenv import load_dotenv
-import re
-import difflib
 import io
+from results_store import results_store
 
 # 환경 변수 로드
 load_dotenv()
@@ -18,16 +22,60 @@ AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 
+# 동시 요청 수, 프레임당 타임아웃(초, 재시도와 백오프를 포함한 전체 시간), 스로틀링 시 최대 시도 횟수(첫 시도 포함)
+REKOGNITION_MAX_IN_FLIGHT = int(os.getenv("REKOGNITION_MAX_IN_FLIGHT", "8"))
+REKOGNITION_TIMEOUT = float(os.getenv("REKOGNITION_TIMEOUT", "10"))
+REKOGNITION_MAX_ATTEMPTS = int(os.getenv("REKOGNITION_MAX_ATTEMPTS", "5"))
+# 로컬 대체 서버(예: moto)로 테스트할 때 지정합니다.
+REKOGNITION_ENDPOINT_URL = os.getenv("REKOGNITION_ENDPOINT_URL")
+
 # AWS Rekognition 클라이언트 설정
+# 커넥션 풀 크기를 동시 요청 수에 맞추고, adaptive 모드로 스로틀링 시 클라이언트 측 속도 제한과 백오프를 적용합니다.
+# 시도마다 연결/읽기 타임아웃이 따로 적용되므로, 프레임당 전체 시간은 analyze_images에서 REKOGNITION_TIMEOUT으로 자릅니다.
 rekognition_client = boto3.client(
     "rekognition",
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION
+    region_name=AWS_REGION,
+    endpoint_url=REKOGNITION_ENDPOINT_URL,
+    config=Config(
+        max_pool_connections=REKOGNITION_MAX_IN_FLIGHT,
+        connect_timeout=REKOGNITION_TIMEOUT,
+        read_timeout=REKOGNITION_TIMEOUT,
+        retries={"total_max_attempts": REKOGNITION_MAX_ATTEMPTS, "mode": "adaptive"},
+    )
 )
 
 # AWS Rekognition에서 제공하는 감정 목록 (순서 지정)
 AWS_EMOTIONS = ["HAPPY", "SAD", "ANGRY", "CONFUSED", "DISGUSTED", "SURPRISED", "CALM", "FEAR"]
+# 결과에 포함할 최소 감정 신뢰도(%)
+MIN_CONFIDENCE = 90
+
+# 로컬 얼굴 사전 필터: 1이면 얼굴이 보이지 않는 프레임(화면 밖, 슬라이드 전체 화면 등)은 detect_faces를 호출하지 않습니다.
+FACE_PREFILTER = os.getenv("EMOTION_FACE_PREFILTER", "0") == "1"
+# 검출기: "haar"(OpenCV Haar cascade, 정면 + 측면) 또는 "yunet"(OpenCV DNN FaceDetectorYN, 모델 파일 필요)
+FACE_PREFILTER_DETECTOR = os.getenv("EMOTION_FACE_PREFILTER_DETECTOR", "haar")
+# yunet 모델(onnx) 경로 또는 Haar cascade xml이 있는 디렉터리 (비우면 cv2.data.haarcascades)
+FACE_PREFILTER_MODEL = os.getenv("EMOTION_FACE_PREFILTER_MODEL", "")
+# 검출 전에 프레임을 이 너비로 줄입니다 (그레이스케일).
+FACE_PREFILTER_WIDTH = int(os.getenv("EMOTION_FACE_PREFILTER_WIDTH", "320"))
+
+# 모자이크 배치: 2 이상이면 프레임을 최대 이 개수만큼 격자 한 장으로 이어 붙여 detect_faces를 한 번만 호출합니다 (예: 16 → 4x4).
+MOSAIC_SIZE = int(os.getenv("EMOTION_MOSAIC_SIZE", "0"))
+# 격자 한 칸의 크기(픽셀). 4x4 격자가 1920x1080이 되는 기본값이며, 프레임은 비율을 유지한 채 칸 안에 맞춥니다.
+MOSAIC_TILE_WIDTH = int(os.getenv("EMOTION_MOSAIC_TILE_WIDTH", "480"))
+MOSAIC_TILE_HEIGHT = int(os.getenv("EMOTION_MOSAIC_TILE_HEIGHT", "270"))
+
+# 분석 결과 캐시 키에 포함되는 파라미터 (판정 기준이 바뀌면 version을 올립니다)
+EMOTION_CACHE_PARAMS = {"version": 1, "min_confidence": MIN_CONFIDENCE, "emotions": AWS_EMOTIONS}
+if FACE_PREFILTER:
+    EMOTION_CACHE_PARAMS["face_prefilter"] = {
+        "detector": FACE_PREFILTER_DETECTOR,
+        "model": os.path.basename(FACE_PREFILTER_MODEL),
+        "width": FACE_PREFILTER_WIDTH,
+    }
+if MOSAIC_SIZE > 1:
+    EMOTION_CACHE_PARAMS["mosaic"] = {"size": MOSAIC_SIZE, "tile": [MOSAIC_TILE_WIDTH, MOSAIC_TILE_HEIGHT]}
 
 # 로깅 설정
 logging.basicConfig(
@@ -51,111 +99,289 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 전역 변수: vod.py에서 전달받은 최신 emotion 분석 결과 저장
-emotion_results_memory = None
+def store_emotion_results(result: dict, job_id: str = None) -> str:
+    """emotion 분석 결과를 작업(job_id)별로 결과 저장소에 저장합니다. vod.py가 같은 프로세스에서 실행될 때 직접 호출합니다."""
+    job_id = results_store.put("emotion", result, job_id)
+    logger.info("Emotion results updated successfully.")
+    return job_id
 
-# POST /update-results: vod.py에서 분석 결과를 업데이트할 때 호출
+# POST /update-results: vod.py에서 분석 결과를 업데이트할 때 호출 (분리 배포 시)
 @app.post("/update-results")
-async def update_emotion_results(result: dict):
-    global emotion_results_memory
-    emotion_results_memory = result
-    logger.info("Emotion results updated successfully.")
-    return {"message": "Emotion results updated successfully."}
+def update_emotion_results(result: dict, job_id: str = None):
+    job_id = store_emotion_results(result, job_id)
+    return {"message": "Emotion results updated successfully.", "job_id": job_id}
 
-# GET /analysis-results: 프론트엔드에서 최신 emotion 분석 결과를 가져갈 때 사용
+# GET /analysis-results: 프론트엔드에서 emotion 분석 결과를 가져갈 때 사용 (job_id가 없으면 가장 최근 결과)
 @app.get("/analysis-results")
-async def get_emotion_analysis():
-    if emotion_results_memory is None:
+def get_emotion_analysis(job_id: str = None):
+    result = results_store.get("emotion", job_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Emotion analysis results are not available.")
-    return emotion_results_memory
-
-# --- 이하 analyze_images 및 analyze_single_image 함수는 기존과 동일합니다 ---
-
-def tokenize_with_punctuation(text: str):
-    tokens = re.findall(r"\w+|[^\w\s]", text)
-    return tokens
-
-def highlight_diff_in_orig(orig_token: str, trans_token: str) -> str:
-    i = 0
-    min_len = min(len(orig_token), len(trans_token))
-    while i < min_len and orig_token[i] == trans_token[i]:
-        i += 1
-    j = 0
-    while j < (min_len - i) and orig_token[-1 - j] == trans_token[-1 - j]:
-        j += 1
-    prefix = orig_token[:i]
-    if j > 0:
-        diff_mid = orig_token[i:len(orig_token) - j]
-        suffix = orig_token[len(orig_token) - j:]
-    else:
-        diff_mid = orig_token[i:]
-        suffix = ""
-    if diff_mid:
-        diff_mid = f'<span class="diff-delete">{diff_mid}</span>'
-    return prefix + diff_mid + suffix
-
-def create_diff_html_and_count(orig: str, trans: str) -> (str, int):
-    orig_tokens = tokenize_with_punctuation(orig)
-    trans_tokens = tokenize_with_punctuation(trans)
-    matcher = difflib.SequenceMatcher(None, orig_tokens, trans_tokens)
-    diff_parts = []
-    diff_count = 0
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == "equal":
-            diff_parts.extend(orig_tokens[i1:i2])
-        elif tag == "delete":
-            tokens_del = orig_tokens[i1:i2]
-            diff_count += len(tokens_del)
-            for token in tokens_del:
-                diff_parts.append(f'<span class="diff-delete">{token}</span>')
-        elif tag == "replace":
-            orig_chunk = orig_tokens[i1:i2]
-            trans_chunk = trans_tokens[j1:j2]
-            if (i2 - i1) == (j2 - j1):
-                for o_token, t_token in zip(orig_chunk, trans_chunk):
-                    if o_token == t_token:
-                        diff_parts.append(o_token)
-                    else:
-                        diff_count += 1
-                        diff_parts.append(highlight_diff_in_orig(o_token, t_token))
+    return result
+
+# GET /prefilter-stats: 얼굴 사전 필터가 건너뛴 프레임 수(= 절약한 detect_faces 호출 수)
+@app.get("/prefilter-stats")
+async def get_prefilter_stats():
+    return face_prefilter.stats() if face_prefilter else {"enabled": False}
+
+class FacePrefilter:
+    """
+    축소한 그레이스케일 프레임에서 OpenCV로 얼굴 유무만 빠르게 판정합니다.
+    검출기를 쓸 수 없으면(모델 파일 없음 등) 모든 프레임을 통과시킵니다.
+    판정 기준은 놓치는 얼굴(false negative)이 적도록 느슨하게 잡았으며, 검출 결과는 사용하지 않습니다.
+    """
+    def __init__(self, detector: str = FACE_PREFILTER_DETECTOR, model: str = FACE_PREFILTER_MODEL,
+                 width: int = FACE_PREFILTER_WIDTH):
+        self.detector = detector
+        self.model = model
+        self.width = width
+        self.local = threading.local()  # OpenCV 검출기는 스레드마다 따로 만듭니다.
+        self.lock = threading.Lock()
+        self.counters = {"checked": 0, "skipped": 0, "passed": 0, "unavailable": 0}
+
+    def _detectors(self):
+        detectors = getattr(self.local, "detectors", None)
+        if detectors is None:
+            import cv2
+            if self.detector == "yunet":
+                if not self.model or not hasattr(cv2, "FaceDetectorYN"):
+                    raise RuntimeError("yunet 검출기에는 OpenCV FaceDetectorYN과 EMOTION_FACE_PREFILTER_MODEL(onnx)이 필요합니다.")
+                detectors = [cv2.FaceDetectorYN.create(self.model, "", (self.width, self.width), 0.6)]
             else:
-                diff_count += len(orig_chunk)
-                for o_token in orig_chunk:
-                    diff_parts.append(f'<span class="diff-delete">{o_token}</span>')
-        elif tag == "insert":
-            pass
-    return ' '.join(diff_parts), diff_count
-
-def analyze_single_image(image_bytes: bytes) -> dict:
+                if not hasattr(cv2, "CascadeClassifier"):
+                    raise RuntimeError("이 OpenCV 빌드에는 CascadeClassifier가 없습니다.")
+                cascade_dir = self.model or getattr(getattr(cv2, "data", None), "haarcascades", "")
+                detectors = []
+                for name in ("haarcascade_frontalface_default.xml", "haarcascade_profileface.xml"):
+                    cascade = cv2.CascadeClassifier(os.path.join(cascade_dir, name))
+                    if cascade.empty():
+                        raise RuntimeError(f"Haar cascade를 불러올 수 없습니다: {os.path.join(cascade_dir, name)}")
+                    detectors.append(cascade)
+            self.local.detectors = detectors
+        return detectors
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def has_face(self, image_bytes: bytes) -> bool:
+        import cv2
+        import numpy as np
+        self._count("checked")
+        try:
+            detectors = self._detectors()
+            image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            height, width = image.shape[:2]
+            scale = min(1.0, self.width / width)
+            small = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+            found = self._detect(detectors, small)
+        except Exception as e:
+            # 필터 오류로 얼굴을 놓치지 않도록 API 호출로 넘깁니다. (경고는 처음 한 번만 남깁니다)
+            if not self.counters["unavailable"]:
+                logger.warning(f"Face prefilter unavailable, sending frames to Rekognition: {e}")
+            self._count("unavailable")
+            return True
+        self._count("passed" if found else "skipped")
+        return found
+
+    def _detect(self, detectors, small) -> bool:
+        import cv2
+        if self.detector == "yunet":
+            detector = detectors[0]
+            detector.setInputSize((small.shape[1], small.shape[0]))
+            _, faces = detector.detect(small)
+            return faces is not None and len(faces) > 0
+        gray = cv2.equalizeHist(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+        frontal, profile = detectors
+        if len(frontal.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3, minSize=(20, 20))):
+            return True
+        # 측면 cascade는 한쪽 방향만 학습되어 있어 좌우 반전 영상도 확인합니다.
+        for candidate in (gray, cv2.flip(gray, 1)):
+            if len(profile.detectMultiScale(candidate, scaleFactor=1.1, minNeighbors=3, minSize=(20, 20))):
+                return True
+        return False
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"enabled": True, "detector": self.detector, "saved_calls": self.counters["skipped"], **self.counters}
+
+face_prefilter = FacePrefilter() if FACE_PREFILTER else None
+
+def analyze_images(images, max_in_flight: int = REKOGNITION_MAX_IN_FLIGHT, client=None,
+                   mosaic_size: int = MOSAIC_SIZE, timeout: float = REKOGNITION_TIMEOUT) -> list:
+    """
+    여러 이미지를 동시에 분석하고, 입력 순서대로 analyze_single_image 결과 리스트를 반환합니다.
+    동시에 진행 중인 detect_faces 호출은 max_in_flight개로 제한되며,
+    images가 제너레이터여도 그 이상 미리 읽어 두지 않습니다.
+    mosaic_size가 2 이상이면 프레임 mosaic_size장을 격자 한 장으로 묶어 호출합니다 (analyze_mosaic).
+    호출 하나(프레임 또는 모자이크 한 장)가 재시도를 포함해 timeout초 안에 끝나지 않으면 그 프레임들은 error 결과가 됩니다.
+    """
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    futures = []  # (future, 마감 시각, 프레임 수)
+    columns = math.ceil(math.sqrt(mosaic_size)) if mosaic_size > 1 else 0
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def submit(func, count, *args):
+        in_flight.acquire()
+        # 세마포어로 빈 작업 스레드가 있을 때만 제출하므로 바로 실행되고, 마감 시각은 제출 시점부터 셉니다.
+        future = executor.submit(func, *args)
+        future.add_done_callback(lambda _: in_flight.release())
+        futures.append((future, time.monotonic() + timeout, count))
+
+    def result(future, deadline, count):
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            logger.error(f"Rekognition call did not finish within {timeout}s")
+            error = {"error": f"Rekognition 응답이 {timeout}초 안에 오지 않았습니다."}
+            return [dict(error) for _ in range(count)] if columns else error
+
+    try:
+        if columns:
+            batch = []
+            for image_bytes in images:
+                batch.append(image_bytes)
+                if len(batch) == mosaic_size:
+                    submit(_analyze_batch, len(batch), batch, columns, client)
+                    batch = []
+            if batch:
+                submit(_analyze_batch, len(batch), batch, columns, client)
+            results = [frame for entry in futures for frame in result(*entry)]
+            logger.info(f"Mosaic batching: {len(results)} frames in {len(futures)} batches of up to {mosaic_size}")
+        else:
+            for image_bytes in images:
+                submit(analyze_single_image, 1, image_bytes, client)
+            results = [result(*entry) for entry in futures]
+    finally:
+        # 마감을 넘긴 호출을 기다리지 않습니다. 남은 스레드는 boto 재시도 한도 안에서 끝나고 결과는 버려집니다.
+        executor.shutdown(wait=False)
+    if face_prefilter is not None:
+        skipped = sum(1 for result in results if result.get("prefiltered"))
+        logger.info(f"Face prefilter skipped {skipped}/{len(results)} frames (total saved calls: {face_prefilter.stats()['saved_calls']})")
+    return results
+
+def _prefiltered(image_bytes: bytes, prefilter=None) -> bool:
+    prefilter = prefilter or face_prefilter
+    if prefilter is not None and not prefilter.has_face(image_bytes):
+        logger.debug("No face found by local prefilter, skipping detect_faces")
+        return True
+    return False
+
+def face_emotion_results(face_details: list) -> dict:
+    """얼굴마다 신뢰도 MIN_CONFIDENCE 이상인 AWS_EMOTIONS 중 가장 높은 감정을 골라 {"results": [...]}로 반환합니다."""
+    if not face_details:
+        logger.warning("No face detected in the image")
+        return {"results": []}
+    results = []
+    for face in face_details:
+        if "Emotions" in face:
+            high_confidence_emotions = [
+                {"emotion": e["Type"], "confidence": e["Confidence"]}
+                for e in face["Emotions"]
+                if e["Confidence"] >= MIN_CONFIDENCE and e["Type"] in AWS_EMOTIONS
+            ]
+            if high_confidence_emotions:
+                dominant_emotion = max(high_confidence_emotions, key=lambda x: x["confidence"])
+                results.append(dominant_emotion)
+    if not results:
+        logger.warning(f"No emotions detected with confidence >= {MIN_CONFIDENCE}%")
+        return {"results": []}
+    logger.info(f"Analysis complete: {results}")
+    return {"results": results}
+
+def analyze_single_image(image_bytes: bytes, client=None, prefilter=None) -> dict:
+    if _prefiltered(image_bytes, prefilter):
+        return {"results": [], "prefiltered": True}
+    return _detect_single(image_bytes, client)
+
+def _detect_single(image_bytes: bytes, client=None) -> dict:
+    client = client or rekognition_client
     try:
         logger.debug("Starting analysis of one image")
-        response = rekognition_client.detect_faces(
+        response = client.detect_faces(
             Image={"Bytes": image_bytes},
             Attributes=["ALL"]
         )
-        if not response["FaceDetails"]:
-            logger.warning("No face detected in the image")
-            return {"results": []}
-        results = []
-        for face in response["FaceDetails"]:
-            if "Emotions" in face:
-                high_confidence_emotions = [
-                    {"emotion": e["Type"], "confidence": e["Confidence"]}
-                    for e in face["Emotions"]
-                    if e["Confidence"] >= 90 and e["Type"] in AWS_EMOTIONS
-                ]
-                if high_confidence_emotions:
-                    dominant_emotion = max(high_confidence_emotions, key=lambda x: x["confidence"])
-                    results.append(dominant_emotion)
-        if not results:
-            logger.warning("No emotions detected with confidence >= 90%")
-            return {"results": []}
-        logger.info(f"Analysis complete: {results}")
-        return {"results": results}
+        return face_emotion_results(response["FaceDetails"])
     except Exception as e:
         logger.exception("Error during image analysis")
         return {"error": str(e)}
 
+def build_mosaic(images: list, columns: int, tile_size=(MOSAIC_TILE_WIDTH, MOSAIC_TILE_HEIGHT)):
+    """
+    프레임들을 columns열 격자 한 장(jpg)으로 이어 붙이고, (jpg 바이트, 디코딩에 실패한 프레임 인덱스 집합)을 반환합니다.
+    i번째 프레임은 (i // columns)행 (i % columns)열 칸의 가운데에 비율을 유지한 채 놓이고, 남는 부분은 검은색입니다.
+    """
+    import cv2
+    import numpy as np
+    tile_width, tile_height = tile_size
+    rows = math.ceil(len(images) / columns)
+    mosaic = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+    failed = set()
+    for index, image_bytes in enumerate(images):
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            failed.add(index)
+            continue
+        height, width = image.shape[:2]
+        scale = min(tile_width / width, tile_height / height)
+        resized_width, resized_height = max(1, int(width * scale)), max(1, int(height * scale))
+        resized = cv2.resize(image, (resized_width, resized_height), interpolation=cv2.INTER_AREA)
+        top = (index // columns) * tile_height + (tile_height - resized_height) // 2
+        left = (index % columns) * tile_width + (tile_width - resized_width) // 2
+        mosaic[top:top + resized_height, left:left + resized_width] = resized
+    ok, encoded = cv2.imencode(".jpg", mosaic, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("모자이크 이미지를 인코딩하지 못했습니다.")
+    return encoded.tobytes(), failed
+
+def split_mosaic_faces(face_details: list, count: int, columns: int) -> list:
+    """FaceDetails를 BoundingBox 중심이 놓인 격자 칸(= 원본 프레임)별로 나눕니다. 빈 칸에 놓인 얼굴은 버립니다."""
+    rows = math.ceil(count / columns)
+    per_frame = [[] for _ in range(count)]
+    for face in face_details:
+        box = face.get("BoundingBox")
+        if not box:
+            continue
+        column = int((box["Left"] + box["Width"] / 2) * columns)
+        row = int((box["Top"] + box["Height"] / 2) * rows)
+        index = row * columns + column
+        if 0 <= column < columns and 0 <= row < rows and index < count:
+            per_frame[index].append(face)
+    return per_frame
+
+def analyze_mosaic(images: list, columns: int, client=None) -> list:
+    """
+    프레임들을 격자 한 장으로 묶어 detect_faces를 한 번 호출하고, 프레임마다 analyze_single_image와 같은 형태의 결과를 반환합니다.
+    detect_faces는 이미지당 얼굴을 최대 100개까지 돌려주므로 한 장에 100프레임 이하로 묶어야 합니다.
+    """
+    client = client or rekognition_client
+    try:
+        logger.debug(f"Starting mosaic analysis of {len(images)} images")
+        mosaic, failed = build_mosaic(images, columns)
+        response = client.detect_faces(
+            Image={"Bytes": mosaic},
+            Attributes=["ALL"]
+        )
+    except Exception as e:
+        logger.exception("Error during mosaic analysis")
+        return [{"error": str(e)} for _ in images]
+    return [
+        {"error": "이미지를 디코딩할 수 없습니다."} if index in failed else face_emotion_results(faces)
+        for index, faces in enumerate(split_mosaic_faces(response["FaceDetails"], len(images), columns))
+    ]
+
+def _analyze_batch(images: list, columns: int, client=None) -> list:
+    """사전 필터를 통과한 프레임만 모자이크로 분석합니다. 한 장만 남으면 원본 해상도로 분석합니다."""
+    results = [{"results": [], "prefiltered": True} if _prefiltered(image_bytes) else None for image_bytes in images]
+    pending = [index for index, result in enumerate(results) if result is None]
+    if len(pending) == 1:
+        results[pending[0]] = _detect_single(images[pending[0]], client)
+    elif pending:
+        for index, result in zip(pending, analyze_mosaic([images[index] for index in pending], columns, client)):
+            results[index] = result
+    return results
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("emotion:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,12 +1,102 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+import importlib
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from vod import app as vod_app
-from speed import app as speed_app
-from main import app as main_app
-from whisper_test import app as whisper_app
-from emotion import app as emotion_app
+from fastapi.responses import JSONResponse
+from openai_client import openai_client
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# 1이면 서버 시작 직후 모든 백엔드 앱을 불러오고 외부 API 연결을 미리 만듭니다. 끝날 때까지 /ready는 503입니다.
+# 0(기본)이면 각 앱은 자기 경로로 첫 요청이 올 때 불러옵니다 (스크립트 생성만 하는 노드는 OpenCV 등을 불러오지 않음).
+END_WARMUP = os.getenv("END_WARMUP", "0") == "1"
+
+class LazyApp:
+    """
+    "모듈:속성" 형태의 ASGI 앱을 첫 요청 때 불러오는 래퍼입니다.
+    import는 스레드에서 실행되어 그동안에도 다른 경로의 요청을 처리하며, 동시에 온 첫 요청들은 한 번의 import를 함께 기다립니다.
+    """
+    def __init__(self, target: str):
+        self.target = target
+        self.module_name, _, self.attribute = target.partition(":")
+        self.app = None
+        self.lock = asyncio.Lock()
+
+    async def load(self):
+        if self.app is None:
+            async with self.lock:
+                if self.app is None:
+                    started = time.perf_counter()
+                    module = await asyncio.to_thread(importlib.import_module, self.module_name)
+                    app = getattr(module, self.attribute)
+                    # 마운트된 앱의 startup 핸들러는 Starlette가 실행하지 않으므로 불러올 때 실행합니다.
+                    await run_handlers(getattr(app.router, "on_startup", []))
+                    self.app = app
+                    logger.info(f"Loaded {self.target} in {time.perf_counter() - started:.2f}s")
+        return self.app
+
+    async def shutdown(self):
+        if self.app is not None:
+            await run_handlers(getattr(self.app.router, "on_shutdown", []))
+
+    async def __call__(self, scope, receive, send):
+        app = await self.load()
+        await app(scope, receive, send)
+
+async def run_handlers(handlers):
+    for handler in handlers:
+        if inspect.iscoroutinefunction(handler):
+            await handler()
+        else:
+            # 스레드 풀 종료처럼 오래 걸릴 수 있는 동기 핸들러가 이벤트 루프를 막지 않게 합니다.
+            await asyncio.to_thread(handler)
+
+# 경로별 백엔드 앱
+sub_apps = {
+    "/vod": LazyApp("vod:app"),
+    "/speed": LazyApp("speed:app"),
+    "/ai": LazyApp("main:app"),
+    "/whisper": LazyApp("whisper_test:app"),
+    "/emotion": LazyApp("emotion:app"),
+}
+ready = asyncio.Event()
+
+async def warmup():
+    """모든 백엔드 앱(Rekognition 클라이언트, 스레드/프로세스 풀 등)을 불러오고 OpenAI 연결을 미리 맺습니다."""
+    started = time.perf_counter()
+    try:
+        for lazy_app in sub_apps.values():
+            await lazy_app.load()
+        await openai_client.warmup()
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+    except Exception:
+        # 불러오지 못한 앱이 있으면 준비되지 않은 상태로 남겨 트래픽을 받지 않게 합니다.
+        logger.exception("Warm-up failed")
+        return
+    ready.set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = None
+    if END_WARMUP:
+        warmup_task = asyncio.create_task(warmup())
+    else:
+        ready.set()
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    # 불러온 앱의 shutdown 핸들러(스레드/프로세스 풀 정리 등)를 실행합니다.
+    for lazy_app in sub_apps.values():
+        await lazy_app.shutdown()
+    # 다른 스레드의 이벤트 루프에서 만든 연결까지 포함해 OpenAI 연결을 모두 닫습니다.
+    await openai_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,12 +106,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 각 백엔드 앱을 마운트합니다.
-app.mount("/vod", vod_app)
-app.mount("/speed", speed_app)
-app.mount("/ai", main_app)
-app.mount("/whisper", whisper_app)
-app.mount("/emotion", emotion_app)
+# 프로세스가 살아 있는지 확인 (liveness)
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+# 요청을 받을 준비가 되었는지 확인 (readiness). END_WARMUP=1이면 워밍업이 끝난 뒤 200을 반환합니다.
+@app.get("/ready")
+def readiness():
+    loaded = [prefix for prefix, lazy_app in sub_apps.items() if lazy_app.app is not None]
+    if not ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming_up", "loaded": loaded})
+    return {"status": "ready", "loaded": loaded}
+
+# 각 백엔드 앱을 마운트합니다. 앱 모듈은 첫 요청(또는 워밍업) 때 불러옵니다.
+for prefix, lazy_app in sub_apps.items():
+    app.mount(prefix, lazy_app)
 
 if __name__ == "__main__":
     # 개발 모드에서는 reload=True를 사용하지만,
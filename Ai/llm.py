@@ -1,6 +1,10 @@
 # llm.py
 import os
-import openai
+import json
+import asyncio
+import hashlib
+import logging
+from collections import Counter
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -8,15 +12,40 @@ from fastapi.requests import Request
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.exceptions import RequestValidationError
 from dotenv import load_dotenv
+from analysis_cache import analysis_cache
+from results_store import results_store
+from openai_client import openai_client, OpenAIAPIError
 
 # .env 파일 로드 (환경변수 설정)
 load_dotenv()
 
-# OpenAI API 키를 환경변수에서 불러옵니다.
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if not openai.api_key:
+# OpenAI API 키를 환경변수에서 확인합니다.
+if not openai_client.api_key:
     raise Exception("OPENAI_API_KEY가 설정되지 않았습니다. 환경변수를 확인하세요.")
 
+logger = logging.getLogger(__name__)
+
+# 총평 생성 모델과 지연 예산(초): 기본 모델이 시간 안에 답하지 못하면 빠른 모델로, 그것도 실패하면 템플릿 요약으로 대신합니다.
+FEEDBACK_MODEL = os.getenv("FEEDBACK_MODEL", "gpt-4")
+FEEDBACK_FALLBACK_MODEL = os.getenv("FEEDBACK_FALLBACK_MODEL", "gpt-3.5-turbo")
+FEEDBACK_TIMEOUT_SECONDS = float(os.getenv("FEEDBACK_TIMEOUT_SECONDS", "8"))
+FEEDBACK_FALLBACK_TIMEOUT_SECONDS = float(os.getenv("FEEDBACK_FALLBACK_TIMEOUT_SECONDS", "4"))
+FEEDBACK_TEMPERATURE = 0.5
+# 총평 캐시 키에 포함되는 파라미터 (프롬프트 형식이 바뀌면 version을 올립니다)
+FEEDBACK_CACHE_PARAMS = {
+    "version": 1,
+    "model": FEEDBACK_MODEL,
+    "fallback_model": FEEDBACK_FALLBACK_MODEL,
+    "temperature": FEEDBACK_TEMPERATURE,
+}
+
+# 긍정적 감정으로 보는 Rekognition 감정
+POSITIVE_EMOTIONS = {"HAPPY", "CALM"}
+EMOTION_NAMES = {
+    "HAPPY": "행복", "SAD": "슬픔", "ANGRY": "분노", "CONFUSED": "혼란",
+    "DISGUSTED": "혐오", "SURPRISED": "놀람", "CALM": "평온", "FEAR": "두려움",
+}
+
 app = FastAPI()
 
 # CORS 설정: 프론트엔드 주소 (http://localhost:3000)를 허용
@@ -45,43 +74,148 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         headers={"Access-Control-Allow-Origin": "http://localhost:3000"}
     )
 
-# 총평 생성 엔드포인트
-@app.post("/generate-feedback")
-async def generate_feedback():
-    # 분석 결과 데이터를 내부 저장소 또는 모듈에서 가져왔다고 가정합니다.
-    analysis_data = """
-[표정 분석 결과]
-- 발표자의 표정은 전반적으로 밝고 긍정적이나, 일부 긴장한 순간이 포착되었습니다.
-- 백데이터 기준: 이전 발표자들의 평균에서는 긍정적 감정(예: 행복, 평온)이 약 60~70% 수준입니다.
-
-[속도 분석 결과]
-- 발표자의 발화 속도는 청중이 이해하기에 적절한 수준입니다.
-- 백데이터 기준: 평균 발표자들의 세그먼트 지속시간은 약 2.0~2.5초입니다.
-
-[발음 및 텍스트 비교 결과]
-- Whisper API 기반 텍스트 비교 결과, 전반적으로 발음은 명확하나 일부 단어에서 부정확성이 있습니다.
-- 백데이터 기준: 평균 인식 정확도는 약 95%로 평가됩니다.
-"""
+# 총평에 사용하는 분석 단계
+ANALYSIS_STAGES = ("emotion", "speed", "whisper")
+
+def load_analysis_results(job_id: str = None) -> dict:
+    """
+    한 작업의 단계별 분석 결과를 가져옵니다. job_id가 없으면 가장 최근 작업 하나를 골라
+    그 작업의 결과만 사용합니다 (서로 다른 업로드의 결과를 섞지 않음).
+    """
+    job_id = job_id or results_store.latest_job_id(ANALYSIS_STAGES)
+    if not job_id:
+        return {}
+    results = results_store.get_job(job_id)
+    return {stage: value for stage, value in results.items() if stage in ANALYSIS_STAGES}
+
+def summarize_results(results: dict) -> dict:
+    """분석 결과에서 총평에 필요한 수치만 뽑습니다. 이 요약이 프롬프트와 캐시 키의 입력이 됩니다."""
+    summary = {}
+    frames = results.get("emotion")
+    if frames:
+        emotions = Counter(
+            face["emotion"] for frame in frames.values() for face in frame.get("results") or []
+        )
+        detected = sum(emotions.values())
+        summary["emotion"] = {
+            "frames": len(frames),
+            "frames_with_emotion": sum(1 for frame in frames.values() if frame.get("results")),
+            "distribution": {name: round(count / detected * 100, 1) for name, count in emotions.most_common()} if detected else {},
+            "positive_percent": round(sum(emotions[name] for name in POSITIVE_EMOTIONS) / detected * 100, 1) if detected else None,
+        }
+    segments = results.get("speed")
+    if segments:
+        rates = Counter(segment["rate"] for segment in segments)
+        summary["speed"] = {
+            "segments": len(segments),
+            "mean_segment_seconds": round(sum(segment["duration"] for segment in segments) / len(segments), 2),
+            "rate_percent": {rate: round(count / len(segments) * 100, 1) for rate, count in rates.most_common()},
+        }
+    whisper = results.get("whisper")
+    if whisper:
+        summary["whisper"] = {
+            "accuracy": round(whisper["accuracy"], 1),
+            "diff_count": whisper["diff_count"],
+        }
+    return summary
+
+def format_percentages(distribution: dict, names: dict = None) -> str:
+    return ", ".join(f"{(names or {}).get(key, key)} {value}%" for key, value in distribution.items())
+
+def create_analysis_data(summary: dict) -> str:
+    sections = []
+    emotion = summary.get("emotion")
+    if emotion:
+        lines = [f"- 분석한 프레임 {emotion['frames']}개 중 감정이 뚜렷하게(신뢰도 90% 이상) 드러난 프레임: {emotion['frames_with_emotion']}개"]
+        if emotion["distribution"]:
+            lines.append(f"- 감정 분포: {format_percentages(emotion['distribution'], EMOTION_NAMES)}")
+            lines.append(f"- 긍정적 감정(행복, 평온) 비율: {emotion['positive_percent']}%")
+        lines.append("- 백데이터 기준: 이전 발표자들의 평균에서는 긍정적 감정(예: 행복, 평온)이 약 60~70% 수준입니다.")
+        sections.append("[표정 분석 결과]\n" + "\n".join(lines))
+    speed = summary.get("speed")
+    if speed:
+        sections.append("[속도 분석 결과]\n" + "\n".join([
+            f"- 발화 세그먼트 {speed['segments']}개, 평균 세그먼트 지속시간 {speed['mean_segment_seconds']}초",
+            f"- 속도 분포: {format_percentages(speed['rate_percent'])}",
+            "- 백데이터 기준: 평균 발표자들의 세그먼트 지속시간은 약 2.0~2.5초입니다.",
+        ]))
+    whisper = summary.get("whisper")
+    if whisper:
+        sections.append("[발음 및 텍스트 비교 결과]\n" + "\n".join([
+            f"- Whisper 인식 정확도 {whisper['accuracy']}%, 스크립트와 다른 단어 {whisper['diff_count']}개",
+            "- 백데이터 기준: 평균 인식 정확도는 약 95%로 평가됩니다.",
+        ]))
+    return "\n\n".join(sections)
+
+def create_feedback_prompt(analysis_data: str) -> str:
     # 프롬프트 내에 "2~3줄"로 간략하게 작성해달라는 지시문을 추가합니다.
-    prompt = f"""
+    return f"""
 다음 데이터를 바탕으로, 공식적이고 객관적인 스타일로 총평을 한글로 2~3줄 정도로 간략하게 작성해 주세요.
 {analysis_data}
 
 “발표는 전반적으로 안정적이며 긍정적인 인상을 주었습니다. 표정은 주로 밝았으나 일부 순간에 긴장이 느껴졌고, 발음과 속도 모두 청중이 이해하기에 적절했습니다.”
 """
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
+
+def template_feedback(summary: dict) -> str:
+    """LLM이 지연 예산 안에 답하지 못할 때 수치만으로 만드는 총평."""
+    sentences = []
+    emotion = summary.get("emotion")
+    if emotion and emotion["positive_percent"] is not None:
+        tone = "밝고 안정적이었습니다" if emotion["positive_percent"] >= 60 else "다소 긴장된 모습이 보였습니다"
+        sentences.append(f"표정은 긍정적 감정이 {emotion['positive_percent']}%로 {tone}.")
+    speed = summary.get("speed")
+    if speed:
+        mean = speed["mean_segment_seconds"]
+        pace = "적절했습니다" if 2.0 <= mean <= 2.5 else ("다소 빨랐습니다" if mean < 2.0 else "다소 느렸습니다")
+        sentences.append(f"발화 속도는 평균 세그먼트 {mean}초로 {pace}.")
+    whisper = summary.get("whisper")
+    if whisper:
+        clarity = "명확했습니다" if whisper["accuracy"] >= 95 else "일부 단어에서 부정확했습니다"
+        sentences.append(f"발음은 인식 정확도 {whisper['accuracy']}%로 {clarity}.")
+    return " ".join(sentences)
+
+async def complete_feedback(model: str, prompt: str, timeout: float) -> str:
+    # timeout은 슬롯/한도 대기와 재시도를 포함한 전체 제한입니다. wait_for는 그마저 넘길 때를 위한 안전장치입니다.
+    response = await asyncio.wait_for(
+        openai_client.chat(
+            model,
+            [
                 {"role": "system", "content": "당신은 전문적인 발표 평가 전문가입니다."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.5
-        )
-        summary = response.choices[0].message.content
-        return {"feedback": summary}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            timeout=timeout,
+            temperature=FEEDBACK_TEMPERATURE
+        ),
+        timeout=timeout + 0.5
+    )
+    return response["choices"][0]["message"]["content"]
+
+# 총평 생성 엔드포인트
+# 저장된 분석 결과(job_id가 없으면 가장 최근 작업의 결과)로 프롬프트를 만들고, 같은 입력의 총평은 캐시에서 돌려줍니다.
+@app.post("/generate-feedback")
+async def generate_feedback(job_id: str = None):
+    results = await asyncio.to_thread(load_analysis_results, job_id)
+    if not results:
+        raise HTTPException(status_code=404, detail="총평을 만들 분석 결과가 없습니다.")
+    summary = summarize_results(results)
+    analysis_data = create_analysis_data(summary)
+    content_hash = hashlib.sha256(json.dumps(summary, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    cached = await asyncio.to_thread(analysis_cache.get, "feedback", content_hash, FEEDBACK_CACHE_PARAMS)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    prompt = create_feedback_prompt(analysis_data)
+    for model, timeout in ((FEEDBACK_MODEL, FEEDBACK_TIMEOUT_SECONDS), (FEEDBACK_FALLBACK_MODEL, FEEDBACK_FALLBACK_TIMEOUT_SECONDS)):
+        try:
+            feedback = {"feedback": await complete_feedback(model, prompt, timeout), "model": model}
+        except (asyncio.TimeoutError, OpenAIAPIError) as e:
+            logger.warning(f"Feedback generation with {model} failed within {timeout}s: {e!r}")
+            continue
+        await asyncio.to_thread(analysis_cache.put, "feedback", content_hash, FEEDBACK_CACHE_PARAMS, feedback)
+        return {**feedback, "cached": False}
+    # 템플릿 요약은 캐시하지 않아 다음 요청에서 다시 LLM을 시도합니다.
+    return {"feedback": template_feedback(summary), "model": "template", "cached": False}
 
 if __name__ == "__main__":
     import uvicorn
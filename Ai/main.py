@@ -1,12 +1,26 @@
-import os
 import re
+import json
+import asyncio
+import unicodedata
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import openai
+from openai_client import openai_client, OpenAIAPIError
+from script_cache import script_cache
+from token_budget import script_token_budget
 
-# OpenAI API 키 설정
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# 스크립트 생성 모델과 샘플링 온도
+SCRIPT_MODEL = "gpt-3.5-turbo"
+SCRIPT_TEMPERATURE = 0.7
+SCRIPT_SYSTEM_PROMPT = (
+    "당신은 수준 높은 발표 스크립트 작성 전문가입니다. "
+    "주어진 요구사항에 따라 체계적이고 매력적인 발표 스크립트를 작성해주세요. "
+    "스크립트는 청중의 관심을 사로잡고, 정보를 효과적으로 전달하며, "
+    "강력한 인상을 남길 수 있어야 합니다. "
+    "각 섹션의 길이 제한을 준수하고, "
+    "자연스러운 발표 흐름을 위한 적절한 전환어를 사용하세요."
+)
 
 app = FastAPI()
 
@@ -24,24 +38,44 @@ class PresentationRequest(BaseModel):
     summary: str    # 전달 내용
     duration: str   # 발표 시간
 
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def normalize_request(data: PresentationRequest) -> PresentationRequest:
+    """공백과 유니코드 정규화 차이만 있는 요청이 같은 캐시 키와 같은 프롬프트를 갖도록 정규화합니다."""
+    return PresentationRequest(
+        topic=normalize_text(data.topic),
+        purpose=normalize_text(data.purpose),
+        summary=normalize_text(data.summary),
+        duration="".join(data.duration.split()),
+    )
+
+def script_cache_key(data: PresentationRequest, max_tokens: int) -> str:
+    return script_cache.make_key({
+        "model": SCRIPT_MODEL,
+        "temperature": SCRIPT_TEMPERATURE,
+        "max_tokens": max_tokens,
+        "request": {
+            "topic": data.topic,
+            "purpose": data.purpose,
+            "summary": data.summary,
+            "duration": data.duration,
+        },
+    })
+
+def get_duration_minutes(duration: str) -> int:
+    return int(duration.replace("분", ""))
+
 def get_max_tokens(duration: str) -> int:
-    """발표 시간에 따른 최대 토큰 수 계산"""
-    duration_minutes = int(duration.replace("분", ""))
-    words_per_minute = 150
-    token_multiplier = 1.3
-    return int(duration_minutes * words_per_minute * token_multiplier)
-
-def create_presentation_prompt(data: PresentationRequest) -> tuple:
-    token_multiplier = 1.3  # 내부 계산에 사용할 multiplier
-    max_tokens = get_max_tokens(data.duration)
-    
-    # 섹션별 비율 설정 (도입부 20%, 본론 60%, 결론 20%)
-    section_tokens = {
-        "intro": int(max_tokens * 0.2),
-        "main": int(max_tokens * 0.6),
-        "conclusion": int(max_tokens * 0.2)
-    }
-    
+    """발표 시간에 따른 최대 토큰 수 계산 (한국어 발표 속도와 토크나이저로 측정한 음절당 토큰 수 기준, token_budget.py)"""
+    return script_token_budget(get_duration_minutes(duration))["max_tokens"]
+
+def create_presentation_prompt(data: PresentationRequest, budget: dict = None) -> tuple:
+    # 섹션별 목표 분량 (도입부 20%, 본론 60%, 결론 20%)
+    budget = budget or script_token_budget(get_duration_minutes(data.duration))
+    max_tokens = budget["max_tokens"]
+    section_words = {name: section["words"] for name, section in budget["sections"].items()}
+
     prompt = (
         "다음 조건에 맞는 전문적인 발표 스크립트를 작성해주세요:\n\n"
         f"1. 주제: {data.topic}\n"
@@ -53,18 +87,18 @@ def create_presentation_prompt(data: PresentationRequest) -> tuple:
         "   - 청중의 관심을 끌 수 있는 강력한 시작 (통계, 질문, 일화 등)\n"
         "   - 발표 주제와 목적의 명확한 제시\n"
         "   - 발표 순서 안내\n"
-        f"   - 길이: 약 {int(section_tokens['intro'] / token_multiplier)}단어\n\n"
+        f"   - 길이: 약 {section_words['intro']}단어\n\n"
         "2. 본론 (전체의 60%):\n"
         "   - 주요 논점을 2-3개로 명확히 구분\n"
         "   - 각 논점마다 구체적인 예시나 데이터 포함\n"
         "   - 논리적 흐름을 위한 적절한 전환어 사용\n"
         "   - 적절한 비유와 시각적 묘사 포함\n"
-        f"   - 길이: 약 {int(section_tokens['main'] / token_multiplier)}단어\n\n"
+        f"   - 길이: 약 {section_words['main']}단어\n\n"
         "3. 결론 (전체의 20%):\n"
         "   - 핵심 메시지 요약\n"
         "   - 청중에게 남기고 싶은 인상적인 마무리\n"
         "   - 실천 가능한 행동 제안이나 다음 단계 제시\n"
-        f"   - 길이: 약 {int(section_tokens['conclusion'] / token_multiplier)}단어\n\n"
+        f"   - 길이: 약 {section_words['conclusion']}단어\n\n"
         "발표 스타일 요구사항:\n"
         "1. 어조:\n"
         "   - 전문적이면서도 친근한 어조 사용\n"
@@ -89,6 +123,12 @@ def create_presentation_prompt(data: PresentationRequest) -> tuple:
     
     return prompt, max_tokens
 
+def create_script_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": SCRIPT_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
 def filter_sentences(text: str) -> str:
     """
     스크립트를 문장 단위로 분리한 후,
@@ -107,6 +147,71 @@ def filter_sentences(text: str) -> str:
     # 남은 문장을 다시 하나의 텍스트로 합칩니다.
     return " ".join(filtered_sentences)
 
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+SPECIAL_CHARS = re.compile(r'[\*\#\-]')
+
+class SentenceFilter:
+    """
+    스트리밍으로 도착하는 스크립트에 filter_sentences를 점진적으로 적용합니다.
+    feed는 새로 완성된 문장 중 특수문자가 없는 문장만 반환하고, finish는 남은 문장을 처리합니다.
+    모든 조각을 넣은 뒤의 script()는 전체 텍스트에 filter_sentences를 적용한 결과와 같습니다.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.kept = []
+
+    def _keep(self, sentences: list) -> list:
+        kept = [s for s in sentences if not SPECIAL_CHARS.search(s)]
+        self.kept.extend(kept)
+        return kept
+
+    def _split_lines(self, text: str) -> list:
+        sentences = []
+        for line in text.splitlines():
+            sentences.extend(SENTENCE_BOUNDARY.split(line))
+        return sentences
+
+    def feed(self, delta: str) -> list:
+        self.buffer += delta
+        sentences = []
+        # 개행까지 받은 줄은 확정입니다.
+        newline = self.buffer.rfind("\n")
+        if newline >= 0:
+            sentences.extend(self._split_lines(self.buffer[:newline + 1]))
+            self.buffer = self.buffer[newline + 1:]
+        # 마지막 줄에서는 문장부호 뒤 공백 다음에 글자가 이어진 경계까지만 확정합니다.
+        start = 0
+        for boundary in SENTENCE_BOUNDARY.finditer(self.buffer):
+            if boundary.end() == len(self.buffer):
+                break
+            sentences.append(self.buffer[start:boundary.start()])
+            start = boundary.end()
+        self.buffer = self.buffer[start:]
+        return self._keep(sentences)
+
+    def finish(self) -> list:
+        sentences = self._split_lines(self.buffer)
+        self.buffer = ""
+        return self._keep(sentences)
+
+    def script(self) -> str:
+        return " ".join(self.kept)
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """전송이 끝나거나 중단되면(연결 끊김, 취소 포함) 항상 on_close를 실행하는 StreamingResponse."""
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
 @app.get("/")
 def read_root():
     return {"message": "FastAPI AI Presentation Script Generator is running!"}
@@ -114,40 +219,33 @@ def read_root():
 @app.post("/ai/predict")
 async def predict(data: PresentationRequest):
     try:
-        if not openai.api_key:
+        if not openai_client.api_key:
             raise HTTPException(
                 status_code=500,
                 detail="OpenAI API key not configured"
             )
 
+        data = normalize_request(data)
         prompt, max_tokens = create_presentation_prompt(data)
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "당신은 수준 높은 발표 스크립트 작성 전문가입니다. "
-                        "주어진 요구사항에 따라 체계적이고 매력적인 발표 스크립트를 작성해주세요. "
-                        "스크립트는 청중의 관심을 사로잡고, 정보를 효과적으로 전달하며, "
-                        "강력한 인상을 남길 수 있어야 합니다. "
-                        "각 섹션의 길이 제한을 준수하고, "
-                        "자연스러운 발표 흐름을 위한 적절한 전환어를 사용하세요."
-                    )
-                },
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=0.7
-        )
-        
-        script = response.choices[0].message.content
-        # 생성된 스크립트에서 *, #, - 와 같은 특수문자가 포함된 문장을 완전히 삭제합니다.
-        filtered_script = filter_sentences(script)
+
+        async def generate():
+            response = await openai_client.chat(
+                SCRIPT_MODEL,
+                create_script_messages(prompt),
+                max_tokens=max_tokens,
+                temperature=SCRIPT_TEMPERATURE
+            )
+            script = response["choices"][0]["message"]["content"]
+            # 생성된 스크립트에서 *, #, - 와 같은 특수문자가 포함된 문장을 완전히 삭제합니다.
+            return filter_sentences(script)
+
+        # 같은 요청은 캐시된 스크립트를 쓰고, 같은 요청이 생성 중이면 그 결과를 함께 기다립니다.
+        filtered_script = await script_cache.get_or_create(script_cache_key(data, max_tokens), generate)
         return {"script": filtered_script}
-        
-    except openai.error.OpenAIError as e:
+
+    except HTTPException:
+        raise
+    except OpenAIAPIError as e:
         raise HTTPException(
             status_code=500,
             detail=f"OpenAI API 오류: {str(e)}"
@@ -158,6 +256,133 @@ async def predict(data: PresentationRequest):
             detail=f"서버 오류: {str(e)}"
         )
 
+@app.post("/ai/predict/stream")
+async def predict_stream(data: PresentationRequest):
+    """
+    /ai/predict와 같은 스크립트를 생성하면서 SSE로 보냅니다.
+    token(받은 조각 그대로) / sentence(특수문자 필터를 통과한 완성 문장)
+    → result({"script"}: /ai/predict 응답과 같음) 또는 error 순서입니다.
+    캐시된 스크립트가 있거나 같은 요청이 생성 중이면 token/sentence 없이 result만 보냅니다.
+    """
+    if not openai_client.api_key:
+        raise HTTPException(
+            status_code=500,
+            detail="OpenAI API key not configured"
+        )
+    data = normalize_request(data)
+    prompt, max_tokens = create_presentation_prompt(data)
+    key = script_cache_key(data, max_tokens)
+    state, value = script_cache.claim(key)
+    if state != "lead":
+        return ReleasingStreamingResponse(
+            shared_script_events(state, value),
+            release_waiter(state, value),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    try:
+        # 비동기 호출이라 생성 중에도 이벤트 루프가 막히지 않습니다.
+        stream = await openai_client.chat_stream(
+            SCRIPT_MODEL,
+            create_script_messages(prompt),
+            max_tokens=max_tokens,
+            temperature=SCRIPT_TEMPERATURE
+        )
+    except BaseException as e:
+        script_cache.fail(key, e)
+        if isinstance(e, OpenAIAPIError):
+            raise HTTPException(
+                status_code=500,
+                detail=f"OpenAI API 오류: {str(e)}"
+            )
+        raise
+
+    # 생성은 응답과 별도의 작업에서 진행합니다. 이 요청의 연결이 끊겨도 같은 요청을 기다리는 요청이 있으면 끝까지 생성하고,
+    # 기다리는 요청이 모두 떠나면 취소합니다.
+    events_queue = asyncio.Queue()
+    task = asyncio.create_task(generate_script_stream(key, value, stream, events_queue))
+    script_generations.add(task)
+
+    def finished(task):
+        script_generations.discard(task)
+        if task.cancelled():
+            # 시작하기 전에 취소된 작업은 generate_script_stream의 finally가 실행되지 않으므로 여기서 정리합니다.
+            script_cache.fail(key, RuntimeError("스크립트 생성이 중단되었습니다."), value)
+            cleanup = asyncio.ensure_future(stream.aclose())
+            script_generations.add(cleanup)
+            cleanup.add_done_callback(script_generations.discard)
+
+    task.add_done_callback(finished)
+    script_cache.on_abandoned(value, task.cancel)
+
+    async def events():
+        while True:
+            event, data = await events_queue.get()
+            yield sse_event(event, data)
+            if event in ("result", "error"):
+                break
+
+    async def release():
+        script_cache.leave(value)
+
+    return ReleasingStreamingResponse(
+        events(),
+        release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# 진행 중인 스트리밍 생성 작업 (작업이 끝나기 전에 가비지 컬렉션되지 않도록 참조를 유지합니다)
+script_generations = set()
+
+async def generate_script_stream(key: str, future, stream, events_queue: asyncio.Queue):
+    """스트림을 끝까지 읽어 token/sentence/result(또는 error) 이벤트를 events_queue에 넣고 캐시에 결과를 반영합니다."""
+    sentence_filter = SentenceFilter()
+    try:
+        async for chunk in stream:
+            delta = chunk["choices"][0]["delta"].get("content")
+            if not delta:
+                continue
+            events_queue.put_nowait(("token", {"text": delta}))
+            for sentence in sentence_filter.feed(delta):
+                events_queue.put_nowait(("sentence", {"text": sentence}))
+        for sentence in sentence_filter.finish():
+            events_queue.put_nowait(("sentence", {"text": sentence}))
+        script_cache.complete(key, sentence_filter.script(), future)
+        events_queue.put_nowait(("result", {"script": sentence_filter.script()}))
+    except Exception as e:
+        script_cache.fail(key, e, future)
+        events_queue.put_nowait(("error", {"detail": f"OpenAI API 오류: {str(e)}"}))
+    finally:
+        # 기다리는 요청이 모두 떠나 취소된 경우 등: 이 생성이 아직 남아 있으면 실패로 정리해 같은 요청이 다시 생성할 수 있게 합니다.
+        script_cache.fail(key, RuntimeError("스크립트 생성이 중단되었습니다."), future)
+        await stream.aclose()
+
+def release_waiter(state: str, value):
+    async def release():
+        # 같은 요청의 생성을 기다리던 요청이 떠났습니다 (결과를 받은 뒤에도 호출되며, 이때는 아무것도 하지 않습니다).
+        if state == "wait":
+            script_cache.leave(value)
+    return release
+
+async def shared_script_events(state: str, value):
+    """캐시된 스크립트(hit) 또는 같은 요청의 진행 중인 생성 결과(wait)를 result 이벤트로 보냅니다."""
+    try:
+        script = value if state == "hit" else await asyncio.shield(value)
+        yield sse_event("result", {"script": script})
+    except Exception as e:
+        yield sse_event("error", {"detail": f"OpenAI API 오류: {str(e)}"})
+
+# 스크립트 캐시 적중률과 절약한 OpenAI 호출 수 조회
+@app.get("/ai/script-cache/stats")
+def get_script_cache_stats():
+    return script_cache.stats()
+
+# 모델별 OpenAI 호출 수, 재시도, 지연, 토큰 사용량, 남은 요청 한도 조회
+@app.get("/ai/openai/stats")
+def get_openai_stats():
+    return openai_client.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=5000)
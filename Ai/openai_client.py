@@ -0,0 +1,563 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# OpenAI API 주소 (로컬 가짜 서버나 프록시로 바꿔 시험할 수 있음)
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1").rstrip("/")
+# 모델별 동시 호출 수 상한. OPENAI_MODEL_CONCURRENCY="gpt-4=2,gpt-3.5-turbo=8"처럼 모델마다 따로 줄 수 있습니다.
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_MODEL_CONCURRENCY = {
+    name.strip(): int(value)
+    for name, _, value in (item.partition("=") for item in os.getenv("OPENAI_MODEL_CONCURRENCY", "").split(","))
+    if name.strip() and value.strip()
+}
+# 429/5xx/연결 오류 재시도 횟수와 지수 백오프(전체 지터) 기준/상한(초)
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "0.5"))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "20"))
+# keep-alive 연결 풀 크기와 유휴 연결 유지 시간(초)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "30"))
+# 기본 타임아웃(초). 호출마다 timeout을 주면 재시도를 포함한 전체 시간 제한이 됩니다.
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# 응답이 오지 않은 것이 확실한 전송 오류만 재시도합니다 (읽기 시간 초과는 요청이 처리되었을 수 있어 제외).
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+LATENCY_WINDOW = 1000
+DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+class OpenAIAPIError(Exception):
+    """OpenAI 호출 실패. status_code는 HTTP 상태 코드 (응답을 받지 못했으면 None)."""
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class OpenAITimeoutError(OpenAIAPIError):
+    pass
+
+def parse_reset(value: str) -> float:
+    """x-ratelimit-reset-* 헤더("1s", "6m0s", "20ms")를 초로 바꿉니다."""
+    if not value:
+        return 0.0
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    try:
+        return float(value)
+    except ValueError:
+        return sum(float(number) * units[unit] for number, unit in DURATION_PART.findall(value))
+
+def retry_after(response: httpx.Response) -> float:
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return 0.0
+
+def estimate_chat_tokens(messages: list, max_tokens: int = None) -> int:
+    """토큰 한도에서 차감될 양의 근사치: 프롬프트 토큰 + 최대 출력 토큰 (OpenAI도 max_tokens를 미리 차감합니다)."""
+    from token_budget import estimate_tokens
+    prompt = sum(estimate_tokens(message.get("content") or "") + 4 for message in messages)
+    return prompt + (max_tokens or 0)
+
+class TokenBucket:
+    """
+    응답 헤더(limit/remaining/reset)로 맞춰지는 토큰 버킷. 헤더를 받기 전에는 제한하지 않습니다.
+    reserve는 비용을 먼저 차감하고 기다릴 시간을 돌려주므로, 동시에 들어온 호출들이 순서대로 나뉘어 기다립니다.
+    """
+    def __init__(self):
+        self.capacity = None
+        self.level = 0.0
+        self.rate = 0.0  # 초당 회복량
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def sync(self, limit: int, remaining: int, reset_seconds: float):
+        now = time.monotonic()
+        self.capacity = limit
+        # 한도는 분 단위로 회복됩니다. reset까지 남은 양이 모두 회복된다고 보고 속도를 정합니다.
+        used = limit - remaining
+        self.rate = used / reset_seconds if used > 0 and reset_seconds > 0 else limit / 60
+        self.level = remaining
+        self.updated = now
+
+    def drain(self, seconds: float):
+        """429를 받으면 seconds 동안 새 호출이 나가지 않도록 비웁니다."""
+        if self.capacity is None:
+            return
+        self._refill(time.monotonic())
+        self.level = min(self.level, -seconds * self.rate)
+
+    def reserve(self, cost: float) -> float:
+        now = time.monotonic()
+        if self.capacity is None:
+            return 0.0
+        self._refill(now)
+        # 한 번에 한도보다 큰 요청은 버킷이 가득 찰 때까지만 기다립니다.
+        self.level -= min(cost, self.capacity)
+        if self.level >= 0 or self.rate <= 0:
+            return 0.0
+        return -self.level / self.rate
+
+class ModelState:
+    """모델별 동시 호출 슬롯, 요청/토큰 버킷, 지표."""
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {
+            "calls": 0, "errors": 0, "retries": 0, "rate_limited": 0, "in_flight": 0,
+            "throttled_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+        }
+
+    def count(self, name: str, delta: int = 1):
+        with self.lock:
+            self.counters[name] += delta
+
+    def reserve(self, tokens: int) -> float:
+        with self.lock:
+            wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+            self.counters["throttled_seconds"] += wait
+        return wait
+
+    def observe(self, response: httpx.Response):
+        headers = response.headers
+        with self.lock:
+            for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                try:
+                    limit = int(headers[f"x-ratelimit-limit-{kind}"])
+                    remaining = int(headers[f"x-ratelimit-remaining-{kind}"])
+                except (KeyError, ValueError):
+                    continue
+                bucket.sync(limit, remaining, parse_reset(headers.get(f"x-ratelimit-reset-{kind}")))
+            if response.status_code == 429:
+                self.counters["rate_limited"] += 1
+                self.requests.drain(retry_after(response))
+
+    def record(self, started: float, ok: bool, usage: dict = None):
+        with self.lock:
+            self.counters["calls"] += 1
+            if ok:
+                self.latencies.append(time.perf_counter() - started)
+            else:
+                self.counters["errors"] += 1
+            if usage:
+                self.counters["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                self.counters["completion_tokens"] += usage.get("completion_tokens") or 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            counters = dict(self.counters)
+        percentile = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+        counters["throttled_seconds"] = round(counters["throttled_seconds"], 3)
+        return {
+            "concurrency": self.concurrency,
+            **counters,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "requests_remaining": round(self.requests.level, 1) if self.requests.capacity is not None else None,
+            "tokens_remaining": round(self.tokens.level, 1) if self.tokens.capacity is not None else None,
+        }
+
+class OpenAIClient:
+    """
+    OpenAI HTTP API 공유 클라이언트. 스크립트 생성(main.py), 총평(llm.py), Whisper 변환(stt_backends.py)이 함께 사용합니다.
+    - keep-alive 연결 풀: 동기(httpx.Client, 스레드 풀의 Whisper 호출)와 비동기(httpx.AsyncClient, 이벤트 루프별) 클라이언트
+    - 모델별 동시 호출 상한: 동기/비동기 호출이 같은 세마포어를 나눠 씁니다.
+    - 요청/토큰 버킷: 응답의 x-ratelimit-* 헤더로 남은 한도를 맞추고, 한도를 넘을 호출은 보내기 전에 기다립니다.
+    - 429/5xx/연결 오류는 retry-after와 지수 백오프(전체 지터)로 재시도합니다.
+    - 모델별 호출 수, 오류, 재시도, 지연(p50/p95), 토큰 사용량 지표
+    """
+    def __init__(self, api_base: str = OPENAI_API_BASE, max_retries: int = OPENAI_MAX_RETRIES):
+        self.api_base = api_base
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.models = {}
+        self.sync_client = None
+        self.async_clients = {}  # 이벤트 루프 -> httpx.AsyncClient (AsyncClient는 만든 루프에서만 쓸 수 있음)
+
+    @property
+    def api_key(self) -> str:
+        return os.getenv("OPENAI_API_KEY")
+
+    def _headers(self, api_key: str = None) -> dict:
+        return {"Authorization": f"Bearer {api_key or self.api_key}"}
+
+    def _client_options(self) -> dict:
+        return {
+            "timeout": httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            "limits": httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+            ),
+        }
+
+    def _sync_client(self) -> httpx.Client:
+        with self.lock:
+            if self.sync_client is None:
+                self.sync_client = httpx.Client(**self._client_options())
+            return self.sync_client
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            client = self.async_clients.get(loop)
+            if client is None:
+                # 닫힌 루프의 클라이언트는 더 쓸 수 없으므로 정리합니다. 여기까지 남아 있다면 루프가 끝나기 전에 닫지 않은 것입니다.
+                for key in [key for key in self.async_clients if key.is_closed()]:
+                    del self.async_clients[key]
+                    logger.warning("OpenAI async client was not closed before its event loop closed (use openai_client.run)")
+                client = self.async_clients[loop] = httpx.AsyncClient(**self._client_options())
+            return client
+
+    async def aclose_loop(self):
+        """현재 이벤트 루프에서 만든 AsyncClient를 닫습니다. 루프가 끝나기 전에 호출해야 연결이 정리됩니다."""
+        with self.lock:
+            client = self.async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def run(self, coroutine):
+        """asyncio.run처럼 새 이벤트 루프에서 coroutine을 실행하고, 루프를 닫기 전에 그 루프의 AsyncClient를 닫습니다."""
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await self.aclose_loop()
+        return asyncio.run(main())
+
+    def model(self, name: str) -> ModelState:
+        with self.lock:
+            state = self.models.get(name)
+            if state is None:
+                state = self.models[name] = ModelState(OPENAI_MODEL_CONCURRENCY.get(name, OPENAI_MAX_CONCURRENCY))
+            return state
+
+    def limit_concurrency(self, name: str, concurrency: int):
+        """모델의 동시 호출 상한을 정합니다 (OPENAI_MODEL_CONCURRENCY에 지정된 값이 우선). 호출이 시작되기 전에 사용합니다."""
+        with self.lock:
+            if name not in self.models:
+                self.models[name] = ModelState(OPENAI_MODEL_CONCURRENCY.get(name, concurrency))
+
+    def _backoff(self, attempt: int, response: httpx.Response = None) -> float:
+        delay = random.uniform(0, min(OPENAI_BACKOFF_MAX_SECONDS, OPENAI_BACKOFF_BASE_SECONDS * 2 ** attempt))
+        if response is not None:
+            delay = max(delay, retry_after(response))
+        return delay
+
+    @staticmethod
+    def _error(response: httpx.Response) -> OpenAIAPIError:
+        try:
+            message = response.json()["error"]["message"]
+        except Exception:
+            message = response.text[:500]
+        return OpenAIAPIError(f"HTTP {response.status_code}: {message}", response.status_code)
+
+    @staticmethod
+    def _timeout(deadline: float):
+        """남은 시간으로 이번 시도의 httpx 타임아웃을 정합니다. deadline이 없으면 클라이언트 기본값."""
+        if deadline is None:
+            return httpx.USE_CLIENT_DEFAULT
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise OpenAITimeoutError("OpenAI 호출 시간 초과")
+        return httpx.Timeout(remaining)
+
+    @classmethod
+    def _attempt_timeout(cls, request_timeout: httpx.Timeout, deadline: float):
+        """시도마다의 타임아웃(request_timeout)을 남은 시간 안으로 줄입니다."""
+        if deadline is None or request_timeout is None:
+            return request_timeout or cls._timeout(deadline)
+        remaining = cls._timeout(deadline).read
+        cap = lambda value: remaining if value is None else min(value, remaining)
+        return httpx.Timeout(
+            connect=cap(request_timeout.connect), read=cap(request_timeout.read),
+            write=cap(request_timeout.write), pool=cap(request_timeout.pool),
+        )
+
+    def _retry_delay(self, attempt: int, deadline: float, response: httpx.Response = None):
+        """재시도할 수 있으면 기다릴 시간을, 아니면 None을 반환합니다."""
+        if attempt >= self.max_retries:
+            return None
+        delay = self._backoff(attempt, response)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    async def _acquire(self, state: ModelState, deadline: float):
+        # 스레드 풀의 동기 호출과 같은 세마포어를 쓰므로 막지 않고 짧게 기다리며 다시 시도합니다.
+        delay = 0.005
+        while not state.slots.acquire(blocking=False):
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise OpenAITimeoutError("OpenAI 동시 호출 슬롯 대기 시간 초과")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    async def _send(self, state: ModelState, build_request, deadline: float, tokens: int, stream: bool = False) -> httpx.Response:
+        """슬롯을 잡은 상태에서 호출합니다. 성공(2xx) 응답을 반환하고, 실패하면 재시도 후 OpenAIAPIError를 던집니다."""
+        client = self._async_client()
+        attempt = 0
+        while True:
+            wait = state.reserve(tokens)
+            if wait:
+                if deadline is not None and time.monotonic() + wait >= deadline:
+                    raise OpenAITimeoutError("OpenAI 요청 한도 대기 시간이 제한 시간을 넘습니다.", 429)
+                await asyncio.sleep(wait)
+            try:
+                response = await client.send(build_request(client, self._timeout(deadline)), stream=stream)
+            except httpx.TimeoutException as e:
+                if isinstance(e, RETRYABLE_ERRORS):
+                    delay = self._retry_delay(attempt, deadline)
+                    if delay is not None:
+                        state.count("retries")
+                        attempt += 1
+                        await asyncio.sleep(delay)
+                        continue
+                raise OpenAITimeoutError(f"OpenAI 호출 시간 초과: {e!r}") from e
+            except RETRYABLE_ERRORS as e:
+                delay = self._retry_delay(attempt, deadline)
+                if delay is None:
+                    raise OpenAIAPIError(f"OpenAI 연결 실패: {e!r}") from e
+                state.count("retries")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except httpx.HTTPError as e:
+                raise OpenAIAPIError(f"OpenAI 호출 실패: {e!r}") from e
+            state.observe(response)
+            if response.is_success:
+                return response
+            if stream:
+                await response.aread()
+                await response.aclose()
+            delay = self._retry_delay(attempt, deadline, response) if response.status_code in RETRYABLE_STATUS else None
+            if delay is None:
+                raise self._error(response)
+            logger.warning(f"OpenAI HTTP {response.status_code}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+            state.count("retries")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def chat(self, model: str, messages: list, timeout: float = None, **params) -> dict:
+        """
+        Chat Completions를 호출하고 응답 JSON(dict)을 반환합니다.
+        timeout(초)은 한도 대기와 재시도를 포함한 전체 제한 시간입니다.
+        """
+        state = self.model(model)
+        deadline = time.monotonic() + timeout if timeout else None
+        body = {"model": model, "messages": messages, **params}
+        build = lambda client, request_timeout: client.build_request(
+            "POST", f"{self.api_base}/chat/completions", json=body, headers=self._headers(), timeout=request_timeout
+        )
+        started = time.perf_counter()
+        await self._acquire(state, deadline)
+        state.count("in_flight")
+        ok, usage = False, None
+        try:
+            response = await self._send(state, build, deadline, estimate_chat_tokens(messages, params.get("max_tokens")))
+            result = response.json()
+            ok, usage = True, result.get("usage")
+            return result
+        finally:
+            state.count("in_flight", -1)
+            state.slots.release()
+            state.record(started, ok, usage)
+
+    async def chat_stream(self, model: str, messages: list, timeout: float = None, **params) -> "ChatStream":
+        """
+        stream=True로 Chat Completions를 호출합니다. 응답 헤더를 받은 뒤 반환하므로 요청 오류는 여기서 OpenAIAPIError로 나옵니다.
+        반환된 ChatStream을 async for로 읽으면 choices가 있는 조각(dict)이 나오고, 다 읽거나 aclose()하면 슬롯을 돌려줍니다.
+        """
+        state = self.model(model)
+        deadline = time.monotonic() + timeout if timeout else None
+        body = {"model": model, "messages": messages, "stream": True, "stream_options": {"include_usage": True}, **params}
+        build = lambda client, request_timeout: client.build_request(
+            "POST", f"{self.api_base}/chat/completions", json=body, headers=self._headers(), timeout=request_timeout
+        )
+        started = time.perf_counter()
+        await self._acquire(state, deadline)
+        state.count("in_flight")
+        try:
+            response = await self._send(state, build, deadline, estimate_chat_tokens(messages, params.get("max_tokens")), stream=True)
+        except BaseException:
+            state.count("in_flight", -1)
+            state.slots.release()
+            state.record(started, False)
+            raise
+        return ChatStream(state, response, started)
+
+    def transcribe(self, audio_file, filename: str, content_type: str, data: dict, url: str = None,
+                   timeout: float = None, request_timeout: httpx.Timeout = None, api_key: str = None) -> dict:
+        """
+        오디오 변환 API를 동기로 호출합니다 (스레드 풀에서 사용). 모델은 data["model"]입니다.
+        timeout(초)은 chat과 같이 슬롯/한도 대기와 재시도를 포함한 전체 제한 시간이고,
+        request_timeout은 시도마다의 연결/업로드/응답 타임아웃입니다 (남은 시간보다 길면 남은 시간으로 줄임).
+        업로드 파일을 처음부터 다시 보내야 하므로 재시도 전에 파일 위치를 되돌립니다.
+        """
+        state = self.model(data["model"])
+        client = self._sync_client()
+        url = url or f"{self.api_base}/audio/transcriptions"
+        deadline = time.monotonic() + timeout if timeout else None
+        start_position = audio_file.tell() if hasattr(audio_file, "tell") else None
+        started = time.perf_counter()
+        ok = False
+        if not state.slots.acquire(timeout=max(0.0, deadline - time.monotonic()) if deadline is not None else None):
+            state.record(started, False)
+            raise OpenAITimeoutError("OpenAI 동시 호출 슬롯 대기 시간 초과")
+        state.count("in_flight")
+        try:
+            attempt = 0
+            while True:
+                wait = state.reserve(0)
+                if wait:
+                    if deadline is not None and time.monotonic() + wait >= deadline:
+                        raise OpenAITimeoutError("OpenAI 요청 한도 대기 시간이 제한 시간을 넘습니다.", 429)
+                    time.sleep(wait)
+                if start_position is not None:
+                    audio_file.seek(start_position)
+                try:
+                    response = client.post(
+                        url,
+                        headers=self._headers(api_key),
+                        files={"file": (filename, audio_file, content_type)},
+                        data={key: str(value) for key, value in data.items()},
+                        timeout=self._attempt_timeout(request_timeout, deadline),
+                    )
+                except httpx.TimeoutException as e:
+                    if isinstance(e, RETRYABLE_ERRORS):
+                        delay = self._retry_delay(attempt, deadline)
+                        if delay is not None:
+                            state.count("retries")
+                            attempt += 1
+                            time.sleep(delay)
+                            continue
+                    raise OpenAITimeoutError(f"OpenAI 호출 시간 초과: {e!r}") from e
+                except RETRYABLE_ERRORS as e:
+                    delay = self._retry_delay(attempt, deadline)
+                    if delay is None:
+                        raise OpenAIAPIError(f"OpenAI 연결 실패: {e!r}") from e
+                    state.count("retries")
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                except httpx.HTTPError as e:
+                    raise OpenAIAPIError(f"OpenAI 호출 실패: {e!r}") from e
+                state.observe(response)
+                if response.is_success:
+                    ok = True
+                    return response.json()
+                delay = self._retry_delay(attempt, deadline, response) if response.status_code in RETRYABLE_STATUS else None
+                if delay is None:
+                    raise self._error(response)
+                logger.warning(f"OpenAI HTTP {response.status_code}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                state.count("retries")
+                attempt += 1
+                time.sleep(delay)
+        finally:
+            state.count("in_flight", -1)
+            state.slots.release()
+            state.record(started, ok)
+
+    async def warmup(self):
+        """연결 풀에 API 서버와의 연결(TLS 포함)을 미리 만들어 둡니다. 실패해도 서비스 시작은 막지 않습니다."""
+        started = time.perf_counter()
+        try:
+            await self._async_client().get(f"{self.api_base}/models", headers=self._headers(), timeout=OPENAI_CONNECT_TIMEOUT)
+            await asyncio.to_thread(self._sync_client().get, f"{self.api_base}/models", headers=self._headers(), timeout=OPENAI_CONNECT_TIMEOUT)
+            logger.info(f"OpenAI connections warmed up in {time.perf_counter() - started:.2f}s")
+        except httpx.HTTPError as e:
+            logger.warning(f"OpenAI warm-up failed: {e!r}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            models = dict(self.models)
+        return {name: state.stats() for name, state in models.items()}
+
+    async def aclose(self):
+        """
+        모든 연결을 닫습니다 (서버 종료 시). 다른 스레드에서 아직 돌고 있는 루프의 AsyncClient는
+        그 루프에서 닫히도록 넘기고 끝날 때까지 기다립니다.
+        """
+        with self.lock:
+            clients, self.async_clients = self.async_clients, {}
+            sync_client, self.sync_client = self.sync_client, None
+        loop = asyncio.get_running_loop()
+        for client_loop, client in clients.items():
+            if client_loop is loop:
+                await client.aclose()
+            elif client_loop.is_closed():
+                logger.warning("OpenAI async client was not closed before its event loop closed (use openai_client.run)")
+            else:
+                future = asyncio.run_coroutine_threadsafe(client.aclose(), client_loop)
+                try:
+                    await asyncio.wait_for(asyncio.wrap_future(future), OPENAI_CONNECT_TIMEOUT)
+                except Exception as e:
+                    logger.warning(f"Could not close OpenAI async client on another event loop: {e!r}")
+        if sync_client is not None:
+            sync_client.close()
+
+class ChatStream:
+    """chat_stream의 응답 조각을 SSE "data:" 줄에서 읽습니다. 사용량(usage)만 담긴 마지막 조각은 지표에만 반영합니다."""
+    def __init__(self, state: ModelState, response: httpx.Response, started: float):
+        self.state = state
+        self.response = response
+        self.started = started
+        self.usage = None
+        self.closed = False
+        self.ok = False
+
+    async def __aiter__(self):
+        try:
+            async for line in self.response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    self.ok = True
+                    break
+                chunk = json.loads(payload)
+                if chunk.get("usage"):
+                    self.usage = chunk["usage"]
+                if chunk.get("choices"):
+                    yield chunk
+        except httpx.TimeoutException as e:
+            raise OpenAITimeoutError(f"OpenAI 스트림 시간 초과: {e!r}") from e
+        except httpx.HTTPError as e:
+            raise OpenAIAPIError(f"OpenAI 스트림 실패: {e!r}") from e
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.response.aclose()
+        finally:
+            self.state.count("in_flight", -1)
+            self.state.slots.release()
+            self.state.record(self.started, self.ok, self.usage)
+
+openai_client = OpenAIClient()
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 분석 결과 DB 경로와 보관 시간(초). 같은 호스트의 모든 워커 프로세스가 같은 파일을 사용해야 합니다.
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", "./results.db")
+RESULTS_TTL_SECONDS = int(os.getenv("RESULTS_TTL_SECONDS", str(24 * 3600)))
+# 만료 항목 정리 간격(초)
+RESULTS_PURGE_INTERVAL_SECONDS = 60
+
+class ResultsStore:
+    """
+    작업(job_id)과 단계("emotion", "speed", "whisper", "job" 등)별 분석 결과를 SQLite(WAL)에 JSON으로 저장합니다.
+    uvicorn/gunicorn 워커가 여러 개여도 어느 워커에서나 같은 결과를 읽을 수 있습니다.
+    WAL 모드라 읽기는 쓰기를 기다리지 않고, 단계별 쓰기는 한 트랜잭션으로 원자적으로 반영됩니다.
+    ttl_seconds가 지난 결과는 읽히지 않으며 주기적으로 삭제됩니다.
+    """
+    def __init__(self, path: str = RESULTS_DB_PATH, ttl_seconds: int = RESULTS_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.local = threading.local()  # sqlite3 연결은 스레드마다 따로 엽니다.
+        self.last_purge = 0.0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " job_id TEXT NOT NULL, stage TEXT NOT NULL, value TEXT NOT NULL,"
+                " updated_at REAL NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (job_id, stage))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_stage_updated ON results (stage, updated_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_expires ON results (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def put(self, stage: str, value, job_id: str = None) -> str:
+        """결과를 저장하고 job_id를 반환합니다. job_id가 없으면 새로 만듭니다(단독 엔드포인트 호출)."""
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (job_id, stage, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, stage, data, now, now + self.ttl_seconds),
+            )
+        if now - self.last_purge > RESULTS_PURGE_INTERVAL_SECONDS:
+            self.purge_expired()
+        return job_id
+
+    def get(self, stage: str, job_id: str = None):
+        """job_id의 단계 결과를 반환합니다. job_id가 없으면 그 단계의 가장 최근 결과, 없으면 None."""
+        conn = self._connection()
+        if job_id:
+            row = conn.execute(
+                "SELECT value FROM results WHERE job_id = ? AND stage = ? AND expires_at > ?",
+                (job_id, stage, time.time()),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT value FROM results WHERE stage = ? AND expires_at > ? ORDER BY updated_at DESC LIMIT 1",
+                (stage, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def latest_job_id(self, stages) -> str:
+        """stages 중 하나라도 결과가 있는 작업 가운데 가장 최근에 갱신된 작업의 job_id를 반환합니다. 없으면 None."""
+        stages = list(stages)
+        row = self._connection().execute(
+            f"SELECT job_id FROM results WHERE stage IN ({', '.join('?' * len(stages))}) AND expires_at > ?"
+            " ORDER BY updated_at DESC LIMIT 1",
+            (*stages, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_job(self, job_id: str) -> dict:
+        """job_id의 모든 단계 결과를 {단계: 결과}로 반환합니다."""
+        rows = self._connection().execute(
+            "SELECT stage, value FROM results WHERE job_id = ? AND expires_at > ?",
+            (job_id, time.time()),
+        ).fetchall()
+        return {stage: json.loads(value) for stage, value in rows}
+
+    def purge_expired(self) -> int:
+        self.last_purge = time.time()
+        with self._connection() as conn:
+            deleted = conn.execute("DELETE FROM results WHERE expires_at <= ?", (self.last_purge,)).rowcount
+        if deleted:
+            logger.info(f"Results store: purged {deleted} expired results")
+        return deleted
+
+results_store = ResultsStore()
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 생성된 스크립트 캐시의 최대 항목 수와 보관 시간(초)
+SCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("SCRIPT_CACHE_MAX_ENTRIES", "256"))
+SCRIPT_CACHE_TTL_SECONDS = int(os.getenv("SCRIPT_CACHE_TTL_SECONDS", "600"))
+
+class ScriptCache:
+    """
+    생성된 발표 스크립트를 (정규화한 요청, 모델, 온도 등)을 키로 메모리에 보관합니다 (TTL + LRU).
+    같은 키의 생성이 이미 진행 중이면 새로 호출하지 않고 그 결과를 함께 기다립니다(single-flight).
+    생성마다 결과를 기다리는 요청 수(생성을 시작한 요청 포함)를 세어, 모두 떠나면 on_abandoned로 등록한 정리 함수를 호출합니다.
+    이벤트 루프 스레드에서만 사용합니다.
+    """
+    def __init__(self, max_entries: int = SCRIPT_CACHE_MAX_ENTRIES, ttl_seconds: int = SCRIPT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (만료 시각, 스크립트), 오래 사용하지 않은 순
+        self.in_flight = {}  # key -> 진행 중인 생성의 asyncio.Future
+        self.listeners = {}  # 진행 중인 생성의 Future -> 결과를 기다리는 요청 수
+        self.abandon_callbacks = {}  # 진행 중인 생성의 Future -> 기다리는 요청이 없어지면 호출할 함수
+        self.counters = {"requests": 0, "hits": 0, "coalesced": 0, "upstream_calls": 0, "upstream_errors": 0}
+
+    @staticmethod
+    def make_key(params: dict) -> str:
+        raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def claim(self, key: str):
+        """
+        캐시를 조회합니다. 반환값:
+        ("hit", 스크립트) / ("wait", 진행 중인 생성의 Future) / ("lead", 새 생성의 Future: 호출자가 생성 후 complete/fail을 호출)
+        wait/lead를 받은 요청은 결과를 더 기다리지 않게 되면 leave(Future)를 호출합니다.
+        """
+        self.counters["requests"] += 1
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return "hit", entry[1]
+            del self.entries[key]
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            self.listeners[future] += 1
+            return "wait", future
+        future = asyncio.get_running_loop().create_future()
+        # 기다리는 요청이 없을 때 실패해도 "exception was never retrieved" 경고가 남지 않게 합니다.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.in_flight[key] = future
+        self.listeners[future] = 1
+        self.counters["upstream_calls"] += 1
+        return "lead", future
+
+    def on_abandoned(self, future, callback):
+        """생성(future)의 결과를 기다리는 요청이 모두 떠나면 callback()을 호출합니다 (예: 생성 작업 취소)."""
+        if not future.done():
+            self.abandon_callbacks[future] = callback
+
+    def leave(self, future):
+        """결과를 더 기다리지 않는 요청을 뺍니다. 이미 끝난 생성이면 아무것도 하지 않습니다."""
+        if future not in self.listeners:
+            return
+        self.listeners[future] -= 1
+        if self.listeners[future] <= 0:
+            callback = self.abandon_callbacks.pop(future, None)
+            if callback is not None:
+                # 취소가 반영되기 전에 들어온 같은 요청이 중단될 생성을 기다리지 않도록 먼저 진행 중 목록에서 뺍니다.
+                key = next((key for key, pending in self.in_flight.items() if pending is future), None)
+                if key is not None:
+                    self.fail(key, RuntimeError("스크립트 생성이 중단되었습니다."), future)
+                callback()
+
+    def _finish(self, key: str, future=None):
+        """key의 진행 중인 생성을 목록에서 빼고 그 Future를 반환합니다. future가 주어지면 그 생성일 때만 뺍니다."""
+        current = self.in_flight.get(key)
+        if current is None or (future is not None and current is not future):
+            return future
+        del self.in_flight[key]
+        self.listeners.pop(current, None)
+        self.abandon_callbacks.pop(current, None)
+        return current
+
+    def complete(self, key: str, script: str, future=None):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, script)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        future = self._finish(key, future)
+        if future is not None and not future.done():
+            future.set_result(script)
+
+    def fail(self, key: str, error: BaseException, future=None):
+        future = self._finish(key, future)
+        if future is not None and not future.done():
+            self.counters["upstream_errors"] += 1
+            future.set_exception(error)
+
+    async def get_or_create(self, key: str, create) -> str:
+        """캐시된 스크립트를 반환하거나, 진행 중인 생성을 기다리거나, create()로 새로 생성합니다."""
+        state, value = self.claim(key)
+        if state == "hit":
+            return value
+        if state == "wait":
+            # 기다리던 요청이 취소되어도 공유 생성은 계속됩니다.
+            try:
+                return await asyncio.shield(value)
+            finally:
+                self.leave(value)
+        try:
+            script = await create()
+        except BaseException as e:
+            self.fail(key, e)
+            raise
+        self.complete(key, script)
+        return script
+
+    def stats(self) -> dict:
+        saved = self.counters["hits"] + self.counters["coalesced"]
+        return {
+            "entries": len(self.entries),
+            "in_flight": len(self.in_flight),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            **self.counters,
+            "upstream_calls_saved": saved,
+            "hit_rate": saved / self.counters["requests"] if self.counters["requests"] else 0.0,
+        }
+
+script_cache = ScriptCache()
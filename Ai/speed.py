@@ -1,12 +1,16 @@
 import os
 import tempfile
+import subprocess
 import asyncio
 import logging
 from concurrent.futures import ThreadPoolExecutor
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydub import AudioSegment
 import webrtcvad
+import numpy as np
+from analysis_cache import analysis_cache, file_sha256, ANALYSIS_AUDIO_FORMAT
+from results_store import results_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,7 +26,24 @@ app.add_middleware(
 
 # 전역 스레드 풀 및 분석 결과 저장 (메모리)
 thread_pool = ThreadPoolExecutor(max_workers=4)
-analysis_results_memory = None
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# VAD 설정: 16kHz 모노 16비트 PCM, 30ms 프레임
+VAD_MODE = 2
+VAD_SAMPLE_RATE = 16000
+FRAME_DURATION_MS = 30
+# 1이면 ffmpeg 파이프로 PCM을 스트리밍 디코딩해 VAD를 수행합니다 (녹음 길이와 무관하게 메모리 일정).
+STREAMING_VAD = os.getenv("SPEED_STREAMING_VAD", "1") == "1"
+# 스트리밍 모드에서 한 번에 읽는 프레임 수 (약 1초)
+STREAM_READ_FRAMES = 33
+# 분석 결과 캐시 키에 포함되는 파라미터 (알고리즘이 바뀌면 version을 올립니다)
+VAD_CACHE_PARAMS = {
+    "version": 2,
+    "audio_format": ANALYSIS_AUDIO_FORMAT,
+    "vad_mode": VAD_MODE,
+    "frame_duration_ms": FRAME_DURATION_MS,
+    "merge_under_seconds": 1.0,
+    "decoder": "stream" if STREAMING_VAD else "pydub",
+}
 
 def get_speech_rate(duration: float) -> str:
     if duration < 1.0:
@@ -37,6 +58,8 @@ def get_speech_rate(duration: float) -> str:
         return "매우 느림"
 
 class Frame:
+    __slots__ = ("bytes", "timestamp", "duration")
+
     def __init__(self, bytes, timestamp, duration):
         self.bytes = bytes
         self.timestamp = timestamp
@@ -47,8 +70,10 @@ def frame_generator(frame_duration_ms, audio_bytes, sample_rate, sample_width):
     offset = 0
     timestamp = 0.0
     duration = frame_duration_ms / 1000.0
+    # 프레임마다 바이트를 복사하지 않고 원본 버퍼의 memoryview 조각을 넘깁니다.
+    view = memoryview(audio_bytes)
     while offset + n <= len(audio_bytes):
-        yield Frame(audio_bytes[offset:offset+n], timestamp, duration)
+        yield Frame(view[offset:offset+n], timestamp, duration)
         timestamp += duration
         offset += n
 
@@ -73,89 +98,241 @@ def vad_collector(sample_rate, frame_duration_ms, padding_duration_ms, frames, v
         segments.append(voiced_frames)
     return segments
 
-async def process_segment_vad(segment_frames, index, original_audio):
-    start_time = segment_frames[0].timestamp
-    end_time = segment_frames[-1].timestamp + segment_frames[-1].duration
-    duration = end_time - start_time
-    start_ms = int(start_time * 1000)
-    end_ms = int(end_time * 1000)
-    segment_audio = original_audio[start_ms:end_ms]
-    volume = await asyncio.get_event_loop().run_in_executor(
-        thread_pool,
-        lambda: segment_audio.dBFS
-    )
-    return {
-        "segment": index,
-        "start_time": start_time,
-        "end_time": end_time,
-        "duration": duration,
-        "volume": volume,
-        "rate": get_speech_rate(duration)
-    }
+def segment_loudness(samples: np.ndarray, sample_rate: int, start_times, end_times) -> np.ndarray:
+    """
+    16비트 PCM 샘플 배열에서 모든 세그먼트의 dBFS를 한 번에 계산합니다.
+    세그먼트 경계마다 제곱합을 구해 누적합(prefix sum)을 만들고, 경계 인덱스로 각 구간의 제곱합을 얻습니다.
+    샘플은 한 번만 순회하며, pydub의 audio[start_ms:end_ms].dBFS와 같은 값을 반환합니다.
+    """
+    n_samples = len(samples)
+    # pydub과 같은 방식으로 밀리초 경계를 샘플 인덱스로 변환 (오디오 길이를 넘는 구간은 잘라냄)
+    length_ms = round(n_samples * 1000 / sample_rate)
+    start_ms = np.minimum((np.asarray(start_times) * 1000).astype(np.int64), length_ms)
+    end_ms = np.minimum((np.asarray(end_times) * 1000).astype(np.int64), length_ms)
+    start_idx = (start_ms * (sample_rate / 1000.0)).astype(np.int64)
+    end_idx = (end_ms * (sample_rate / 1000.0)).astype(np.int64)
+    # 끝을 넘는 부분은 pydub처럼 무음으로 채워진 것으로 보고 길이에만 포함합니다.
+    counts = end_idx - start_idx
+    start_idx = np.minimum(start_idx, n_samples)
+    end_idx = np.minimum(end_idx, n_samples)
+
+    if n_samples:
+        squares = samples.astype(np.int64)
+        np.multiply(squares, squares, out=squares)
+        edges = np.unique(np.concatenate(([0], start_idx, end_idx)))
+        edges = edges[edges < n_samples]
+        # prefix[k]: edges[k] 이전 샘플들의 제곱합, prefix[-1]: 전체 제곱합
+        prefix = np.zeros(len(edges) + 1, dtype=np.int64)
+        np.cumsum(np.add.reduceat(squares, edges), out=prefix[1:])
+        totals = prefix[np.searchsorted(edges, end_idx)] - prefix[np.searchsorted(edges, start_idx)]
+    else:
+        totals = np.zeros(len(counts), dtype=np.int64)
+    return square_sums_to_dbfs(totals, counts)
+
+def square_sums_to_dbfs(square_sums, counts) -> np.ndarray:
+    """구간별 제곱합과 샘플 수로 dBFS를 계산합니다. pydub(audioop.rms)처럼 RMS는 정수로 내림합니다."""
+    square_sums = np.asarray(square_sums, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rms = np.floor(np.sqrt(square_sums / counts))
+        volumes = 20 * np.log10(rms / 32768)
+    volumes[(counts <= 0) | (rms == 0)] = -np.inf
+    return volumes
+
+def merge_short_segments(results: list, min_duration: float = 1.0) -> list:
+    """
+    min_duration보다 짧은 세그먼트를 다음 세그먼트와 합칩니다. 합친 구간의 볼륨은 길이 가중 평균입니다.
+    어떤 세그먼트를 합칠지만 순서대로 정하고, 볼륨과 길이는 배열 연산으로 한 번에 계산합니다.
+    """
+    if not results:
+        return []
+    starts = np.array([r["start_time"] for r in results])
+    ends = np.array([r["end_time"] for r in results])
+    durations = np.array([r["duration"] for r in results])
+    volumes = np.array([r["volume"] for r in results])
+
+    # 각 출력 세그먼트의 (첫 인덱스, 마지막 인덱스); 마지막의 짧은 세그먼트는 버립니다.
+    firsts, lasts = [], []
+    short = durations < min_duration
+    i = 0
+    while i < len(results):
+        if short[i]:
+            if i < len(results) - 1:
+                firsts.append(i)
+                lasts.append(i + 1)
+                i += 2
+            else:
+                i += 1
+        else:
+            firsts.append(i)
+            lasts.append(i)
+            i += 1
+    if not firsts:
+        return []
+    firsts = np.array(firsts)
+    lasts = np.array(lasts)
+
+    merged = firsts != lasts
+    new_durations = ends[lasts] - starts[firsts]
+    weights = durations[firsts] + np.where(merged, durations[lasts], 0.0)
+    with np.errstate(invalid="ignore"):
+        merged_volumes = (
+            volumes[firsts] * durations[firsts] + volumes[lasts] * durations[lasts]
+        ) / weights
+    new_volumes = np.where(merged, merged_volumes, volumes[firsts])
+
+    merged_results = []
+    for k, (first, last) in enumerate(zip(firsts.tolist(), lasts.tolist())):
+        if first == last:
+            merged_results.append(results[first])
+            continue
+        merged_results.append({
+            "segment": f"{results[first]['segment']}-{results[last]['segment']}",
+            "start_time": results[first]["start_time"],
+            "end_time": results[last]["end_time"],
+            "duration": float(new_durations[k]),
+            "volume": float(new_volumes[k]),
+            "rate": get_speech_rate(float(new_durations[k]))
+        })
+    return merged_results
+
+def summarize_segments(segments_frames, samples: np.ndarray, sample_rate: int) -> list:
+    """VAD 세그먼트(프레임 리스트)마다 시간, 길이, 볼륨, 속도를 계산합니다."""
+    start_times = [frames[0].timestamp for frames in segments_frames]
+    end_times = [frames[-1].timestamp + frames[-1].duration for frames in segments_frames]
+    volumes = segment_loudness(samples, sample_rate, start_times, end_times)
+    results = []
+    for index, (start_time, end_time, volume) in enumerate(zip(start_times, end_times, volumes.tolist()), 1):
+        duration = end_time - start_time
+        results.append({
+            "segment": index,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration": duration,
+            "volume": volume,
+            "rate": get_speech_rate(duration)
+        })
+    return results
 
 async def analyze_segments_vad(audio: AudioSegment) -> list:
     audio = audio.set_channels(1)
-    audio = audio.set_frame_rate(16000)
+    audio = audio.set_frame_rate(VAD_SAMPLE_RATE)
     audio = audio.set_sample_width(2)
     sample_rate = audio.frame_rate
     sample_width = audio.sample_width
     audio_bytes = audio.raw_data
-    vad = webrtcvad.Vad(2)
-    frame_duration_ms = 30
+    vad = webrtcvad.Vad(VAD_MODE)
+    frame_duration_ms = FRAME_DURATION_MS
     padding_duration_ms = 300
     frames = list(frame_generator(frame_duration_ms, audio_bytes, sample_rate, sample_width))
     segments_frames = vad_collector(sample_rate, frame_duration_ms, padding_duration_ms, frames, vad)
-    tasks = [
-        process_segment_vad(segment_frames, i, audio)
-        for i, segment_frames in enumerate(segments_frames, 1)
-    ]
-    results = await asyncio.gather(*tasks)
+    samples = np.frombuffer(audio_bytes, dtype=np.int16)
+    # 세그먼트별 작업 대신 전체 세그먼트의 볼륨을 스레드 풀에서 한 번에 계산
+    results = await asyncio.get_event_loop().run_in_executor(
+        thread_pool,
+        summarize_segments, segments_frames, samples, sample_rate
+    )
     results = sorted(results, key=lambda r: r["start_time"])
-    merged_results = []
-    i = 0
-    while i < len(results):
-        current = results[i]
-        if current["duration"] < 1.0:
-            if i < len(results) - 1:
-                next_seg = results[i + 1]
-                new_start = current["start_time"]
-                new_end = next_seg["end_time"]
-                new_duration = new_end - new_start
-                total_dur = current["duration"] + next_seg["duration"]
-                new_volume = (
-                    current["volume"] * current["duration"] +
-                    next_seg["volume"] * next_seg["duration"]
-                ) / total_dur
-                new_rate = get_speech_rate(new_duration)
-                merged_segment = {
-                    "segment": f"{current['segment']}-{next_seg['segment']}",
-                    "start_time": new_start,
-                    "end_time": new_end,
-                    "duration": new_duration,
-                    "volume": new_volume,
-                    "rate": new_rate
-                }
-                merged_results.append(merged_segment)
-                i += 2
-            else:
-                i += 1
+    return merge_short_segments(results)
+
+def stream_vad_segments(path: str) -> list:
+    """
+    ffmpeg 파이프로 16kHz 모노 s16 PCM을 받아 webrtcvad에 프레임 단위로 바로 넣습니다.
+    고정 크기 버퍼 하나를 재사용하고 프레임은 그 버퍼의 memoryview로만 다루며,
+    세그먼트마다 프레임 대신 시작/끝 시각과 제곱합만 누적하므로 녹음 길이와 무관하게 메모리가 일정합니다.
+    세그먼트 경계 판정은 vad_collector와 같고, 볼륨은 프레임 경계 기준으로 계산합니다.
+    """
+    vad = webrtcvad.Vad(VAD_MODE)
+    frame_samples = VAD_SAMPLE_RATE * FRAME_DURATION_MS // 1000
+    frame_bytes = frame_samples * 2
+    duration = FRAME_DURATION_MS / 1000.0
+    buffer = bytearray(frame_bytes * STREAM_READ_FRAMES)
+    view = memoryview(buffer)
+
+    segments = []  # (start_time, end_time, 제곱합, 샘플 수)
+    triggered = False
+    timestamp = 0.0
+    command = [
+        "ffmpeg", "-v", "error", "-i", path,
+        "-f", "s16le", "-ac", "1", "-ar", str(VAD_SAMPLE_RATE), "pipe:1",
+    ]
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        while True:
+            filled = 0
+            while filled < len(buffer):
+                read = process.stdout.readinto(view[filled:])
+                if not read:
+                    break
+                filled += read
+            n_frames = filled // frame_bytes
+            if n_frames == 0:
+                break
+            # 읽은 블록의 프레임별 제곱합을 한 번에 계산
+            block = np.frombuffer(buffer, dtype=np.int16, count=n_frames * frame_samples)
+            block = block.astype(np.int64).reshape(n_frames, frame_samples)
+            energies = np.einsum("ij,ij->i", block, block).tolist()
+            for i in range(n_frames):
+                is_speech = vad.is_speech(view[i * frame_bytes:(i + 1) * frame_bytes], VAD_SAMPLE_RATE)
+                if is_speech:
+                    if not triggered:
+                        triggered = True
+                        segment_start, square_sum, sample_count = timestamp, 0, 0
+                    square_sum += energies[i]
+                    sample_count += frame_samples
+                    segment_end = timestamp + duration
+                elif triggered:
+                    segments.append((segment_start, segment_end, square_sum, sample_count))
+                    triggered = False
+                timestamp += duration
+            if filled < len(buffer):
+                break
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode audio: {path}")
+    if triggered:
+        segments.append((segment_start, segment_end, square_sum, sample_count))
+
+    volumes = square_sums_to_dbfs([s[2] for s in segments], [s[3] for s in segments]).tolist()
+    results = []
+    for index, ((start_time, end_time, _, _), volume) in enumerate(zip(segments, volumes), 1):
+        duration_s = end_time - start_time
+        results.append({
+            "segment": index,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration": duration_s,
+            "volume": volume,
+            "rate": get_speech_rate(duration_s)
+        })
+    return merge_short_segments(results)
+
+async def analyze_audio_file(path: str, content_hash: str = None, job_id: str = None) -> list:
+    """
+    오디오 파일을 VAD로 분석하고 결과를 결과 저장소에 작업(job_id)별로 저장한 뒤 반환합니다. vod.py에서도 직접 호출합니다.
+    같은 내용(content_hash)의 결과가 캐시에 있으면 파일을 디코딩하지 않습니다.
+    """
+    content_hash = content_hash or file_sha256(path)
+    results = analysis_cache.get("vad", content_hash, VAD_CACHE_PARAMS)
+    if results is None:
+        if STREAMING_VAD:
+            results = await asyncio.get_event_loop().run_in_executor(thread_pool, stream_vad_segments, path)
         else:
-            merged_results.append(current)
-            i += 1
-    return merged_results
+            audio_segment = AudioSegment.from_file(path)
+            results = await analyze_segments_vad(audio_segment)
+        analysis_cache.put("vad", content_hash, VAD_CACHE_PARAMS, results)
+    # 블로킹 SQLite 쓰기는 이벤트 루프 밖에서 실행합니다.
+    await asyncio.get_event_loop().run_in_executor(thread_pool, results_store.put, "speed", results, job_id)
+    return results
 
 @app.post("/upload-audio")
-async def process_audio(audio: UploadFile = File(...)):
+async def process_audio(audio: UploadFile = File(...), job_id: str = Form(None)):
     try:
+        # 파일 전체를 메모리에 올리지 않고 청크 단위로 임시 파일에 기록
         with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            content = await audio.read()
-            temp_file.write(content)
+            while chunk := await audio.read(UPLOAD_CHUNK_SIZE):
+                temp_file.write(chunk)
             temp_path = temp_file.name
         try:
-            audio_segment = AudioSegment.from_file(temp_path)
-            results = await analyze_segments_vad(audio_segment)
-            global analysis_results_memory
-            analysis_results_memory = results  # 분석 결과를 메모리에 저장
+            results = await analyze_audio_file(temp_path, job_id=job_id)
             return {"results": results}
         except Exception as e:
             logger.error(f"Error processing audio: {str(e)}")
@@ -167,11 +344,12 @@ async def process_audio(audio: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/analysis-results")
-async def get_analysis_results():
-    # 분석 결과가 없으면 빈 결과 반환
-    if analysis_results_memory is None:
+def get_analysis_results(job_id: str = None):
+    # job_id가 없으면 가장 최근 결과, 분석 결과가 없으면 빈 결과 반환
+    results = results_store.get("speed", job_id)
+    if results is None:
         return {"results": []}
-    return {"results": analysis_results_memory}
+    return {"results": results}
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -0,0 +1,224 @@
+import os
+import shutil
+import logging
+import tempfile
+import mimetypes
+import threading
+import importlib.util
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import httpx
+from openai_client import openai_client, OpenAIAPIError, OpenAITimeoutError
+
+logger = logging.getLogger(__name__)
+
+# STT 백엔드 선택: "openai"(Whisper API) 또는 "local"(faster-whisper, CPU)
+STT_BACKEND = os.getenv("STT_BACKEND", "openai")
+
+# Whisper API 요청 파라미터 (변환 결과 캐시 키에도 사용)
+TRANSCRIPTION_PARAMS = {
+    "model": "whisper-1",
+    "response_format": "verbose_json",
+    "temperature": 0.0,
+    "language": "ko"
+}
+
+# 변환 엔드포인트 (로컬 가짜 서버나 프록시로 바꿔 시험할 수 있음)
+WHISPER_API_URL = os.getenv("WHISPER_API_URL", "https://api.openai.com/v1/audio/transcriptions")
+WHISPER_MAX_CONCURRENCY = int(os.getenv("WHISPER_MAX_CONCURRENCY", "4"))
+# Whisper 호출 타임아웃(초): 연결과 업로드는 짧게, 응답은 변환 시간만큼 길게 기다립니다.
+WHISPER_CONNECT_TIMEOUT = float(os.getenv("WHISPER_CONNECT_TIMEOUT", "10"))
+WHISPER_WRITE_TIMEOUT = float(os.getenv("WHISPER_WRITE_TIMEOUT", "60"))
+WHISPER_READ_TIMEOUT = float(os.getenv("WHISPER_READ_TIMEOUT", "300"))
+# 호출 하나(청크 또는 단일 요청)의 전체 제한 시간(초): 슬롯/한도 대기와 재시도를 포함합니다.
+WHISPER_TIMEOUT_SECONDS = float(os.getenv("WHISPER_TIMEOUT_SECONDS", "600"))
+
+# 로컬 CPU 백엔드 설정: 프로세스마다 int8 양자화 모델을 한 번 올려 두고 청크를 나눠 처리합니다.
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "small")
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_WORKERS = int(os.getenv("LOCAL_STT_WORKERS", "2"))
+LOCAL_STT_BEAM_SIZE = int(os.getenv("LOCAL_STT_BEAM_SIZE", "1"))
+
+class STTError(Exception):
+    """음성 변환 실패. 엔드포인트에서 HTTP 오류로 바꿔 응답합니다."""
+
+class STTTimeoutError(STTError):
+    """음성 변환이 제한 시간 안에 끝나지 않음."""
+
+@contextmanager
+def audio_file_path(audio_file):
+    """ffmpeg 등에 넘길 경로를 돌려줍니다. 디스크 파일이 아니면(UploadFile, BytesIO 등) 임시 파일로 복사합니다."""
+    name = getattr(audio_file, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        yield name
+        return
+    with tempfile.NamedTemporaryFile(suffix=".audio") as tmp:
+        audio_file.seek(0)
+        shutil.copyfileobj(audio_file, tmp)
+        tmp.flush()
+        audio_file.seek(0)
+        yield tmp.name
+
+class STTBackend(ABC):
+    """
+    음성을 Whisper API의 verbose_json과 같은 형태
+    ({"task", "language", "duration", "text", "segments": [{"id", "start", "end", "text", ...}]})로 변환합니다.
+    transcribe는 여러 스레드에서 동시에 호출될 수 있습니다.
+    """
+    name = ""
+
+    @abstractmethod
+    def cache_params(self) -> dict:
+        """변환 결과를 바꾸는 설정 (변환 결과 캐시 키에 사용)."""
+
+    @abstractmethod
+    def transcribe(self, audio_file, filename: str) -> dict:
+        """실패하면 STTError(시간 초과는 STTTimeoutError)를 던집니다."""
+
+    def close(self):
+        pass
+
+class OpenAIWhisperBackend(STTBackend):
+    """Whisper API(또는 같은 형식의 엔드포인트)를 공유 OpenAI 클라이언트(openai_client.py)의 keep-alive 연결 풀로 호출합니다."""
+    name = "openai"
+
+    def __init__(self, api_key: str = None, api_url: str = WHISPER_API_URL, max_concurrency: int = WHISPER_MAX_CONCURRENCY):
+        self.api_key = api_key
+        self.api_url = api_url
+        # 청크/단일 요청을 합쳐 프로세스 전체에서 동시에 진행되는 Whisper 호출 수의 상한
+        openai_client.limit_concurrency(TRANSCRIPTION_PARAMS["model"], max_concurrency)
+        self.timeout = WHISPER_TIMEOUT_SECONDS
+        self.request_timeout = httpx.Timeout(
+            connect=WHISPER_CONNECT_TIMEOUT,
+            read=WHISPER_READ_TIMEOUT,
+            write=WHISPER_WRITE_TIMEOUT,
+            pool=None,
+        )
+
+    def cache_params(self) -> dict:
+        return TRANSCRIPTION_PARAMS
+
+    def transcribe(self, audio_file, filename: str) -> dict:
+        try:
+            return openai_client.transcribe(
+                audio_file,
+                filename,
+                mimetypes.guess_type(filename)[0] or "audio/mpeg",
+                TRANSCRIPTION_PARAMS,
+                url=self.api_url,
+                timeout=self.timeout,
+                request_timeout=self.request_timeout,
+                api_key=self.api_key,
+            )
+        except OpenAITimeoutError as e:
+            logger.error(f"Whisper API 시간 초과: {e}")
+            raise STTTimeoutError("Whisper API 시간 초과") from e
+        except OpenAIAPIError as e:
+            logger.error(f"Whisper API 호출 실패: {e}")
+            raise STTError("Whisper API 호출 실패") from e
+
+# 로컬 백엔드 작업 프로세스마다 한 번 로드되는 모델
+_local_model = None
+
+def _init_local_worker(model_size: str, compute_type: str, cpu_threads: int):
+    global _local_model
+    from faster_whisper import WhisperModel
+    _local_model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+def _local_transcribe(audio_path: str, language: str, temperature: float, beam_size: int) -> dict:
+    """프로세스 풀 작업: 파일 경로의 오디오를 faster-whisper로 변환하고 결과를 verbose_json 형태로 바꿔 반환합니다."""
+    segments, info = _local_model.transcribe(
+        audio_path, language=language, temperature=temperature, beam_size=beam_size
+    )
+    results = [
+        {
+            "id": segment.id,
+            "seek": segment.seek,
+            "start": segment.start,
+            "end": segment.end,
+            "text": segment.text,
+            "tokens": list(segment.tokens),
+            "temperature": segment.temperature,
+            "avg_logprob": segment.avg_logprob,
+            "compression_ratio": segment.compression_ratio,
+            "no_speech_prob": segment.no_speech_prob,
+        }
+        for segment in segments
+    ]
+    return {
+        "task": "transcribe",
+        "language": info.language,
+        "duration": info.duration,
+        "text": "".join(segment["text"] for segment in results),
+        "segments": results,
+    }
+
+class LocalWhisperBackend(STTBackend):
+    """
+    faster-whisper(CTranslate2, 기본 int8)로 CPU에서 변환합니다. 외부 호출이 없어 오프라인에서도 동작합니다.
+    작업 프로세스 workers개가 모델을 하나씩 올려 두고, 동시에 들어온 청크들을 나눠 처리합니다.
+    """
+    name = "local"
+
+    def __init__(self, model_size: str = LOCAL_STT_MODEL, compute_type: str = LOCAL_STT_COMPUTE_TYPE,
+                 workers: int = LOCAL_STT_WORKERS, beam_size: int = LOCAL_STT_BEAM_SIZE):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.workers = workers
+        self.beam_size = beam_size
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def cache_params(self) -> dict:
+        return {
+            "backend": self.name,
+            "model": self.model_size,
+            "compute_type": self.compute_type,
+            "beam_size": self.beam_size,
+            "temperature": TRANSCRIPTION_PARAMS["temperature"],
+            "language": TRANSCRIPTION_PARAMS["language"],
+        }
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.pool is None:
+                if importlib.util.find_spec("faster_whisper") is None:
+                    raise RuntimeError("STT_BACKEND=local을 사용하려면 faster-whisper 패키지를 설치해야 합니다.")
+                # 코어를 작업 프로세스끼리 나눠 씁니다.
+                cpu_threads = max(1, (os.cpu_count() or 1) // self.workers)
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_local_worker,
+                    initargs=(self.model_size, self.compute_type, cpu_threads),
+                )
+            return self.pool
+
+    def transcribe(self, audio_file, filename: str) -> dict:
+        # 오디오 내용 대신 경로만 작업 프로세스에 넘깁니다 (디스크 파일이 아니면 변환이 끝날 때까지 임시 파일로 둠).
+        with audio_file_path(audio_file) as path:
+            future = self._get_pool().submit(
+                _local_transcribe, path,
+                TRANSCRIPTION_PARAMS["language"], TRANSCRIPTION_PARAMS["temperature"], self.beam_size
+            )
+            try:
+                return future.result()
+            except Exception as e:
+                logger.error(f"로컬 음성 변환 실패: {e}")
+                raise STTError(f"로컬 음성 변환 실패: {e}") from e
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True)
+                self.pool = None
+
+STT_BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    LocalWhisperBackend.name: LocalWhisperBackend,
+}
+
+def create_stt_backend(name: str = STT_BACKEND) -> STTBackend:
+    if name not in STT_BACKENDS:
+        raise ValueError(f"알 수 없는 STT_BACKEND: {name} (사용 가능: {', '.join(STT_BACKENDS)})")
+    return STT_BACKENDS[name]()
@@ -0,0 +1,98 @@
+import os
+import re
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 한국어 발표 스크립트의 토큰 예산 계산 기준
+# - 발표 속도: 1분에 말하는 음절 수 (한국어 발표는 대략 분당 250~300음절)
+# - 음절당 토큰 수: 생성된 한국어 스크립트를 로컬 토크나이저(tiktoken)로 센 값 (공백/문장부호 포함)
+# - 어절당 음절 수: 프롬프트의 "약 N단어" 안내에 사용
+# 실제 생성된 스크립트로 다시 측정하려면: python benchmarks.py token-budget --scripts <디렉터리>
+SPOKEN_SYLLABLES_PER_MINUTE = float(os.getenv("SCRIPT_SYLLABLES_PER_MINUTE", "280"))
+TOKENS_PER_SYLLABLE = float(os.getenv("SCRIPT_TOKENS_PER_SYLLABLE", "1.26"))
+SYLLABLES_PER_WORD = float(os.getenv("SCRIPT_SYLLABLES_PER_WORD", "2.9"))
+# 본문 외 출력(제목, 인사말, "도입부:" 같은 섹션 표시)에 쓰는 토큰
+SCRIPT_OVERHEAD_TOKENS = int(os.getenv("SCRIPT_OVERHEAD_TOKENS", "80"))
+# 모델이 분량을 조금 넘겨 써도 잘리지 않도록 두는 여유 비율
+SCRIPT_TOKEN_HEADROOM = float(os.getenv("SCRIPT_TOKEN_HEADROOM", "1.1"))
+# 모델의 최대 출력 토큰 수
+SCRIPT_MAX_COMPLETION_TOKENS = int(os.getenv("SCRIPT_MAX_COMPLETION_TOKENS", "4096"))
+
+# 섹션별 비율 (도입부 20%, 본론 60%, 결론 20%)
+SECTION_RATIOS = {"intro": 0.2, "main": 0.6, "conclusion": 0.2}
+
+HANGUL_SYLLABLE = re.compile(r"[가-힣]")
+LATIN_WORD = re.compile(r"[A-Za-z0-9]+")
+
+_encodings = {}
+
+def _encoding(model: str):
+    """tiktoken 인코딩을 반환합니다. 패키지나 인코딩 파일을 쓸 수 없으면 None."""
+    if model not in _encodings:
+        try:
+            import tiktoken
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception as e:
+            logger.warning(f"tiktoken을 사용할 수 없어 토큰 수를 근사합니다: {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+def estimate_tokens(text: str) -> int:
+    """
+    토크나이저 없이 토큰 수를 근사합니다 (한글 음절 × TOKENS_PER_SYLLABLE + 영문/숫자 단어 × 1.3).
+    TOKENS_PER_SYLLABLE에 공백과 문장부호가 이미 포함되어 있으므로 한국어 문장의 기호는 따로 세지 않습니다.
+    """
+    return int(round(
+        len(HANGUL_SYLLABLE.findall(text)) * TOKENS_PER_SYLLABLE
+        + len(LATIN_WORD.findall(text)) * 1.3
+    ))
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+def count_syllables(text: str) -> int:
+    return len(HANGUL_SYLLABLE.findall(text))
+
+def spoken_minutes(text: str, syllables_per_minute: float = SPOKEN_SYLLABLES_PER_MINUTE) -> float:
+    """스크립트를 발표 속도로 읽었을 때 걸리는 시간(분)."""
+    return count_syllables(text) / syllables_per_minute
+
+def calibrate(scripts: list, model: str = "gpt-3.5-turbo") -> dict:
+    """생성된 스크립트들에서 음절당 토큰 수와 어절당 음절 수를 측정합니다."""
+    syllables = sum(count_syllables(script) for script in scripts)
+    words = sum(len(script.split()) for script in scripts)
+    tokens = sum(count_tokens(script, model) for script in scripts)
+    return {
+        "scripts": len(scripts),
+        "syllables": syllables,
+        "tokens": tokens,
+        "tokens_per_syllable": tokens / syllables if syllables else 0.0,
+        "syllables_per_word": syllables / words if words else 0.0,
+        "tokenizer": "tiktoken" if _encoding(model) is not None else "estimate",
+    }
+
+def script_token_budget(duration_minutes: float) -> dict:
+    """
+    발표 시간에 맞는 출력 토큰 예산을 계산합니다.
+    sections는 섹션별 목표 음절/어절/토큰 수, max_tokens는 섹션 합계에 여유와 본문 외 출력을 더한 값입니다.
+    """
+    total_syllables = duration_minutes * SPOKEN_SYLLABLES_PER_MINUTE
+    sections = {}
+    for name, ratio in SECTION_RATIOS.items():
+        syllables = total_syllables * ratio
+        sections[name] = {
+            "syllables": int(syllables),
+            "words": int(syllables / SYLLABLES_PER_WORD),
+            "tokens": int(math.ceil(syllables * TOKENS_PER_SYLLABLE)),
+        }
+    body_tokens = sum(section["tokens"] for section in sections.values())
+    max_tokens = int(math.ceil(body_tokens * SCRIPT_TOKEN_HEADROOM)) + SCRIPT_OVERHEAD_TOKENS
+    return {
+        "max_tokens": min(max_tokens, SCRIPT_MAX_COMPLETION_TOKENS),
+        "sections": sections,
+    }
@@ -1,14 +1,28 @@
 import os
+import asyncio
+import hashlib
 import shutil
 import subprocess
+import time
+import uuid
+import threading
 import cv2
 import logging
+import mimetypes
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 import requests  # 반드시 설치되어 있어야 합니다.
-from fastapi import FastAPI, HTTPException, File, UploadFile, BackgroundTasks, Form
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
-from emotion import analyze_single_image  # emotion.py의 analyze_single_image 함수
+from emotion import analyze_images, store_emotion_results, EMOTION_CACHE_PARAMS  # emotion.py의 분석/결과 저장 함수
+from analysis_cache import analysis_cache, ANALYSIS_AUDIO_FORMAT
+from results_store import results_store
 from dotenv import load_dotenv
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
 
 # 환경 변수 로드
 load_dotenv()
@@ -30,218 +44,711 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 디렉터리 설정
-UPLOAD_DIR = "./uploads"
-EXTRACTED_FRAMES_DIR = "./extracted_images"
-AUDIO_DIR = "./extracted_audio"
-VIDEO_DIR = "./extracted_video"
+# 디렉터리 설정: 업로드마다 WORKSPACE_ROOT/<job_id>/ 아래에 독립된 작업 공간을 만듭니다.
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "./jobs")
+# 감정 분석용 프레임 샘플링 간격(초)
+FRAME_INTERVAL_SECONDS = 5
+# 디버깅용: 1이면 샘플링한 프레임을 작업 공간의 extracted_images에도 저장합니다.
+DUMP_FRAMES = os.getenv("DUMP_FRAMES", "0") == "1"
+# 디버깅용: 1이면 작업이 끝나도 작업 공간을 지우지 않습니다.
+KEEP_WORKSPACES = os.getenv("KEEP_WORKSPACES", "0") == "1"
+# 재생용 오디오(mp3)는 작업 공간과 별도로 PLAYBACK_ROOT/<job_id>/에 두고 PLAYBACK_TTL_SECONDS(초) 동안 보관합니다.
+PLAYBACK_ROOT = os.getenv("PLAYBACK_ROOT", "./playback")
+PLAYBACK_TTL_SECONDS = int(os.getenv("PLAYBACK_TTL_SECONDS", str(24 * 3600)))
+# 만료된 재생용 오디오 정리 간격(초)
+PLAYBACK_PURGE_INTERVAL_SECONDS = 600
 
-for d in [UPLOAD_DIR, EXTRACTED_FRAMES_DIR, AUDIO_DIR, VIDEO_DIR]:
-    os.makedirs(d, exist_ok=True)
+os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+os.makedirs(PLAYBACK_ROOT, exist_ok=True)
 
-def clear_previous_files():
-    directories = [UPLOAD_DIR, EXTRACTED_FRAMES_DIR, AUDIO_DIR, VIDEO_DIR]
-    for directory in directories:
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
+class Workspace:
+    """
+    업로드 하나(job)의 파일을 모아 두는 디렉터리. 다른 업로드와 파일을 공유하지 않습니다.
+    작업이 끝나면 지우는 중간 파일(root)과, 작업 후에도 /audio로 제공하는 재생용 오디오(playback_dir)를 따로 둡니다.
+    """
+    def __init__(self, job_id=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.root = os.path.join(WORKSPACE_ROOT, self.job_id)
+        self.upload_dir = os.path.join(self.root, "uploads")
+        self.frames_dir = os.path.join(self.root, "extracted_images")
+        self.audio_dir = os.path.join(self.root, "extracted_audio")
+        self.video_dir = os.path.join(self.root, "extracted_video")
+        self.playback_dir = os.path.join(PLAYBACK_ROOT, self.job_id)
+
+    def create(self):
+        for d in [self.upload_dir, self.frames_dir, self.audio_dir, self.video_dir, self.playback_dir]:
+            os.makedirs(d, exist_ok=True)
+        return self
+
+    def cleanup(self, playback: bool = False):
+        """중간 파일을 지웁니다. playback=True면(작업이 실패해 재생할 것이 없을 때) 재생용 오디오도 지웁니다."""
+        paths = [self.root, self.playback_dir] if playback else [self.root]
+        if KEEP_WORKSPACES:
+            paths = paths[1:]
+        for path in paths:
             try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.remove(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
+                shutil.rmtree(path, ignore_errors=False)
+                logger.info(f"Workspace removed: {path}")
+            except FileNotFoundError:
+                pass
             except Exception as e:
-                logger.error(f"Error removing file {file_path}: {e}")
+                logger.error(f"Error removing workspace {path}: {e}")
+
+_last_playback_purge = 0.0
+
+def purge_playback(now: float = None) -> int:
+    """PLAYBACK_TTL_SECONDS보다 오래된 작업의 재생용 오디오를 지웁니다. PLAYBACK_PURGE_INTERVAL_SECONDS마다 한 번만 실행합니다."""
+    global _last_playback_purge
+    now = now or time.time()
+    if now - _last_playback_purge < PLAYBACK_PURGE_INTERVAL_SECONDS:
+        return 0
+    _last_playback_purge = now
+    removed = 0
+    for entry in os.scandir(PLAYBACK_ROOT):
+        try:
+            if entry.is_dir() and now - entry.stat().st_mtime > PLAYBACK_TTL_SECONDS:
+                shutil.rmtree(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error removing playback audio {entry.path}: {e}")
+    if removed:
+        logger.info(f"Playback audio: purged {removed} expired jobs")
+    return removed
+
+def playback_path(filename, workspace):
+    return os.path.join(workspace.playback_dir, f"{os.path.splitext(os.path.basename(filename))[0]}.mp3")
 
-def split_audio_video(mp4_path):
-    base_filename = os.path.splitext(os.path.basename(mp4_path))[0]
-    audio_path = os.path.join(AUDIO_DIR, f"{base_filename}.mp3")
-    video_path = os.path.join(VIDEO_DIR, f"{base_filename}_video.mp4")
+def playback_url(path, workspace):
+    return f"/vod/audio/{workspace.job_id}/{os.path.basename(path)}"
+
+def _ingest_command(input_spec, filename, workspace):
+    base_filename, source_ext = os.path.splitext(os.path.basename(filename))
+    audio_path = os.path.join(workspace.audio_dir, f"{base_filename}_analysis.ogg")
+    playback = playback_path(filename, workspace)
+    video_path = os.path.join(workspace.video_dir, f"{base_filename}_video{source_ext.lower()}")
+    command = [
+        "ffmpeg", "-y", "-i", input_spec,
+        # 분석용 오디오: VAD(speed)와 STT(whisper)가 함께 쓰는 16kHz 모노 Opus
+        "-map", "0:a:0", "-ac", str(ANALYSIS_AUDIO_FORMAT["channels"]), "-ar", str(ANALYSIS_AUDIO_FORMAT["sample_rate"]),
+        "-c:a", ANALYSIS_AUDIO_FORMAT["codec"], "-b:a", ANALYSIS_AUDIO_FORMAT["bitrate"], "-application", "voip", audio_path,
+        # 재생용 오디오: 원본 코덱(opus/aac)은 mp3가 아니므로 이 출력만 인코딩합니다.
+        "-map", "0:a:0", "-c:a", "libmp3lame", "-q:a", "0", playback,
+        # 영상 전용 스트림: 같은 컨테이너로 내보내므로 디코딩 없이 복사합니다.
+        "-map", "0:v:0", "-c:v", "copy", video_path,
+    ]
+    outputs = {"audio": audio_path, "playback": playback, "video": video_path}
+    return command, outputs
+
+def _output_timings(outputs, started_wall):
+    # 출력별 소요 시간: ffmpeg 시작 시점부터 각 출력이 마지막으로 기록된 시점까지
+    timings = {}
+    for name, path in outputs.items():
+        timings[name] = max(0.0, os.path.getmtime(path) - started_wall)
+    return timings
+
+def ingest_media(source_path, workspace):
+    """
+    업로드된 원본을 ffmpeg 한 번만 실행해 파이프라인에 필요한 산출물을 모두 만듭니다.
+    - 분석용 오디오(16kHz 모노 Opus, speed/whisper 단계 입력)
+    - 재생용 오디오(mp3, /audio 엔드포인트로 제공)
+    - 오디오가 제거된 영상 스트림 (원본 컨테이너 그대로 stream copy, 재인코딩 없음)
+    재생용 오디오는 workspace.playback_dir에, 나머지 결과물은 작업 공간 안에 만들어집니다.
+    반환값: (분석용 audio_path, video_path, timings), 실패 시 (None, None, timings)
+    """
+    command, outputs = _ingest_command(source_path, source_path, workspace)
+    timings = {}
+    started = time.monotonic()
+    started_wall = time.time()
     try:
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", mp4_path, "-q:a", "0", "-map", "a", audio_path],
-            check=True
-        )
-        logger.info(f"Audio separated: {audio_path}")
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", mp4_path, "-an", video_path],
-            check=True
-        )
-        logger.info(f"Video separated: {video_path}")
-        return audio_path, video_path
+        subprocess.run(command, check=True)
     except subprocess.CalledProcessError as e:
-        logger.error(f"Error separating audio/video: {e}")
-        return None, None
+        logger.error(f"Error ingesting media: {e}")
+        timings["total"] = time.monotonic() - started
+        return None, None, timings
+    timings["total"] = time.monotonic() - started
+    timings.update(_output_timings(outputs, started_wall))
+    logger.info(f"Media ingested: audio={outputs['audio']}, video={outputs['video']}, timings={timings}")
+    return outputs["audio"], outputs["video"], timings
 
-def extract_images(video_path, output_dir, interval_seconds=5):
-    os.makedirs(output_dir, exist_ok=True)
+def encode_playback(source_path, workspace) -> bool:
+    """분석 단계가 모두 캐시되어 ingest를 건너뛸 때 재생용 오디오만 만듭니다."""
+    command = [
+        "ffmpeg", "-y", "-i", source_path,
+        "-map", "0:a:0", "-c:a", "libmp3lame", "-q:a", "0", playback_path(source_path, workspace),
+    ]
+    try:
+        subprocess.run(command, check=True)
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error encoding playback audio: {e}")
+        return False
+    return True
+
+class StreamingIngest:
+    """
+    업로드 본문을 받는 동안 같은 청크를 ffmpeg stdin으로 흘려 보내 변환을 전송과 겹치게 합니다.
+    ingest_media와 같은 산출물을 만들며, 파이프 입력을 지원하지 않는 컨테이너는 사용하지 않습니다.
+    """
+    def __init__(self, filename, workspace):
+        self.command, self.outputs = _ingest_command("pipe:0", filename, workspace)
+        self.process = None
+        self.broken = False
+        self.started = None
+        self.started_wall = None
+
+    async def start(self):
+        self.started = time.monotonic()
+        self.started_wall = time.time()
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+    async def feed(self, chunk: bytes):
+        if self.broken:
+            return
+        try:
+            self.process.stdin.write(chunk)
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg가 먼저 종료됨: 업로드는 계속 받고, 끝난 뒤 파일 기반 ingest로 대체합니다.
+            self.broken = True
+
+    async def finish(self):
+        """반환값: (분석용 audio_path, video_path, timings), 실패 시 (None, None, timings)"""
+        if not self.broken:
+            try:
+                self.process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        returncode = await self.process.wait()
+        timings = {"total": time.monotonic() - self.started}
+        if self.broken or returncode != 0:
+            logger.error(f"Streaming ingest failed (returncode={returncode})")
+            return None, None, timings
+        timings.update(_output_timings(self.outputs, self.started_wall))
+        logger.info(f"Media ingested while uploading: timings={timings}")
+        return self.outputs["audio"], self.outputs["video"], timings
+
+    async def abort(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+
+def sample_frames(video_path, interval_seconds=5, dump_dir=None, jpeg_quality=90):
+    """
+    interval_seconds 간격의 프레임만 디코딩해 (파일명, JPEG 바이트)를 순서대로 yield 합니다.
+    - 샘플 시각으로 seek 하면 디코더는 직전 키프레임부터만 디코딩합니다.
+    - seek을 지원하지 않는 스트림은 grab()으로 건너뛰고 필요한 프레임만 retrieve() 합니다.
+    dump_dir이 주어지면 디버깅용으로 같은 JPEG를 디스크에도 저장합니다.
+    """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         logger.error(f"Error opening video: {video_path}")
         return
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    frame_interval = fps * interval_seconds
-    frame_index = 0
-    image_count = 0
+    if dump_dir is not None:
+        os.makedirs(dump_dir, exist_ok=True)
     base_filename = os.path.splitext(os.path.basename(video_path))[0]
-    while cap.isOpened():
+    encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    seekable = frame_count > 0 and cap.set(cv2.CAP_PROP_POS_MSEC, 0)
+    image_count = 0
+    try:
+        if seekable:
+            frames = _seek_frames(cap, frame_count / fps, interval_seconds)
+        else:
+            frames = _grab_frames(cap, max(1, int(round(fps * interval_seconds))))
+        for frame in frames:
+            ok, encoded = cv2.imencode(".jpg", frame, encode_params)
+            if not ok:
+                logger.error(f"Error encoding frame {image_count} of {video_path}")
+                continue
+            image_filename = f"{base_filename}_frame_{image_count:04d}.jpg"
+            image_bytes = encoded.tobytes()
+            if dump_dir is not None:
+                with open(os.path.join(dump_dir, image_filename), "wb") as f:
+                    f.write(image_bytes)
+            image_count += 1
+            yield image_filename, image_bytes
+    finally:
+        cap.release()
+        logger.info(f"Total frames sampled: {image_count}")
+
+def _seek_frames(cap, duration_seconds, interval_seconds):
+    position = 0.0
+    while position < duration_seconds:
+        cap.set(cv2.CAP_PROP_POS_MSEC, position * 1000)
         ret, frame = cap.read()
         if not ret:
             break
+        yield frame
+        position += interval_seconds
+
+def _grab_frames(cap, frame_interval):
+    frame_index = 0
+    while cap.grab():
         if frame_index % frame_interval == 0:
-            image_filename = f"{base_filename}_frame_{image_count:04d}.jpg"
-            image_path = os.path.join(output_dir, image_filename)
-            try:
-                cv2.imwrite(image_path, frame)
-                logger.info(f"Image saved: {image_path}")
-                image_count += 1
-            except Exception as e:
-                logger.error(f"Error saving image: {image_path}, {e}")
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            yield frame
         frame_index += 1
-    cap.release()
-    logger.info(f"Total images saved: {image_count}")
 
-@app.get("/audio/{filename}")
-def get_audio(filename: str):
-    audio_path = os.path.join(AUDIO_DIR, filename)
+def _audio_media_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+@app.get("/audio/{job_id}/{filename}")
+def get_audio(job_id: str, filename: str):
+    workspace = Workspace(os.path.basename(job_id))
+    audio_path = os.path.join(workspace.playback_dir, os.path.basename(filename))
     if os.path.exists(audio_path):
-        return FileResponse(audio_path, media_type="audio/mpeg")
+        return FileResponse(audio_path, media_type=_audio_media_type(audio_path))
     raise HTTPException(status_code=404, detail="Audio file not found")
 
 @app.get("/")
 def read_root():
     return {"message": "vod.py is running"}
 
-# 백그라운드 작업: Whisper 분석 트리거
-def trigger_whisper_analysis(audio_path: str, original_script: str):
+# 단계 호출 방식
+# - "local": end.py처럼 speed/whisper/emotion 앱이 같은 프로세스에 있을 때 함수를 직접 호출합니다.
+# - "http": 분리 배포된 서비스로 STAGE_BASE_URL에 HTTP 요청을 보냅니다.
+STAGE_DISPATCH = os.getenv("STAGE_DISPATCH", "local")
+STAGE_BASE_URL = os.getenv("STAGE_BASE_URL", "http://localhost:8000")
+
+# Whisper 분석 트리거
+def trigger_whisper_analysis(audio_path: str, original_script: str, content_hash: str = None, job_id: str = None) -> bool:
+    if STAGE_DISPATCH == "local":
+        from whisper_test import transcribe_and_compare
+        try:
+            # 캐시 적중으로 ingest를 건너뛴 경우 audio_path가 없습니다.
+            with (open(audio_path, "rb") if audio_path else nullcontext()) as audio_file:
+                result = transcribe_and_compare(
+                    audio_file, os.path.basename(audio_path or ""), original_script, content_hash, job_id
+                )
+            logger.info(f"Whisper analysis completed in-process: accuracy={result['accuracy']:.2f}")
+            return True
+        except Exception as e:
+            logger.error(f"Error running whisper analysis in-process: {e}")
+            return False
+
     # 변경된 URL: whisper 앱의 /update-results 엔드포인트
-    whisper_url = "http://localhost:8000/whisper/update-results"
-    logger.info("Sending audio file and original script to whisper analysis endpoint (background)...")
+    whisper_url = f"{STAGE_BASE_URL}/whisper/update-results"
+    logger.info("Sending audio file and original script to whisper analysis endpoint...")
     with open(audio_path, "rb") as audio_file:
-        files = {"file": (os.path.basename(audio_path), audio_file, "audio/mpeg")}
-        data = {"original_script": original_script}
+        files = {"file": (os.path.basename(audio_path), audio_file, _audio_media_type(audio_path))}
+        data = {"original_script": original_script, "job_id": job_id or ""}
         try:
             response = requests.post(whisper_url, files=files, data=data, timeout=60)
             if response.status_code != 200:
                 logger.error(f"Whisper analysis failed: {response.text}")
-            else:
-                logger.info(f"Whisper analysis triggered successfully: {response.json()}")
+                return False
+            logger.info(f"Whisper analysis triggered successfully: {response.json()}")
+            return True
         except Exception as e:
-            logger.error(f"Error triggering whisper analysis in background: {e}")
+            logger.error(f"Error triggering whisper analysis: {e}")
+            return False
+
 # 기존 속도 분석 트리거 (유지)
-def trigger_speed_analysis(audio_path: str):
-    speed_url = "http://localhost:8000/speed/upload-audio"
-    logger.info("Sending audio file to speed analysis endpoint (background)...")
+def trigger_speed_analysis(audio_path: str, content_hash: str = None, job_id: str = None) -> bool:
+    if STAGE_DISPATCH == "local":
+        from speed import analyze_audio_file
+        try:
+            # 작업 스레드에는 이벤트 루프가 없으므로 새 루프에서 실행합니다.
+            results = asyncio.run(analyze_audio_file(audio_path, content_hash, job_id))
+            logger.info(f"Speed analysis completed in-process: {len(results)} segments")
+            return True
+        except Exception as e:
+            logger.error(f"Error running speed analysis in-process: {e}")
+            return False
+
+    speed_url = f"{STAGE_BASE_URL}/speed/upload-audio"
+    logger.info("Sending audio file to speed analysis endpoint...")
     with open(audio_path, "rb") as audio_file:
-        files = {"audio": (os.path.basename(audio_path), audio_file, "audio/mpeg")}
+        files = {"audio": (os.path.basename(audio_path), audio_file, _audio_media_type(audio_path))}
         try:
-            speed_response = requests.post(speed_url, files=files, timeout=60)
+            speed_response = requests.post(speed_url, files=files, data={"job_id": job_id or ""}, timeout=60)
             if speed_response.status_code != 200:
                 logger.error(f"Speed analysis failed: {speed_response.text}")
-            else:
-                logger.info(f"Speed analysis triggered successfully: {speed_response.json()}")
+                return False
+            logger.info(f"Speed analysis triggered successfully: {speed_response.json()}")
+            return True
         except Exception as e:
-            logger.error(f"Error triggering speed analysis in background: {e}")
-
-# vod.py의 /upload/ 엔드포인트: 원본 스크립트도 Form 필드로 받음
-@app.post("/upload/")
-async def upload_video(
-    file: UploadFile = File(...),
-    original_script: str = Form(...),
-    background_tasks: BackgroundTasks = None
-):
+            logger.error(f"Error triggering speed analysis: {e}")
+            return False
+
+# emotion 분석 결과 업데이트
+def update_emotion_results(emotion_analysis_results: dict, job_id: str = None) -> bool:
+    if STAGE_DISPATCH == "local":
+        store_emotion_results(emotion_analysis_results, job_id)
+        return True
+
+    # 분리 배포 시 emotion.py의 /update-results 엔드포인트 호출
     try:
-        clear_previous_files()
-        
-        file_ext = file.filename.split(".")[-1].lower()
-        original_path = os.path.join(UPLOAD_DIR, file.filename)
-        if file_ext == "mp4":
-            mp4_path = original_path
-        else:
-            mp4_path = os.path.join(UPLOAD_DIR, file.filename.replace(f".{file_ext}", ".mp4"))
-        
-        with open(original_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        logger.info(f"File saved: {original_path}")
-        
-        # webm -> mp4 변환 (필요한 경우)
-        if file_ext == "webm":
-            try:
-                subprocess.run(
-                    [
-                        "ffmpeg", "-y", "-i", original_path,
-                        "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-                        "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart",
-                        mp4_path
-                    ],
-                    check=True
-                )
-                os.remove(original_path)
-                logger.info(f"Converted to mp4: {mp4_path}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Error converting to mp4: {e}")
-                raise HTTPException(status_code=500, detail="MP4 conversion failed")
-        
-        # 오디오/비디오 분리
-        audio_path, video_path = split_audio_video(mp4_path)
-        if audio_path is None or video_path is None:
-            raise HTTPException(status_code=500, detail="Audio/Video splitting failed")
-        
-        extract_images(video_path, EXTRACTED_FRAMES_DIR, interval_seconds=5)
-        
-        # 백그라운드 작업: 속도 분석 트리거
-        if background_tasks is not None:
-            background_tasks.add_task(trigger_speed_analysis, audio_path)
+        update_response = requests.post(
+            f"{STAGE_BASE_URL}/emotion/update-results",
+            json=emotion_analysis_results,
+            params={"job_id": job_id} if job_id else None,
+            timeout=60
+        )
+        if update_response.status_code != 200:
+            logger.error(f"Emotion update failed: {update_response.text}")
+            return False
+        logger.info("Emotion results updated successfully via POST /emotion/update-results")
+        return True
+    except Exception as e:
+        logger.error(f"Error updating emotion results: {e}")
+        return False
+
+# --- 비동기 작업 큐 ---
+# 동시에 처리할 업로드 수, 대기열 길이, 대기열이 가득 찼을 때 안내할 재시도 간격(초)
+VOD_MAX_CONCURRENT_JOBS = int(os.getenv("VOD_MAX_CONCURRENT_JOBS", "2"))
+VOD_MAX_QUEUED_JOBS = int(os.getenv("VOD_MAX_QUEUED_JOBS", "8"))
+VOD_RETRY_AFTER_SECONDS = int(os.getenv("VOD_RETRY_AFTER_SECONDS", "30"))
+# 끝난 작업의 상태를 보관하는 시간(초)
+VOD_JOB_TTL_SECONDS = int(os.getenv("VOD_JOB_TTL_SECONDS", "3600"))
+PIPELINE_STAGES = ["ingest", "emotion", "speed", "whisper"]
+
+job_executor = ThreadPoolExecutor(max_workers=VOD_MAX_CONCURRENT_JOBS)
+jobs = {}
+jobs_lock = threading.Lock()
+
+def _active_job_count() -> int:
+    return sum(1 for job in jobs.values() if job["status"] in ("receiving", "queued", "running"))
+
+def _prune_jobs():
+    # jobs_lock을 잡은 상태에서 호출합니다.
+    now = time.time()
+    expired = [
+        job_id for job_id, job in jobs.items()
+        if job.get("finished_at") and now - job["finished_at"] > VOD_JOB_TTL_SECONDS
+    ]
+    for job_id in expired:
+        del jobs[job_id]
+
+def _publish_job(job_id: str):
+    # jobs_lock을 잡은 상태에서 호출합니다. 다른 워커의 /jobs/{job_id} 조회를 위해 결과 저장소에도 기록합니다.
+    job = jobs[job_id]
+    results_store.put("job", {**job, "stages": {k: dict(v) for k, v in job["stages"].items()}}, job_id)
+
+def _update_job(job_id: str, **fields):
+    with jobs_lock:
+        jobs[job_id].update(fields)
+        _publish_job(job_id)
+
+def _update_stage(job_id: str, stage: str, status: str, **fields):
+    with jobs_lock:
+        jobs[job_id]["stages"][stage].update(status=status, **fields)
+        _publish_job(job_id)
+
+def _run_stage(job_id: str, stage: str, func, *args):
+    _update_stage(job_id, stage, "running")
+    started = time.monotonic()
+    try:
+        result = func(*args)
+    except Exception:
+        _update_stage(job_id, stage, "failed", seconds=time.monotonic() - started)
+        raise
+    status = "failed" if result is False else "done"
+    _update_stage(job_id, stage, status, seconds=time.monotonic() - started)
+    return result
+
+def _emotion_cache_params():
+    return {"interval_seconds": FRAME_INTERVAL_SECONDS, **EMOTION_CACHE_PARAMS}
+
+def _analyze_emotions(workspace, video_path, frame_prefix, content_hash=None):
+    # 같은 영상(content_hash)의 프레임별 결과가 캐시에 있으면 프레임을 디코딩하지 않습니다.
+    results = analysis_cache.get("emotion", content_hash, _emotion_cache_params()) if content_hash else None
+    if results is None:
+        # 필요한 프레임만 메모리에서 JPEG로 인코딩해 analyze_images로 동시에 분석
+        dump_dir = workspace.frames_dir if DUMP_FRAMES else None
+        frames = (image_bytes for _, image_bytes in sample_frames(
+            video_path, interval_seconds=FRAME_INTERVAL_SECONDS, dump_dir=dump_dir
+        ))
+        results = analyze_images(frames)
+        # 일시적인 API 오류가 캐시에 남지 않도록 모든 프레임이 성공한 경우에만 저장합니다.
+        if content_hash and not any("error" in result for result in results):
+            analysis_cache.put("emotion", content_hash, _emotion_cache_params(), results)
+    # 프레임 이름은 sample_frames와 같은 규칙으로 현재 업로드의 파일명에서 만듭니다.
+    emotion_analysis_results = {
+        f"{frame_prefix}_frame_{index:04d}.jpg": result for index, result in enumerate(results)
+    }
+    logger.info(f"Emotion analysis results: {emotion_analysis_results}")
+    update_emotion_results(emotion_analysis_results, workspace.job_id)
+    return emotion_analysis_results
+
+def _fully_cached(content_hash, original_script) -> bool:
+    """모든 분석 단계의 결과가 캐시에 있어 ingest(ffmpeg)를 건너뛸 수 있는지 확인합니다."""
+    if STAGE_DISPATCH != "local" or content_hash is None:
+        return False
+    from speed import VAD_CACHE_PARAMS
+    from whisper_test import TRANSCRIPT_CACHE_PARAMS
+    needed = [("emotion", _emotion_cache_params()), ("vad", VAD_CACHE_PARAMS)]
+    if original_script.strip():
+        needed.append(("transcript", TRANSCRIPT_CACHE_PARAMS))
+    return all(analysis_cache.contains(stage, content_hash, params) for stage, params in needed)
+
+def run_pipeline(workspace, original_path: str, original_script: str, ingest_result=None, content_hash=None):
+    """
+    작업 스레드에서 업로드 하나의 전체 분석(ingest → emotion → speed → whisper)을 실행합니다.
+    업로드 중에 스트리밍 ingest가 이미 끝났다면 ingest_result로 그 결과를 받아 재사용합니다.
+    content_hash(업로드 파일의 SHA-256)가 주어지면 단계별 분석 결과를 캐시에서 재사용합니다.
+    """
+    job_id = workspace.job_id
+    _update_job(job_id, status="running")
+    frame_prefix = f"{os.path.splitext(os.path.basename(original_path))[0]}_video"
+    try:
+        if ingest_result is not None:
+            audio_path, video_path, timings = ingest_result
+            _update_stage(job_id, "ingest", "done", timings=timings)
+        elif _fully_cached(content_hash, original_script):
+            logger.info(f"All stages cached for {content_hash[:12]}, skipping ingest")
+            audio_path, video_path = None, None
+            encode_playback(original_path, workspace)
+            _update_stage(job_id, "ingest", "skipped", cached=True)
         else:
-            trigger_speed_analysis(audio_path)
-        
-        # 백그라운드 작업: Whisper 분석 트리거 (원본 스크립트가 있으면 실행)
+            # 단일 ffmpeg 실행으로 오디오/영상 분리 (webm도 mp4로 재인코딩하지 않음)
+            audio_path, video_path, timings = _run_stage(job_id, "ingest", ingest_media, original_path, workspace)
+            if audio_path is None or video_path is None:
+                _update_stage(job_id, "ingest", "failed")
+                raise RuntimeError("Media ingest failed")
+            _update_stage(job_id, "ingest", "done", timings=timings)
+
+        if os.path.exists(playback_path(original_path, workspace)):
+            _update_job(job_id, playback_url=playback_url(playback_path(original_path, workspace), workspace))
+        _run_stage(job_id, "emotion", _analyze_emotions, workspace, video_path, frame_prefix, content_hash)
+        _run_stage(job_id, "speed", trigger_speed_analysis, audio_path, content_hash, job_id)
+        # Whisper 분석 트리거 (원본 스크립트가 있으면 실행)
         if original_script.strip():
-            if background_tasks is not None:
-                background_tasks.add_task(trigger_whisper_analysis, audio_path, original_script)
-            else:
-                trigger_whisper_analysis(audio_path, original_script)
+            _run_stage(job_id, "whisper", trigger_whisper_analysis, audio_path, original_script, content_hash, job_id)
         else:
             logger.info("No original script provided, skipping whisper analysis trigger.")
-        
-        # 자동 emotion 분석: 추출된 이미지들에 대해 emotion.py의 analyze_single_image 함수 호출
-        emotion_analysis_results = {}
-        extracted_files = os.listdir(EXTRACTED_FRAMES_DIR)
-        for filename in extracted_files:
-            image_path = os.path.join(EXTRACTED_FRAMES_DIR, filename)
-            try:
-                with open(image_path, "rb") as f:
-                    image_bytes = f.read()
-                result = analyze_single_image(image_bytes)
-                emotion_analysis_results[filename] = result
-            except Exception as e:
-                logger.error(f"Error analyzing emotion for {filename}: {e}")
-        logger.info(f"Emotion analysis results: {emotion_analysis_results}")
-        
-        # POST로 emotion 분석 결과 업데이트 (emotion.py의 /update-results 엔드포인트 호출)
-        try:
-            update_response = requests.post(
-                "http://localhost:8000/emotion/update-results",
-                json=emotion_analysis_results,
-                timeout=60
+            _update_stage(job_id, "whisper", "skipped")
+        _update_job(job_id, status="done", finished_at=time.time())
+    except Exception as e:
+        logger.error(f"Error in job {job_id}: {e}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        workspace.cleanup()
+        purge_playback()
+
+# --- 스트리밍 업로드 수신 ---
+# 디스크/해시/ffmpeg에 넘기는 청크 크기와 텍스트 필드 최대 크기
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_FORM_FIELD_BYTES = 1024 * 1024
+# ffmpeg가 stdin 파이프로 읽을 수 있는 컨테이너 (mp4/mov는 moov 위치에 따라 seek이 필요해 제외)
+STREAMABLE_EXTS = {"webm", "mkv"}
+
+async def receive_upload(request: Request, workspace) -> dict:
+    """
+    multipart 요청 본문을 도착하는 대로 파싱합니다.
+    file 파트는 UPLOAD_CHUNK_SIZE 단위로 작업 공간에 기록하면서 SHA-256을 계산하고,
+    스트리밍 가능한 컨테이너면 같은 청크를 ffmpeg stdin에도 넣어 전송 중에 변환을 진행합니다.
+    요청 크기와 무관하게 메모리에는 청크 하나 정도만 머뭅니다.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="multipart/form-data body is required")
+
+    events = []
+    header = {"field": b"", "value": b"", "headers": {}}
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        header["headers"][header["field"].lower()] = header["value"]
+        header["field"], header["value"] = b"", b""
+
+    def on_headers_finished():
+        events.append(("begin", header["headers"]))
+        header["headers"] = {}
+
+    def on_part_data(data, start, end):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    upload = {"original_path": None, "sha256": None, "size": 0, "fields": {}, "ingest": None}
+    part = {"name": None, "file": None, "buffer": bytearray()}
+    hasher = hashlib.sha256()
+
+    async def write_chunk(chunk):
+        part["file"].write(chunk)
+        hasher.update(chunk)
+        upload["size"] += len(chunk)
+        if upload["ingest"] is not None:
+            await upload["ingest"].feed(chunk)
+
+    async def handle_events():
+        for kind, payload in events:
+            if kind == "begin":
+                _, disposition = parse_options_header(payload.get(b"content-disposition", b""))
+                part["name"] = disposition.get(b"name", b"").decode()
+                part["buffer"] = bytearray()
+                filename = disposition.get(b"filename")
+                if part["name"] == "file" and filename:
+                    # 요청 하나에는 영상 파일 하나만 받습니다. 두 번째 파일이 오면 앞선 변환 프로세스를 남기지 않고 거절합니다.
+                    if upload["original_path"] is not None:
+                        raise HTTPException(status_code=400, detail="Only one file part is allowed")
+                    filename = os.path.basename(filename.decode())
+                    upload["original_path"] = os.path.join(workspace.upload_dir, filename)
+                    part["file"] = open(upload["original_path"], "wb")
+                    if filename.split(".")[-1].lower() in STREAMABLE_EXTS:
+                        upload["ingest"] = StreamingIngest(filename, workspace)
+                        await upload["ingest"].start()
+            elif kind == "data":
+                part["buffer"] += payload
+                if part["file"] is not None:
+                    while len(part["buffer"]) >= UPLOAD_CHUNK_SIZE:
+                        chunk = bytes(part["buffer"][:UPLOAD_CHUNK_SIZE])
+                        del part["buffer"][:UPLOAD_CHUNK_SIZE]
+                        await write_chunk(chunk)
+                elif len(part["buffer"]) > MAX_FORM_FIELD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Form field '{part['name']}' is too large")
+            elif kind == "end":
+                if part["file"] is not None:
+                    if part["buffer"]:
+                        await write_chunk(bytes(part["buffer"]))
+                    part["file"].close()
+                    part["file"] = None
+                    upload["sha256"] = hasher.hexdigest()
+                else:
+                    upload["fields"][part["name"]] = part["buffer"].decode("utf-8")
+                part["buffer"] = bytearray()
+        events.clear()
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await handle_events()
+        parser.finalize()
+        await handle_events()
+    except BaseException:
+        if part["file"] is not None:
+            part["file"].close()
+        if upload["ingest"] is not None:
+            await upload["ingest"].abort()
+        raise
+    return upload
+
+# vod.py의 /upload/ 엔드포인트: multipart의 file과 original_script 필드를 받음
+# 업로드를 받으면서 변환을 시작하고, 나머지 분석은 작업 큐에 넣은 뒤 202와 job_id를 반환합니다.
+@app.post("/upload/", status_code=202)
+async def upload_video(request: Request):
+    with jobs_lock:
+        _prune_jobs()
+        if _active_job_count() >= VOD_MAX_CONCURRENT_JOBS + VOD_MAX_QUEUED_JOBS:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many videos are being processed. Please retry later.",
+                headers={"Retry-After": str(VOD_RETRY_AFTER_SECONDS)}
             )
-            if update_response.status_code != 200:
-                logger.error(f"Emotion update failed: {update_response.text}")
-            else:
-                logger.info("Emotion results updated successfully via POST /emotion/update-results")
-        except Exception as e:
-            logger.error(f"Error updating emotion results: {e}")
-        
-        return {
-            "message": "Video processed successfully",
-            "mp4_file": mp4_path,
-            "audio_file": audio_path,
-            "video_file": video_path,
-            "emotion_analysis": emotion_analysis_results
+        workspace = Workspace()
+        jobs[workspace.job_id] = {
+            "job_id": workspace.job_id,
+            "status": "receiving",
+            "stages": {stage: {"status": "pending"} for stage in PIPELINE_STAGES},
+            "created_at": time.time(),
         }
-        
+        _publish_job(workspace.job_id)
+    upload = None
+
+    async def fail(error):
+        # 받던 중 시작한 변환 프로세스를 정리하고, 작업을 실패로 표시해 대기열 자리를 돌려줍니다.
+        _update_job(workspace.job_id, status="failed", error=error, finished_at=time.time())
+        try:
+            if upload is not None and upload["ingest"] is not None:
+                await upload["ingest"].abort()
+        finally:
+            workspace.cleanup(playback=True)
+
+    try:
+        workspace.create()
+        upload = await receive_upload(request, workspace)
+        if upload["original_path"] is None:
+            raise HTTPException(status_code=422, detail="file field is required")
+        if "original_script" not in upload["fields"]:
+            raise HTTPException(status_code=422, detail="original_script field is required")
+        logger.info(f"File saved: {upload['original_path']} ({upload['size']} bytes, sha256={upload['sha256']})")
+
+        ingest_result = None
+        if upload["ingest"] is not None:
+            ingest_result = await upload["ingest"].finish()
+            if ingest_result[0] is None:
+                # 파이프 입력으로 처리하지 못한 파일은 작업 스레드에서 파일 기반으로 다시 변환합니다.
+                ingest_result = None
+        _update_job(workspace.job_id, status="queued", sha256=upload["sha256"], size=upload["size"])
+        job_executor.submit(
+            run_pipeline, workspace, upload["original_path"], upload["fields"]["original_script"],
+            ingest_result, upload["sha256"]
+        )
     except Exception as e:
         logger.error(f"Error in upload: {e}")
+        await fail(str(e))
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=str(e))
+    except BaseException:
+        # 클라이언트가 전송 중 연결을 끊으면 CancelledError가 올라옵니다. "receiving" 상태로 남지 않게 실패 처리합니다.
+        logger.warning(f"Upload cancelled: job_id={workspace.job_id}")
+        await fail("Upload was cancelled")
+        raise
+
+    return {
+        "message": "Video accepted for processing",
+        "job_id": workspace.job_id,
+        # 마운트 위치(root_path)를 포함한 경로라서 단독 실행이나 다른 경로에 마운트해도 맞습니다.
+        "status_url": request.scope.get("root_path", "") + app.url_path_for("get_job_status", job_id=workspace.job_id),
+    }
+
+# 분석 결과 캐시 적중률 조회
+@app.get("/cache/stats")
+def get_cache_stats():
+    return analysis_cache.stats()
+
+# 작업 상태/단계별 진행 상황 조회 (다른 워커가 처리 중인 작업은 결과 저장소에서 읽습니다)
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is not None:
+            job = {**job, "stages": {k: dict(v) for k, v in job["stages"].items()}}
+    if job is None:
+        job = results_store.get("job", job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+    completed = sum(1 for s in job["stages"].values() if s["status"] in ("done", "skipped"))
+    return {**job, "progress": completed / len(job["stages"])}
+
+# 작업의 단계별 분석 결과 (emotion, speed, whisper) 조회
+@app.get("/jobs/{job_id}/results")
+def get_job_results(job_id: str):
+    results = results_store.get_job(job_id)
+    if not results:
+        raise HTTPException(status_code=404, detail="Job not found")
+    results.pop("job", None)
+    return results
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    job_executor.shutdown(wait=True)
 
 if __name__ == "__main__":
     import uvicorn
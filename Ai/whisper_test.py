@@ -1,14 +1,27 @@
+import io
 import os
+import json
+import asyncio
 import re
-import difflib
-import io
 import logging
 import traceback
+import threading
+import uuid
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
-import requests  # 직접 HTTP 요청용.
-import openai
+from analysis_cache import analysis_cache, fileobj_sha256, ANALYSIS_AUDIO_FORMAT
+from results_store import results_store
+from stt_backends import (
+    STT_BACKEND, TRANSCRIPTION_PARAMS, WHISPER_MAX_CONCURRENCY, STTError, STTTimeoutError,
+    audio_file_path, create_stt_backend,
+)
+from diff_engine import IncrementalAligner, create_diff_html_and_count, tokenize_with_punctuation
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,9 +31,8 @@ env_path = os.path.join(current_dir, ".env")
 load_dotenv(dotenv_path=env_path)
 
 api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
+if not api_key and STT_BACKEND == "openai":
     raise Exception("OpenAI API 키가 설정되지 않았습니다. .env 파일을 확인해주세요.")
-openai.api_key = api_key
 
 app = FastAPI(
     title="Whisper 텍스트 변환 및 비교 API",
@@ -36,12 +48,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-whisper_results_memory = None
+# 이보다 긴 오디오는 무음 구간에서 잘라 청크별로 동시에 변환합니다 (0이면 나누지 않음).
+# 기본 10분: 24kbps Opus 기준 약 1.8MB로 업로드 크기 제한(25MB)보다 충분히 작습니다.
+WHISPER_CHUNK_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "600"))
+# 나눠서 변환할 때 첫 청크는 짧게 잘라 부분 결과(/analysis-stream)가 몇 초 안에 나오게 합니다.
+WHISPER_FIRST_CHUNK_SECONDS = float(os.getenv("WHISPER_FIRST_CHUNK_SECONDS", "60"))
+WHISPER_CHUNK_BITRATE = os.getenv("WHISPER_CHUNK_BITRATE", "24k")
+# STT 백엔드 (STT_BACKEND 환경 변수, stt_backends.py 참고)
+stt_backend = create_stt_backend(STT_BACKEND)
+# 변환 결과 캐시 키 (백엔드 설정과, 결과가 조금 달라질 수 있는 분석용 오디오 형식/청크 길이 포함)
+TRANSCRIPT_CACHE_PARAMS = dict(
+    stt_backend.cache_params(),
+    audio_format=ANALYSIS_AUDIO_FORMAT,
+    chunk_bitrate=WHISPER_CHUNK_BITRATE,
+    chunk_seconds=WHISPER_CHUNK_SECONDS,
+    first_chunk_seconds=WHISPER_FIRST_CHUNK_SECONDS,
+)
 
-class NamedBytesIO(io.BytesIO):
-    def __init__(self, *args, name=None, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.name = name
+# 모든 요청이 공유하는 청크 변환 스레드 풀
+transcription_pool = ThreadPoolExecutor(max_workers=WHISPER_MAX_CONCURRENCY)
 
 def clean_text(text: str) -> str:
     # 타임스탬프 등 불필요한 부분 제거
@@ -58,122 +83,283 @@ def filter_special_sentences(text: str) -> str:
     filtered = [s for s in sentences if not re.search(r'[\*\#\-]', s)]
     return " ".join(filtered)
 
-def tokenize_with_punctuation(text: str):
-    tokens = re.findall(r"\w+|[^\w\s]", text)
-    return tokens
-
-def highlight_diff_in_orig(orig_token: str, trans_token: str) -> str:
-    i = 0
-    min_len = min(len(orig_token), len(trans_token))
-    while i < min_len and orig_token[i] == trans_token[i]:
-        i += 1
-    j = 0
-    while j < (min_len - i) and orig_token[-1 - j] == trans_token[-1 - j]:
-        j += 1
-    prefix = orig_token[:i]
-    if j > 0:
-        diff_mid = orig_token[i:len(orig_token) - j]
-        suffix = orig_token[len(orig_token) - j:]
-    else:
-        diff_mid = orig_token[i:]
-        suffix = ""
-    if diff_mid:
-        diff_mid = f'<span class="diff-delete">{diff_mid}</span>'
-    return prefix + diff_mid + suffix
-
-def create_diff_html_and_count(orig: str, trans: str) -> (str, int):
-    orig_tokens = tokenize_with_punctuation(orig)
-    trans_tokens = tokenize_with_punctuation(trans)
-    matcher = difflib.SequenceMatcher(None, orig_tokens, trans_tokens)
-    diff_parts = []
-    diff_count = 0
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == "equal":
-            diff_parts.extend(orig_tokens[i1:i2])
-        elif tag == "delete":
-            tokens_del = orig_tokens[i1:i2]
-            diff_count += len(tokens_del)
-            for token in tokens_del:
-                diff_parts.append(f'<span class="diff-delete">{token}</span>')
-        elif tag == "replace":
-            orig_chunk = orig_tokens[i1:i2]
-            trans_chunk = trans_tokens[j1:j2]
-            if (i2 - i1) == (j2 - j1):
-                for o_token, t_token in zip(orig_chunk, trans_chunk):
-                    if o_token == t_token:
-                        diff_parts.append(o_token)
-                    else:
-                        diff_count += 1
-                        diff_parts.append(highlight_diff_in_orig(o_token, t_token))
-            else:
-                diff_count += len(orig_chunk)
-                for o_token in orig_chunk:
-                    diff_parts.append(f'<span class="diff-delete">{o_token}</span>')
-        elif tag == "insert":
-            pass
-    return ' '.join(diff_parts), diff_count
+def transcript_text(transcript: dict) -> str:
+    return " ".join([seg.get("text", "").strip() for seg in transcript.get("segments", [])])
+
+class ProgressBroadcaster:
+    """
+    작업 스레드에서 발행한 변환 진행 이벤트를 같은 작업(job_id)의 SSE 구독자(각자의 asyncio 큐)에게 전달합니다.
+    새 구독자는 그 작업의 가장 최근 이벤트부터 받습니다. 최근 이벤트는 최근 max_jobs개 작업만 보관합니다.
+    """
+    def __init__(self, max_jobs: int = 256):
+        self.lock = threading.Lock()
+        self.max_jobs = max_jobs
+        self.subscribers = {}  # job_id -> {(이벤트 루프, 큐)}
+        self.latest = OrderedDict()  # job_id -> 가장 최근 (이벤트, 데이터)
+
+    def publish(self, job_id: str, event: str, data: dict):
+        with self.lock:
+            self.latest[job_id] = (event, data)
+            self.latest.move_to_end(job_id)
+            while len(self.latest) > self.max_jobs:
+                self.latest.popitem(last=False)
+            subscribers = self.subscribers.get(job_id, set())
+            for loop, queue in list(subscribers):
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+                except RuntimeError:
+                    # 이벤트 루프가 이미 닫힌 구독자
+                    subscribers.discard((loop, queue))
+
+    def subscribe(self, job_id: str):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            self.subscribers.setdefault(job_id, set()).add(subscription)
+            if job_id in self.latest:
+                subscription[1].put_nowait(self.latest[job_id])
+        return subscription
+
+    def unsubscribe(self, job_id: str, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[job_id]
+
+whisper_progress = ProgressBroadcaster()
+SSE_KEEPALIVE_SECONDS = 15
+
+def plan_chunks(speech_segments, max_seconds: float, first_max_seconds: float = None) -> list:
+    """
+    VAD 음성 구간(start_time, end_time 목록)을 보고 각 청크가 max_seconds(첫 청크는 first_max_seconds)를
+    넘지 않도록 음성 구간 사이 무음의 가운데에서 자를 위치를 정합니다.
+    (시작, 끝) 목록을 반환하며 마지막 청크의 끝은 None(파일 끝)입니다.
+    하나의 음성 구간이 제한보다 길면 그 안에서 제한 길이마다 자릅니다.
+    """
+    cuts = [0.0]
+
+    def limit():
+        return first_max_seconds if first_max_seconds and len(cuts) == 1 else max_seconds
+
+    previous_end = None
+    for segment in speech_segments:
+        start, end = segment["start_time"], segment["end_time"]
+        if end - cuts[-1] > limit() and previous_end is not None and previous_end > cuts[-1]:
+            cuts.append((previous_end + start) / 2)
+        while end - cuts[-1] > limit():
+            cuts.append(cuts[-1] + limit())
+        previous_end = end
+    return list(zip(cuts, cuts[1:] + [None]))
+
+def extract_chunk(path: str, start: float, end) -> bytes:
+    """ffmpeg로 [start, end) 구간을 분석용 오디오와 같은 16kHz 모노 Opus(ogg)로 잘라 바이트로 반환합니다."""
+    command = ["ffmpeg", "-v", "error", "-ss", f"{start:.3f}", "-i", path]
+    if end is not None:
+        command += ["-t", f"{end - start:.3f}"]
+    command += [
+        "-vn", "-ac", "1", "-ar", "16000",
+        "-c:a", "libopus", "-b:a", WHISPER_CHUNK_BITRATE, "-application", "voip", "-f", "ogg", "pipe:1",
+    ]
+    return subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+
+def stitch_transcripts(parts, offsets) -> dict:
+    """
+    청크별 verbose_json 결과를 청크 시작 시각만큼 타임스탬프를 옮겨 하나의 verbose_json으로 합칩니다.
+    세그먼트 id는 0부터 다시 매깁니다.
+    """
+    segments = []
+    for part, offset in zip(parts, offsets):
+        for segment in part.get("segments", []):
+            segment = dict(segment, id=len(segments))
+            segment["start"] = segment.get("start", 0.0) + offset
+            segment["end"] = segment.get("end", 0.0) + offset
+            if "words" in segment:
+                segment["words"] = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in segment["words"]]
+            segments.append(segment)
+    last = parts[-1] if parts else {}
+    return {
+        "task": last.get("task", "transcribe"),
+        "language": last.get("language", TRANSCRIPTION_PARAMS["language"]),
+        "duration": offsets[-1] + last.get("duration", 0.0) if parts else 0.0,
+        "text": " ".join(part.get("text", "").strip() for part in parts),
+        "segments": segments,
+    }
+
+def speech_segments(path: str, content_hash: str) -> list:
+    """speed 단계가 이미 계산한 VAD 세그먼트를 캐시에서 가져오고, 없으면 새로 계산합니다."""
+    from speed import VAD_CACHE_PARAMS, stream_vad_segments
+    segments = analysis_cache.get("vad", content_hash, VAD_CACHE_PARAMS)
+    return segments if segments is not None else stream_vad_segments(path)
+
+def _single_transcription(audio_file, filename: str, on_part=None) -> dict:
+    transcript = stt_backend.transcribe(audio_file, filename)
+    if on_part:
+        on_part(0.0, transcript)
+    return transcript
+
+def transcribe_chunked(audio_file, filename: str, content_hash: str, on_part=None) -> dict:
+    """
+    WHISPER_CHUNK_SECONDS보다 긴 오디오를 무음 구간에서 나눠 transcription_pool에서 동시에 변환하고
+    하나의 verbose_json으로 이어 붙입니다. 짧은 오디오는 한 번에 보냅니다.
+    on_part(청크 시작 시각, 청크 결과)는 앞 청크부터 순서대로, 각 청크가 끝나는 대로 호출됩니다.
+    """
+    if WHISPER_CHUNK_SECONDS <= 0:
+        return _single_transcription(audio_file, filename, on_part)
+    with audio_file_path(audio_file) as path:
+        segments = speech_segments(path, content_hash)
+        if len(plan_chunks(segments, WHISPER_CHUNK_SECONDS)) == 1:
+            return _single_transcription(audio_file, filename, on_part)
+        chunks = plan_chunks(segments, WHISPER_CHUNK_SECONDS, WHISPER_FIRST_CHUNK_SECONDS)
+        logger.info(f"Transcribing {filename} in {len(chunks)} chunks (max {WHISPER_MAX_CONCURRENCY} concurrent)")
+        stem = os.path.splitext(filename)[0]
+
+        def transcribe_chunk(index, start, end):
+            data = extract_chunk(path, start, end)
+            return stt_backend.transcribe(io.BytesIO(data), f"{stem}_{index:03d}.ogg")
+
+        futures = [transcription_pool.submit(transcribe_chunk, i, start, end) for i, (start, end) in enumerate(chunks)]
+        parts = []
+        for (start, _), future in zip(chunks, futures):
+            parts.append(future.result())
+            if on_part:
+                on_part(start, parts[-1])
+    return stitch_transcripts(parts, [start for start, _ in chunks])
+
+def transcribe_audio(audio_file, filename: str, content_hash: str = None, on_part=None) -> dict:
+    """
+    오디오를 Whisper API로 변환해 verbose_json 결과를 반환합니다.
+    같은 내용(content_hash)의 변환 결과가 캐시에 있으면 API를 호출하지 않으며, 이때 audio_file은 None이어도 됩니다.
+    on_part가 있으면 변환된 부분이 생길 때마다 호출합니다 (캐시 적중 시 전체 결과로 한 번).
+    """
+    content_hash = content_hash or fileobj_sha256(audio_file)
+    transcript = analysis_cache.get("transcript", content_hash, TRANSCRIPT_CACHE_PARAMS)
+    if transcript is not None:
+        if on_part:
+            on_part(0.0, transcript)
+        return transcript
+    transcript = transcribe_chunked(audio_file, filename, content_hash, on_part)
+    logger.info("Whisper API 호출 성공.")
+    analysis_cache.put("transcript", content_hash, TRANSCRIPT_CACHE_PARAMS, transcript)
+    return transcript
+
+def transcribe_and_compare(audio_file, filename: str, original_script: str, content_hash: str = None,
+                           job_id: str = None) -> dict:
+    """
+    오디오를 Whisper API로 변환하고 원본 스크립트와 비교한 결과를 결과 저장소에 작업(job_id)별로 저장 후 반환합니다.
+    audio_file은 바이트를 읽을 수 있는 파일 객체이며, 업로드 엔드포인트와 vod.py의 직접 호출이 함께 사용합니다.
+    """
+    # 진행 이벤트를 작업별로 구분하도록 단독 호출에도 미리 job_id를 정합니다.
+    job_id = job_id or uuid.uuid4().hex
+    # 원본 스크립트 클린징 후 특수문자 포함 문장 삭제
+    original_clean = clean_text(original_script)
+    original_filtered = filter_special_sentences(original_clean)
+
+    # 청크가 변환될 때마다 스크립트 앞부분부터 정렬해 부분 정확도를 /analysis-stream 구독자에게 보냅니다.
+    aligner = IncrementalAligner(original_filtered)
+    whisper_progress.publish(job_id, "start", aligner.snapshot())
+
+    def on_part(offset, part):
+        partial = aligner.feed(clean_text(transcript_text(part)))
+        partial["transcribed_seconds"] = offset + part.get("duration", 0.0)
+        whisper_progress.publish(job_id, "partial", partial)
+
+    try:
+        transcript = transcribe_audio(audio_file, filename, content_hash, on_part)
+    except Exception as e:
+        whisper_progress.publish(job_id, "error", {"detail": str(e)})
+        raise
+    transcription_text = clean_text(transcript_text(transcript))
+
+    # Whisper로 변환된 텍스트와 비교
+    diff_html, diff_count = create_diff_html_and_count(original_filtered, transcription_text)
+    orig_tokens = tokenize_with_punctuation(original_filtered)
+    total_words = len(orig_tokens)
+    accuracy = ((total_words - diff_count) / total_words) * 100 if total_words > 0 else 100.0
+
+    result = {
+        "accuracy": accuracy,
+        "diff_count": diff_count,
+        "diff_html": diff_html,
+        "original_clean": original_filtered,
+        "transcription": transcription_text
+    }
+    results_store.put("whisper", result, job_id)
+    whisper_progress.publish(job_id, "result", result)
+    return result
 
 @app.post("/update-results")
 async def update_whisper_results(
     original_script: str = Form(...),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    job_id: str = Form(None)
 ):
-    global whisper_results_memory
     try:
-        audio_bytes = await file.read()
-        logger.info(f"Received file '{file.filename}' of size: {len(audio_bytes)} bytes")
-        audio_file = NamedBytesIO(audio_bytes, name=file.filename)
-        # Whisper API 호출을 위해 직접 HTTP 요청 사용
-        headers = {
-            "Authorization": f"Bearer {openai.api_key}"
-        }
-        files_payload = {
-            "file": (audio_file.name, audio_file, "audio/mpeg")
-        }
-        data_payload = {
-            "model": "whisper-1",
-            "response_format": "verbose_json",
-            "temperature": 0.0,
-            "language": "ko"
-        }
-        response = requests.post("https://api.openai.com/v1/audio/transcriptions", headers=headers, files=files_payload, data=data_payload)
-        if response.status_code != 200:
-            logger.error(f"Whisper API 호출 실패: {response.text}")
-            raise HTTPException(status_code=500, detail="Whisper API 호출 실패")
-        transcript = response.json()
-        logger.info("Whisper API 호출 성공.")
-        segments = transcript.get("segments", [])
-        refined_text = " ".join([seg.get("text", "").strip() for seg in segments])
-        transcription_text = clean_text(refined_text)
-        
-        # 원본 스크립트 클린징 후 특수문자 포함 문장 삭제
-        original_clean = clean_text(original_script)
-        original_filtered = filter_special_sentences(original_clean)
-        
-        # Whisper로 변환된 텍스트와 비교
-        diff_html, diff_count = create_diff_html_and_count(original_filtered, transcription_text)
-        orig_tokens = tokenize_with_punctuation(original_filtered)
-        total_words = len(orig_tokens)
-        accuracy = ((total_words - diff_count) / total_words) * 100 if total_words > 0 else 100.0
-
-        whisper_results_memory = {
-            "accuracy": accuracy,
-            "diff_count": diff_count,
-            "diff_html": diff_html,
-            "original_clean": original_filtered,
-            "transcription": transcription_text
-        }
-        return whisper_results_memory
+        # UploadFile의 임시 파일을 그대로 넘겨 전체 내용을 메모리에 복사하지 않습니다.
+        file.file.seek(0, os.SEEK_END)
+        logger.info(f"Received file '{file.filename}' of size: {file.file.tell()} bytes")
+        file.file.seek(0)
+        # 해시 계산, VAD, ffmpeg, Whisper 호출이 모두 블로킹이므로 스레드에서 실행해 이벤트 루프를 막지 않습니다.
+        return await run_in_threadpool(transcribe_and_compare, file.file, file.filename, original_script, None, job_id)
+    except STTTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except STTError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"오류 발생: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"오류 발생: {str(e)}")
 
 @app.get("/analysis-results")
-async def get_whisper_analysis():
-    if whisper_results_memory is None:
+def get_whisper_analysis(job_id: str = None):
+    # job_id가 없으면 가장 최근 결과를 반환합니다.
+    result = results_store.get("whisper", job_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="분석 결과가 없습니다.")
-    return whisper_results_memory
+    return result
+
+@app.get("/analysis-stream")
+async def stream_whisper_analysis(job_id: str = None):
+    """
+    진행 중인 발음 분석을 SSE로 보냅니다.
+    start → partial(청크마다: accuracy, diff_count, diff_html, aligned_tokens, total_tokens, transcribed_seconds)
+    → result(/analysis-results와 같은 최종 결과) 또는 error 순서이며, result/error 후 스트림을 닫습니다.
+    부분 결과는 분석 중인 워커에서만 나오므로, 다른 워커에 연결된 경우 keep-alive마다 결과 저장소를 확인해 result만 보냅니다.
+    job_id가 없으면 진행 이벤트 없이 가장 최근 결과가 새로 저장될 때 result만 보냅니다.
+    """
+    subscription = whisper_progress.subscribe(job_id)
+    initial = await run_in_threadpool(results_store.get, "whisper", job_id)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(subscription[1].get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    stored = await run_in_threadpool(results_store.get, "whisper", job_id)
+                    if stored is not None and stored != initial:
+                        yield f"event: result\ndata: {json.dumps(stored, ensure_ascii=False)}\n\n"
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                if event in ("result", "error"):
+                    break
+        finally:
+            whisper_progress.unsubscribe(job_id, subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.on_event("shutdown")
+def shutdown_event():
+    transcription_pool.shutdown(wait=True)
+    stt_backend.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -11,11 +11,42 @@ function CreateScripts() {
   const [purpose, setPurpose] = useState("");
   const [summary, setSummary] = useState("");
   const [loading, setLoading] = useState(false);
+  const [preview, setPreview] = useState([]); // 생성 중 도착한 문장 미리보기
+
+  // /ai/predict/stream의 SSE 응답을 읽으면서 완성된 문장을 미리보기에 추가하고, 최종 스크립트를 반환합니다.
+  const readScriptStream = async (response) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const event = (block.match(/^event: (.*)$/m) || [])[1];
+        const data = (block.match(/^data: (.*)$/m) || [])[1];
+        if (!data) continue;
+        const payload = JSON.parse(data);
+        if (event === "sentence" && payload.text) {
+          setPreview((prev) => [...prev, payload.text]);
+        } else if (event === "result") {
+          return payload.script;
+        } else if (event === "error") {
+          throw new Error(payload.detail);
+        }
+      }
+    }
+    throw new Error("스크립트 생성이 완료되지 않았습니다.");
+  };
 
   const handleGenerateScript = async () => {
     setLoading(true);
+    setPreview([]);
     try {
-      const response = await fetch("http://localhost:5000/ai/predict", {
+      const response = await fetch("http://localhost:5000/ai/predict/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -27,8 +58,11 @@ function CreateScripts() {
           duration: selectedTime,
         }),
       });
-      const data = await response.json();
-      navigate("/create-scripts-output", { state: { script: data.script } });
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const script = await readScriptStream(response);
+      navigate("/create-scripts-output", { state: { script } });
     } catch (error) {
       console.error("API 호출 오류:", error);
     } finally {
@@ -108,6 +142,11 @@ function CreateScripts() {
       >
         {loading ? "생성 중..." : "스크립트 생성"}
       </button>
+
+      {/* 생성 중인 스크립트 미리보기 */}
+      {loading && preview.length > 0 && (
+        <div className="create-scripts-preview">{preview.join(" ")}</div>
+      )}
     </div>
   );
 }
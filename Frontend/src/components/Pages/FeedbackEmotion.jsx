@@ -4,6 +4,7 @@ import { Chart as ChartJS, ArcElement, Tooltip, Legend } from "chart.js";
 import { Doughnut } from "react-chartjs-2";
 import "./FeedbackEmotion.css";
 import feedbackIcon from "./feedbackicon.png";
+import { API_BASE_URL, withJobId } from "./analysisJob";
 
 ChartJS.register(ArcElement, Tooltip, Legend);
 
@@ -60,7 +61,7 @@ function FeedbackEmotion() {
     setIsPopupOpen(true);
     setLoading(true);
     try {
-      const res = await fetch("http://localhost:8000/emotion/analysis-results?" + new Date().getTime());
+      const res = await fetch(withJobId(`${API_BASE_URL}/emotion/analysis-results?${new Date().getTime()}`));
       const data = await res.json();
       setAnalysisResult(data);
     } catch (error) {
@@ -4,6 +4,7 @@ import { Chart as ChartJS, ArcElement, Tooltip, Legend } from "chart.js";
 import { Doughnut } from "react-chartjs-2";
 import "./FeedbackSpeed.css";
 import feedbackIcon from "./feedbackicon.png";
+import { API_BASE_URL, withJobId } from "./analysisJob";
 
 ChartJS.register(ArcElement, Tooltip, Legend);
 
@@ -51,7 +52,7 @@ function FeedbackSpeed() {
     setIsPopupOpen(true);
     setLoadingResults(true);
     try {
-      const res = await fetch("http://localhost:8000/speed/analysis-results?" + new Date().getTime());
+      const res = await fetch(withJobId(`${API_BASE_URL}/speed/analysis-results?${new Date().getTime()}`));
       const data = await res.json();
       setAnalysisResults(data.results || []);
     } catch (error) {
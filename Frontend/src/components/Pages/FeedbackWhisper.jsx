@@ -1,9 +1,10 @@
-import React, { useState } from "react";
+import React, { useState, useRef, useEffect } from "react";
 import { useNavigate, useLocation } from "react-router-dom";
 import { Chart as ChartJS, ArcElement, Tooltip, Legend } from "chart.js";
 import { Doughnut } from "react-chartjs-2";
 import "./FeedbackWhisper.css";
 import feedbackIcon from "./feedbackicon.png";
+import { API_BASE_URL, fetchJob, isWhisperRunning, withJobId } from "./analysisJob";
 
 ChartJS.register(ArcElement, Tooltip, Legend);
 
@@ -13,6 +14,8 @@ function FeedbackWhisper() {
   const [isPopupOpen, setIsPopupOpen] = useState(false);
   const [analysisResults, setAnalysisResults] = useState(null);
   const [loadingResults, setLoadingResults] = useState(false);
+  const [isPartial, setIsPartial] = useState(false);
+  const eventSourceRef = useRef(null);
 
   // 도넛 차트 데이터 (예시)
   const data = {
@@ -38,18 +41,73 @@ function FeedbackWhisper() {
     },
   };
 
+  const closeStream = () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
+      eventSourceRef.current = null;
+    }
+  };
+
+  useEffect(() => closeStream, []);
+
+  // 분석이 아직 끝나지 않았으면 SSE로 앞부분의 부분 결과를 받아 표시하고, 최종 결과가 오면 교체
+  // 스트림은 result/error를 받거나 페이지를 떠날 때 닫힙니다.
+  const openStream = () => {
+    closeStream();
+    const source = new EventSource(withJobId(`${API_BASE_URL}/whisper/analysis-stream`));
+    eventSourceRef.current = source;
+    source.addEventListener("partial", (e) => {
+      setAnalysisResults(JSON.parse(e.data));
+      setIsPartial(true);
+      setLoadingResults(false);
+    });
+    source.addEventListener("result", (e) => {
+      setAnalysisResults(JSON.parse(e.data));
+      setIsPartial(false);
+      setLoadingResults(false);
+      closeStream();
+    });
+    source.addEventListener("error", () => {
+      setLoadingResults(false);
+      closeStream();
+    });
+  };
+
+  // 발음 분석이 진행 중이면 페이지에 들어오자마자 스트림을 열어 청크마다 부분 결과를 받아 둡니다.
+  useEffect(() => {
+    let cancelled = false;
+    fetchJob()
+      .then((job) => {
+        if (!cancelled && isWhisperRunning(job)) {
+          setLoadingResults(true);
+          openStream();
+        }
+      })
+      .catch((error) => console.error("작업 상태를 가져오는 중 오류 발생:", error));
+    return () => {
+      cancelled = true;
+    };
+  }, []);
+
   // "자세히 보기" 버튼 클릭 시 GET 요청 URL 수정: "/whisper/analysis-results"
   const openPopup = async () => {
     setIsPopupOpen(true);
+    // 스트림이 열려 있으면 지금까지 받은 부분 결과를 보여 주고, 이후 결과도 스트림이 채웁니다.
+    if (eventSourceRef.current) return;
     setLoadingResults(true);
     try {
-      const res = await fetch("http://localhost:8000/whisper/analysis-results");
+      const res = await fetch(withJobId(`${API_BASE_URL}/whisper/analysis-results`));
+      if (!res.ok) {
+        openStream();
+        return;
+      }
       const data = await res.json();
       setAnalysisResults(data);
+      setIsPartial(false);
+      setLoadingResults(false);
     } catch (error) {
       console.error("분석 결과를 가져오는 중 오류 발생:", error);
       setAnalysisResults(null);
-    } finally {
       setLoadingResults(false);
     }
   };
@@ -119,6 +177,13 @@ function FeedbackWhisper() {
               <p>분석 결과 로딩 중...</p>
             ) : analysisResults ? (
               <div className="results-list">
+                {isPartial && (
+                  <div className="result-box">
+                    <p>
+                      분석 중 : 스크립트 {analysisResults.aligned_tokens} / {analysisResults.total_tokens} 단어까지의 결과
+                    </p>
+                  </div>
+                )}
                 <div className="result-box">
                   <p>정확도 : {analysisResults.accuracy?.toFixed(2)}%</p>
                 </div>
@@ -1,6 +1,7 @@
 import React, { useRef, useState, useEffect } from "react";
 import { useNavigate, useLocation } from "react-router-dom";
 import "./RecordVideo.css";
+import { isFeedbackReady, waitForUploadedJob } from "./analysisJob";
 
 function RecordVideo() {
   const videoRef = useRef(null);
@@ -14,6 +15,7 @@ function RecordVideo() {
   const [stream, setStream] = useState(null);
   const [recording, setRecording] = useState(false);
   const [recordedChunks, setRecordedChunks] = useState([]);
+  const [progress, setProgress] = useState(null); // 분석 진행률 (0~1), 분석 중이 아니면 null
 
   const startWebcam = async () => {
     try {
@@ -81,16 +83,25 @@ function RecordVideo() {
         method: "POST",
         body: formData,
       });
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
       const data = await response.json();
       console.log("업로드 성공:", data);
 
       if (stream) {
         stream.getTracks().forEach((track) => track.stop());
       }
-      navigate("/feedback", { state: { analysisResults: data } });
+      // 업로드 응답(202)은 분석 시작만 의미하므로 감정/속도 분석이 끝나거나 발음 분석이 시작될 때까지 기다린 뒤 이동합니다.
+      // 발음 분석의 부분 결과는 FeedbackWhisper에서 스트림으로 받습니다.
+      setProgress(0);
+      const job = await waitForUploadedJob(data, setProgress, isFeedbackReady);
+      navigate("/feedback", { state: { analysisResults: job, jobId: job.job_id } });
     } catch (error) {
       console.error("업로드 실패:", error);
-      alert("업로드에 실패했습니다.");
+      alert("업로드 또는 분석에 실패했습니다.");
+    } finally {
+      setProgress(null);
     }
   };
 
@@ -124,7 +135,9 @@ function RecordVideo() {
         {!stream ? "카메라 켜기" : recording ? "녹화 중단" : "녹화 시작"}
       </button>
 
-      <button className="record-done-button" onClick={handleSaveRecording}>완료</button>
+      <button className="record-done-button" onClick={handleSaveRecording} disabled={progress !== null}>
+        {progress === null ? "완료" : `분석 중... ${Math.round(progress * 100)}%`}
+      </button>
     </div>
   );
 }
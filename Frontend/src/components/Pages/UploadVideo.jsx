@@ -1,6 +1,7 @@
 import React, { useState } from "react";
 import { useNavigate, useLocation } from "react-router-dom";
 import axios from "axios";
+import { isFeedbackReady, waitForUploadedJob } from "./analysisJob";
 import "./UploadVideo.css";
 
 function UploadVideo() {
@@ -9,6 +10,7 @@ function UploadVideo() {
   const [uploadedFiles, setUploadedFiles] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
+  const [progress, setProgress] = useState(null); // 분석 진행률 (0~1)
 
   const originalScript = location.state?.original_script || "";
 
@@ -22,6 +24,10 @@ function UploadVideo() {
       alert("업로드할 파일을 선택하세요.");
       return;
     }
+    if (uploadedFiles.length > 1) {
+      alert("영상은 한 번에 하나만 업로드할 수 있습니다.");
+      return;
+    }
     if (!originalScript.trim()) {
       alert("원본 스크립트가 없습니다.");
       return;
@@ -30,22 +36,25 @@ function UploadVideo() {
     setLoading(true);
     try {
       const videoFormData = new FormData();
-      uploadedFiles.forEach((file) => {
-        videoFormData.append("file", file);
-      });
+      videoFormData.append("file", uploadedFiles[0]);
       videoFormData.append("original_script", originalScript);
 
       const vodResponse = await axios.post("http://localhost:8000/vod/upload/", videoFormData, {
         headers: { "Content-Type": "multipart/form-data" },
       });
-      console.log("vod.py 처리 완료:", vodResponse.data);
+      console.log("vod.py 업로드 완료:", vodResponse.data);
 
-      navigate("/feedback", { state: { analysisResults: vodResponse.data } });
+      // 업로드 응답(202)은 분석 시작만 의미하므로 감정/속도 분석이 끝나거나 발음 분석이 시작될 때까지 기다린 뒤 이동합니다.
+      // 발음 분석의 부분 결과는 FeedbackWhisper에서 스트림으로 받습니다.
+      setProgress(0);
+      const job = await waitForUploadedJob(vodResponse.data, setProgress, isFeedbackReady);
+      navigate("/feedback", { state: { analysisResults: job, jobId: job.job_id } });
     } catch (err) {
       console.error("업로드 및 처리 실패:", err);
       setError("업로드 또는 처리에 실패했습니다.");
     } finally {
       setLoading(false);
+      setProgress(null);
     }
   };
 
@@ -88,13 +97,17 @@ function UploadVideo() {
               : "파일을 선택하여 업로드하세요."}
           </p>
         </div>
-        <input type="file" accept="video/*" multiple onChange={handleFileChange} hidden />
+        <input type="file" accept="video/*" onChange={handleFileChange} hidden />
       </label>
 
       {error && <p className="error-message" style={{ color: "red" }}>{error}</p>}
 
       <button className="upload-done-button" onClick={handleUpload} disabled={loading}>
-        {loading ? "처리 중..." : "업로드 및 분석 시작"}
+        {loading
+          ? progress === null
+            ? "업로드 중..."
+            : `분석 중... ${Math.round(progress * 100)}%`
+          : "업로드 및 분석 시작"}
       </button>
 
       <div className="video-record-section" onClick={() => navigate("/record")}>
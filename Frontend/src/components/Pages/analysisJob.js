@@ -0,0 +1,68 @@
+// 업로드한 영상의 분석 작업(job_id) 상태 확인과 작업별 결과 조회에 쓰는 함수들
+export const API_BASE_URL = "http://localhost:8000";
+
+const JOB_ID_KEY = "analysisJobId";
+const JOB_STATUS_URL_KEY = "analysisJobStatusUrl";
+const POLL_INTERVAL_MS = 2000;
+
+// 피드백 페이지들이 같은 작업의 결과와 상태를 보도록 현재 작업 ID와 상태 URL을 저장합니다.
+export const saveJobId = (jobId, statusUrl) => {
+  localStorage.setItem(JOB_ID_KEY, jobId);
+  if (statusUrl) localStorage.setItem(JOB_STATUS_URL_KEY, statusUrl);
+};
+
+export const getJobId = () => localStorage.getItem(JOB_ID_KEY);
+
+// 결과 조회 URL에 현재 작업의 job_id를 붙입니다.
+export const withJobId = (url, jobId = getJobId()) => {
+  if (!jobId) return url;
+  const separator = url.includes("?") ? "&" : "?";
+  return `${url}${separator}job_id=${encodeURIComponent(jobId)}`;
+};
+
+// 작업 상태를 한 번 조회합니다. statusUrl이 없으면 저장된 현재 작업의 상태 URL을 사용합니다.
+export const fetchJob = async (statusUrl = localStorage.getItem(JOB_STATUS_URL_KEY)) => {
+  if (!statusUrl) return null;
+  const response = await fetch(`${API_BASE_URL}${statusUrl}`, { cache: "no-store" });
+  if (!response.ok) {
+    throw new Error(`작업 상태 조회 실패: HTTP ${response.status}`);
+  }
+  return response.json();
+};
+
+const stageStatus = (job, stage) => job?.stages?.[stage]?.status;
+
+// 감정/속도 분석이 끝났거나 발음 분석이 시작되면 피드백 화면으로 넘어갑니다.
+// 발음 분석 결과는 FeedbackWhisper가 /whisper/analysis-stream으로 청크마다 받아 표시합니다.
+export const isFeedbackReady = (job) => {
+  if (job.status === "done") return true;
+  const finished = (stage) => ["done", "skipped"].includes(stageStatus(job, stage));
+  const whisper = stageStatus(job, "whisper");
+  return (finished("emotion") && finished("speed")) || (Boolean(whisper) && whisper !== "pending");
+};
+
+// 작업이 아직 진행 중이고 발음 분석이 시작 전이거나 실행 중인지 확인합니다.
+export const isWhisperRunning = (job) =>
+  Boolean(job) && !["done", "failed"].includes(job.status) && ["pending", "running"].includes(stageStatus(job, "whisper"));
+
+// 업로드 응답(202)의 status_url을 isReady(기본: 작업 완료)가 참이 될 때까지 확인합니다. onProgress에는 0~1 진행률을 넘깁니다.
+export const waitForJob = async (statusUrl, onProgress, isReady = (job) => job.status === "done") => {
+  while (true) {
+    const job = await fetchJob(statusUrl);
+    if (onProgress) onProgress(job.progress || 0);
+    if (job.status === "failed") {
+      throw new Error(job.error || "분석에 실패했습니다.");
+    }
+    if (isReady(job)) return job;
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+  }
+};
+
+// 업로드 응답을 확인하고 isReady가 참이 될 때까지 기다린 뒤 작업 정보를 반환합니다.
+export const waitForUploadedJob = async (upload, onProgress, isReady) => {
+  if (!upload.job_id || !upload.status_url) {
+    throw new Error("업로드 응답에 작업 ID가 없습니다.");
+  }
+  saveJobId(upload.job_id, upload.status_url);
+  return waitForJob(upload.status_url, onProgress, isReady);
+};